@@ -0,0 +1,232 @@
+"""
+    @author Ertl Marvin
+    @version 2016-12-30
+
+    Accounts of the server. The passwords are stored as scrypt hashes, scrypt needs much memory, so guessing the
+    passwords is expensive even with special hardware. Because one hash takes about 50 ms, the hashes are calculated in
+    a pool of processes and the result is given to a callback, so no thread of the server waits for it. After a login
+    the client gets a token, a reconnect with the token is checked in the Tokens without hashing.
+"""
+import collections
+import hashlib
+import hmac
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+
+def derive(password, salt, n, r, p):
+    """
+    Calculates the scrypt hash of the password, it runs in the processes of the pool
+    :param password: The password
+    :param salt: The random salt of the account
+    :param n: CPU and memory cost of scrypt
+    :param r: Block size of scrypt
+    :param p: Parallelization of scrypt
+    :return: The hash as bytes
+    """
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + 1024 * 1024, dklen=32)
+
+
+class Tokens(object):
+    """
+        @author Ertl Marvin
+        @version 2016-12-30
+
+        The tokens of the last logins, the least recently used token is forgotten first, if there are more than SIZE.
+        A token is valid for TTL seconds after the last use.
+
+            :ivar tokens:   OrderedDictionary with the token as key and [name, time of the last use] as value
+            :ivar lock:     Lock for the tokens
+    """
+
+    SIZE = 10000
+    TTL = 24 * 3600
+
+    def __init__(self):
+        """
+        Creates the empty cache
+        """
+        self.tokens = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def issue(self, name):
+        """
+        Creates a new token for the user
+        :param name: The name of the user
+        :return: The token
+        """
+        token = secrets.token_hex(16)
+        with self.lock:
+            self.tokens[token] = [name, time.monotonic()]
+            while len(self.tokens) > self.SIZE:
+                self.tokens.popitem(last=False)
+        return token
+
+    def check(self, token):
+        """
+        :param token: The token of the client
+        :return: The name of the user, None if the token is not valid
+        """
+        with self.lock:
+            entry = self.tokens.get(token)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[1] > self.TTL:
+                del self.tokens[token]
+                return None
+            entry[1] = time.monotonic()
+            self.tokens.move_to_end(token)
+            return entry[0]
+
+    def snapshot(self):
+        """
+        :return: List with token, name and time of the last use of every token, the least recently used first
+        """
+        with self.lock:
+            return [(token, name, used) for token, (name, used) in self.tokens.items()]
+
+    def restore(self, tokens, shift):
+        """
+        Adds the tokens of a snapshot
+        :param tokens: List with token, name and time of the last use, the least recently used first
+        :param shift: Seconds, which are added to the times, so they fit to time.monotonic of this process
+        :return: None
+        """
+        with self.lock:
+            for token, name, used in tokens:
+                self.tokens[token] = [name, used + shift]
+            while len(self.tokens) > self.SIZE:
+                self.tokens.popitem(last=False)
+
+
+class Authenticator(object):
+    """
+        @author Ertl Marvin
+        @version 2016-12-30
+
+        Checks the logins of the clients against the accounts in a sqlite database, with register a login with an
+        unknown name creates the account. The pool of processes is started with the first login, which needs a hash.
+
+            :ivar db:       The sqlite3 connection
+            :ivar register: If True a login with an unknown name creates the account
+            :ivar workers:  Number of the processes of the pool, None for the number of the cpus
+            :ivar pool:     ProcessPoolExecutor for the hashes, None till it is needed
+            :ivar tokens:   The Tokens of the last logins
+            :ivar lock:     Lock for the database and the pool
+    """
+
+    N = 2 ** 14
+    R = 8
+    P = 1
+
+    def __init__(self, path, register=True, workers=None):
+        """
+        Opens the database and creates the table, if it doesn't exist
+        :param path: Path of the database
+        :param register: If True a login with an unknown name creates the account
+        :param workers: Number of the processes of the pool, None for the number of the cpus
+        """
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS accounts (name TEXT PRIMARY KEY, salt BLOB, hash BLOB, n INTEGER, "
+                        "r INTEGER, p INTEGER)")
+        self.register = register
+        self.workers = workers
+        self.pool = None
+        self.tokens = Tokens()
+        self.lock = threading.Lock()
+
+    def submit(self, *args):
+        """
+        Calculates the hash in the pool, the processes are started with spawn, because fork copies the locks of the
+        threads of the server
+        :param args: The arguments of derive
+        :return: The concurrent.futures.Future of the hash
+        """
+        with self.lock:
+            if self.pool is None:
+                import concurrent.futures
+                import multiprocessing
+                self.pool = concurrent.futures.ProcessPoolExecutor(self.workers, multiprocessing.get_context("spawn"))
+            return self.pool.submit(derive, *args)
+
+    def login(self, message, done):
+        """
+        Checks the login message, done is called with the result, right away for a token, else when the hash is
+        calculated. done gets the name of the user, the new token and None, or None, None and the error, retry is True
+        if only the token was not valid, so the client can try it with the password.
+        :param message: The login message with name and password or token
+        :param done: Function with the parameters name, token, error and retry
+        :return: None
+        """
+        if message.get("token") is not None:
+            name = self.tokens.check(str(message["token"]))
+            if name is None:
+                return done(None, None, "Das Token ist abgelaufen", True)
+            return done(name, message["token"], None, False)
+        name = message.get("name")
+        password = message.get("password")
+        if not isinstance(name, str) or not isinstance(password, str) or not password:
+            return done(None, None, "Name und Passwort fehlen", False)
+        with self.lock:
+            row = self.db.execute("SELECT salt, hash, n, r, p FROM accounts WHERE name = ?", (name,)).fetchone()
+        if row is None and not self.register:
+            return done(None, None, "Name oder Passwort falsch", False)
+        if row is None:
+            salt = os.urandom(16)
+            future = self.submit(password, salt, self.N, self.R, self.P)
+            future.add_done_callback(lambda f: self.created(name, salt, f, done))
+        else:
+            salt, digest, n, r, p = row
+            future = self.submit(password, salt, n, r, p)
+            future.add_done_callback(lambda f: self.verified(name, digest, f, done))
+
+    def created(self, name, salt, future, done):
+        """
+        Stores the new account, when the hash is calculated
+        :param name: The name of the user
+        :param salt: The salt of the account
+        :param future: The Future of the hash
+        :param done: Function with the parameters name, token, error and retry
+        :return: None
+        """
+        try:
+            digest = future.result()
+        except Exception:
+            return done(None, None, "Die Anmeldung ist fehlgeschlagen", False)
+        with self.lock:
+            created = self.db.execute("INSERT OR IGNORE INTO accounts VALUES (?, ?, ?, ?, ?, ?)",
+                                      (name, salt, digest, self.N, self.R, self.P)).rowcount
+        if not created:
+            return done(None, None, "Der Name %s ist vergeben" % name, False)
+        done(name, self.tokens.issue(name), None, False)
+
+    def verified(self, name, expected, future, done):
+        """
+        Compares the hash with the hash of the account
+        :param name: The name of the user
+        :param expected: The hash of the account
+        :param future: The Future of the hash
+        :param done: Function with the parameters name, token, error and retry
+        :return: None
+        """
+        try:
+            digest = future.result()
+        except Exception:
+            return done(None, None, "Die Anmeldung ist fehlgeschlagen", False)
+        if not hmac.compare_digest(digest, expected):
+            return done(None, None, "Name oder Passwort falsch", False)
+        done(name, self.tokens.issue(name), None, False)
+
+    def close(self):
+        """
+        Stops the pool and closes the database
+        :return: None
+        """
+        with self.lock:
+            if self.pool is not None:
+                self.pool.shutdown(wait=True, cancel_futures=True)
+            self.db.close()
@@ -0,0 +1,486 @@
+"""
+    @author Ertl Marvin
+    @version 2016-12-15
+
+    Benchmarks for the chat server, every benchmark is a function bench_<name> and can be started with
+    python Benchmark.py <name> [options]
+"""
+import argparse
+import asyncio
+import os
+import queue
+import random
+import re
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import ChatClient
+import Plugins
+import Protocol
+import Render
+import Server
+import Snapshot
+
+
+def free_port():
+    """
+    :return: A tcp port, which is free at the moment
+    """
+    with socket.socket() as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+
+def start_server(**options):
+    """
+    Starts a headless server, which writes nothing to the standard output, the rate limit is so high that it doesn't
+    slow down the benchmark
+    :param options: Keywords for the Headless thread
+    :return: The Model of the started server
+    """
+    headless = Server.Headless(Server.IngressQueue(Server.Model.QUEUE_SIZE), port=free_port(), quiet=True, **options)
+    headless.model.limiter = Server.RateLimiter(msg_rate=10 ** 9, msg_burst=10 ** 9, byte_rate=10 ** 12,
+                                                byte_burst=10 ** 12)
+    headless.start()
+    while headless.model.serversocket is None:
+        time.sleep(0.01)
+    time.sleep(0.1)
+    return headless.model
+
+
+def stop_server(model):
+    """
+    Stops the server, which was started with start_server
+    :param model: The Model
+    :return: None
+    """
+    model.queue.put(False)
+    model.join()
+
+
+def make_certificate(directory):
+    """
+    Creates a self signed certificate for localhost with openssl
+    :param directory: The directory for the files
+    :return: Tuple with the path of the certificate and the key
+    """
+    cert = os.path.join(directory, "cert.pem")
+    key = os.path.join(directory, "key.pem")
+    subprocess.check_call(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                           "-subj", "/CN=localhost", "-addext", "subjectAltName=DNS:localhost",
+                           "-keyout", key, "-out", cert], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return cert, key
+
+
+def read_until(con, reader, kind, count):
+    """
+    Reads from the connection till count messages of the type kind are received
+    :param con: The connection
+    :param reader: The FrameReader of the connection
+    :param kind: Type of the messages
+    :param count: Number of the messages
+    :return: None
+    """
+    while count > 0:
+        data = con.recv(65536)
+        if not data:
+            raise ConnectionResetError
+        count -= sum(1 for m in reader.feed(data) if m.get("type") == kind)
+
+
+def produce_consume(q, producers, total, batch):
+    """
+    Starts the producer threads, which put total messages together into q and takes them out again in this thread
+    :param q: The queue which will be measured
+    :param producers: Number of producer threads
+    :param total: Number of messages of all producers together
+    :param batch: True if the consumer uses get_batch, else get
+    :return: Seconds till the consumer got all messages
+    """
+    per_producer = total // producers
+    start = threading.Event()
+
+    def producer():
+        start.wait()
+        put = q.put
+        for i in range(per_producer):
+            put(i)
+
+    threads = [threading.Thread(target=producer) for _ in range(producers)]
+    for t in threads:
+        t.start()
+    begin = time.perf_counter()
+    start.set()
+    received = 0
+    while received < per_producer * producers:
+        if batch:
+            received += len(q.get_batch())
+        else:
+            q.get()
+            received += 1
+    elapsed = time.perf_counter() - begin
+    for t in threads:
+        t.join()
+    return elapsed
+
+
+def bench_ingress(args):
+    """
+    Compares the queue.Queue with the Server.IngressQueue for 1, 8, 64 and 512 producers
+    :param args: The parsed command line arguments
+    :return: None
+    """
+    print("%9s %14s %14s %8s" % ("producers", "queue.Queue/s", "Ingress/s", "speedup"))
+    for producers in args.producers:
+        total = args.messages - args.messages % producers
+        old = produce_consume(queue.Queue(args.maxsize), producers, total, False)
+        new = produce_consume(Server.IngressQueue(args.maxsize), producers, total, True)
+        print("%9d %14.0f %14.0f %7.2fx" % (producers, total / old, total / new, old / new))
+
+
+def connect_once(port, context, session):
+    """
+    Connects to the server, sends the hello and one message and waits for the ack
+    :param port: Port of the server
+    :param context: ssl.SSLContext of the client or None
+    :param session: tls session to resume or None
+    :return: Tuple with the tls session and True if it was resumed
+    """
+    with socket.create_connection(("localhost", port)) as raw:
+        raw.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        con = raw
+        if context is not None:
+            con = context.wrap_socket(raw, server_hostname="localhost", session=session)
+        con.sendall(Protocol.encode({"type": "hello", "client": uuid.uuid4().hex}) +
+                    Protocol.encode({"type": "msg", "id": 1, "text": "x"}))
+        read_until(con, Protocol.FrameReader(), "ack", 1)
+        if context is None:
+            return None, False
+        result = con.session, con.session_reused
+        con.close()
+        return result
+
+
+def throughput(port, context, messages, size):
+    """
+    Sends messages to the server and waits till all of them came back as broadcast
+    :param port: Port of the server
+    :param context: ssl.SSLContext of the client or None
+    :param messages: Number of the messages
+    :param size: Size of one message
+    :return: Megabytes per second
+    """
+    text = "x" * size
+    with socket.create_connection(("localhost", port)) as con:
+        if context is not None:
+            con = context.wrap_socket(con, server_hostname="localhost")
+        begin = time.perf_counter()
+
+        def writer():
+            con.sendall(Protocol.encode({"type": "hello", "client": uuid.uuid4().hex}))
+            for i in range(messages):
+                con.sendall(Protocol.encode({"type": "msg", "id": i, "text": text}))
+
+        t = threading.Thread(target=writer)
+        t.start()
+        read_until(con, Protocol.FrameReader(), "msg", messages)
+        t.join()
+        return messages * size / (time.perf_counter() - begin) / 2 ** 20
+
+
+def bench_tls(args):
+    """
+    Compares plaintext and tls: connections per second with a full handshake and with session resumption, and the
+    throughput of one client
+    :param args: The parsed command line arguments
+    :return: None
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        cert, key = make_certificate(directory)
+        client = ssl.create_default_context(cafile=cert)
+        for name, context in (("plaintext", None), ("tls", Server.server_context(cert, key))):
+            model = start_server(ssl_context=context, workers=args.workers)
+            try:
+                client_context = client if context is not None else None
+                begin = time.perf_counter()
+                for _ in range(args.connections):
+                    connect_once(model.port, client_context, None)
+                full = args.connections / (time.perf_counter() - begin)
+                print("%-9s %8.0f connects/s (full handshake)" % (name, full))
+                if context is not None:
+                    session, reused = connect_once(model.port, client_context, None)
+                    resumed = 0
+                    begin = time.perf_counter()
+                    for _ in range(args.connections):
+                        session, reused = connect_once(model.port, client_context, session)
+                        resumed += reused
+                    rate = args.connections / (time.perf_counter() - begin)
+                    print("%-9s %8.0f connects/s (resumed %d of %d)" % (name, rate, resumed, args.connections))
+                print("%-9s %8.1f MiB/s with %d byte messages" %
+                      (name, throughput(model.port, client_context, args.messages, args.size), args.size))
+            finally:
+                stop_server(model)
+
+
+async def drive_load(args, port):
+    """
+    Connects the clients with the AsyncChatClient, lets the senders send their messages and waits till every client got
+    all messages
+    :param args: The parsed command line arguments
+    :param port: Port of the server
+    :return: None
+    """
+    expected = args.senders * args.messages
+    clients = [ChatClient.AsyncChatClient(args.host, port) for _ in range(args.clients)]
+    begin = time.perf_counter()
+    await asyncio.gather(*(c.connect() for c in clients))
+    connected = time.perf_counter() - begin
+    print("%d clients connected in %.2f s" % (args.clients, connected))
+
+    async def receive(client):
+        count = 0
+        async for message in client:
+            if message.get("type") == "msg":
+                count += 1
+                if count == expected:
+                    return
+
+    begin = time.perf_counter()
+    receivers = asyncio.gather(*(receive(c) for c in clients))
+    for i in range(args.messages):
+        await asyncio.gather(*(c.send("load %d" % i) for c in clients[:args.senders]))
+    await receivers
+    elapsed = time.perf_counter() - begin
+    print("%d messages delivered in %.2f s, %.0f deliveries/s" %
+          (expected * args.clients, elapsed, expected * args.clients / elapsed))
+    await asyncio.gather(*(c.close() for c in clients))
+
+
+def bench_load(args):
+    """
+    Load test with many clients from one process, if no port is given, a server will be started in this process
+    :param args: The parsed command line arguments
+    :return: None
+    """
+    model = None
+    port = args.port
+    if port is None:
+        model = start_server(workers=args.workers)
+        port = model.port
+    try:
+        asyncio.run(drive_load(args, port))
+    finally:
+        if model is not None:
+            stop_server(model)
+
+
+FIRST_ACK = """
+import ChatClient
+client = ChatClient.ChatClient(port=%d)
+client.start()
+client.send("startup")
+for message in client:
+    if message.get("type") in ("ack", "error", "closed"):
+        break
+"""
+
+
+def import_time(module):
+    """
+    Imports the module in a new interpreter with -X importtime
+    :param module: Name of the module
+    :return: Cumulative import time of the module in milliseconds
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module],
+                            stderr=subprocess.PIPE, universal_newlines=True, cwd=os.path.dirname(__file__) or ".")
+    for line in reversed(result.stderr.splitlines()):
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1]) / 1000
+    raise RuntimeError(result.stderr)
+
+
+def bench_startup(args):
+    """
+    Measures the import time of the modules without gui, how long the headless server needs till it accepts the first
+    connection and how long a new process with the ChatClient needs till the server sent the ack of its first message
+    :param args: The parsed command line arguments
+    :return: None
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for module in ("Protocol", "ChatClient", "Client", "Server"):
+        print("import %-10s %7.1f ms" % (module, min(import_time(module) for _ in range(args.runs))))
+    port = free_port()
+    begin = time.perf_counter()
+    server = subprocess.Popen([sys.executable, os.path.join(directory, "Server.py"), "--headless", "--port", str(port)],
+                              stdout=subprocess.DEVNULL, cwd=directory)
+    try:
+        while True:
+            try:
+                socket.create_connection(("localhost", port)).close()
+                break
+            except ConnectionRefusedError:
+                time.sleep(0.001)
+        print("server first connection %7.1f ms" % ((time.perf_counter() - begin) * 1000))
+        runs = []
+        for _ in range(args.runs):
+            begin = time.perf_counter()
+            subprocess.check_call([sys.executable, "-c", FIRST_ACK % port], cwd=directory)
+            runs.append((time.perf_counter() - begin) * 1000)
+        print("client first ack        %7.1f ms (target 100 ms)" % min(runs))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def bench_filter(args):
+    """
+    Measures how long the WordFilter needs for one message with many rules, against one regular expression, which
+    lists all words one after another
+    :param args: The parsed command line arguments
+    :return: None
+    """
+    rng = random.Random(42)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = {"".join(rng.choice(letters) for _ in range(rng.randint(4, 10))) for _ in range(args.rules)}
+    texts = [" ".join("".join(rng.choice(letters) for _ in range(rng.randint(2, 9))) for _ in range(args.words))
+             for _ in range(args.messages)]
+    begin = time.perf_counter()
+    word_filter = Plugins.WordFilter(words)
+    print("compile trie     %9.1f ms" % ((time.perf_counter() - begin) * 1000))
+    begin = time.perf_counter()
+    plain = re.compile(r"(?<!\w)(?:" + "|".join(map(re.escape, words)) + r")(?!\w)", re.IGNORECASE)
+    print("compile plain    %9.1f ms" % ((time.perf_counter() - begin) * 1000))
+    begin = time.perf_counter()
+    for text in texts:
+        word_filter.process(None, {"text": text})
+    print("trie  %d rules   %9.1f us per message" % (len(words), (time.perf_counter() - begin) / len(texts) * 10 ** 6))
+    begin = time.perf_counter()
+    for text in texts:
+        plain.subn(lambda match: "*" * len(match.group()), text)
+    print("plain %d rules   %9.1f us per message" % (len(words), (time.perf_counter() - begin) / len(texts) * 10 ** 6))
+
+
+def bench_render(args):
+    """
+    Measures how long the Renderer needs to format a message the first time and when it is shown again from the cache
+    :param args: The parsed command line arguments
+    :return: None
+    """
+    rng = random.Random(42)
+    words = ["hallo", "welt", ":)", "<3", "https://example.com/a?b=1&c=2", "test", "a<b", ":thumbsup:", "chat"]
+    messages = [("Client %d" % rng.randint(1, 50), " ".join(rng.choice(words) for _ in range(args.words)), ("seq", i))
+                for i in range(args.messages)]
+    renderer = Render.Renderer()
+    renderer.SIZE = args.messages
+    for label in ("format", "cached"):
+        begin = time.perf_counter()
+        for sender, text, key in messages:
+            renderer.line(sender, text, key=key)
+        print("%-8s %9.1f us per message" % (label, (time.perf_counter() - begin) / len(messages) * 10 ** 6))
+    print("hits     %9d" % renderer.hits)
+
+
+def bench_snapshot(args):
+    """
+    Measures the snapshot of a server with the state of many clients: how long the state is copied, which is the pause
+    of the other threads, how long it is written and restored, and the longest wait of a thread, which receives
+    messages at the same time, with and without snapshots
+    :param args: The parsed command line arguments
+    :return: None
+    """
+    import Auth
+    model = Server.Model(None, None)
+    model.login = Server.Login(model, Auth.Authenticator(":memory:"))
+    model.count = args.clients
+    for client in range(args.clients):
+        for msg_id in range(args.messages):
+            model.dedup.seen((uuid.UUID(int=client).hex, msg_id))
+        model.login.auth.tokens.issue("user%d" % client)
+    for room in range(args.rooms):
+        for _ in range(Server.Rooms.HISTORY):
+            model.rooms.handle({"type": "room", "op": "msg", "room": "room%d" % room, "from": "user%d" % room,
+                                "text": "x" * 40})
+    path = os.path.join(tempfile.mkdtemp(), "state.snap")
+    snapshotter = Snapshot.Snapshotter(model, path)
+
+    def receive(stop, waits):
+        key = 0
+        while not stop.is_set():
+            begin = time.perf_counter()
+            model.dedup.seen(("bench", key))
+            waits.append(time.perf_counter() - begin)
+            key += 1
+            time.sleep(0.0001)
+
+    for label, snapshots in (("without", 0), ("with", args.runs)):
+        stop = threading.Event()
+        waits = []
+        thread = threading.Thread(target=receive, args=(stop, waits))
+        thread.start()
+        stats = [snapshotter.save() for _ in range(snapshots)]
+        time.sleep(0.2 if not snapshots else 0)
+        stop.set()
+        thread.join()
+        print("%-8s snapshots: longest wait of the receiver %7.2f ms, %d calls" % (label, max(waits) * 1000,
+                                                                                     len(waits)))
+    print("clients %d, dedup ids %d, tokens %d, rooms %d" % (args.clients, len(model.dedup),
+                                                             len(model.login.auth.tokens.tokens), args.rooms))
+    print("pause   %7.2f ms (copy of the state, best of %d)" % (min(s["pause_ms"] for s in stats), args.runs))
+    print("total   %7.2f ms (copy, pickle, zlib, write)" % min(s["total_ms"] for s in stats))
+    print("size    %7.1f KiB" % (stats[-1]["size"] / 1024))
+    restored = Server.Model(None, None)
+    restored.login = Server.Login(restored, Auth.Authenticator(":memory:"))
+    begin = time.perf_counter()
+    restored.restore(Snapshot.load(path))
+    print("restore %7.2f ms" % ((time.perf_counter() - begin) * 1000))
+
+
+def main():
+    """
+    Parses the command line and starts the chosen benchmark
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description="Benchmarks for the chat server")
+    sub = parser.add_subparsers(dest="bench")
+    sub.required = True
+    ingress = sub.add_parser("ingress", help="queue.Queue against IngressQueue")
+    ingress.add_argument("--producers", type=int, nargs="+", default=[1, 8, 64, 512])
+    ingress.add_argument("--messages", type=int, default=200000)
+    ingress.add_argument("--maxsize", type=int, default=Server.Model.QUEUE_SIZE)
+    tls = sub.add_parser("tls", help="handshake rate and throughput of tls against plaintext")
+    tls.add_argument("--connections", type=int, default=200)
+    tls.add_argument("--messages", type=int, default=20000)
+    tls.add_argument("--size", type=int, default=512)
+    tls.add_argument("--workers", type=int, default=0)
+    load = sub.add_parser("load", help="many clients of the AsyncChatClient in one process")
+    load.add_argument("--clients", type=int, default=1000)
+    load.add_argument("--senders", type=int, default=10)
+    load.add_argument("--messages", type=int, default=10)
+    load.add_argument("--host", default="localhost")
+    load.add_argument("--port", type=int, help="port of a running server, else a server will be started")
+    load.add_argument("--workers", type=int, default=8)
+    startup = sub.add_parser("startup", help="import times and time to the first connection")
+    startup.add_argument("--runs", type=int, default=5)
+    word_filter = sub.add_parser("filter", help="time of the WordFilter with many rules")
+    word_filter.add_argument("--rules", type=int, default=10000)
+    word_filter.add_argument("--words", type=int, default=12)
+    word_filter.add_argument("--messages", type=int, default=2000)
+    render = sub.add_parser("render", help="time of the Renderer of the gui with and without cache")
+    render.add_argument("--messages", type=int, default=5000)
+    render.add_argument("--words", type=int, default=12)
+    snapshot = sub.add_parser("snapshot", help="pause and time of the snapshots of the server state")
+    snapshot.add_argument("--clients", type=int, default=10000)
+    snapshot.add_argument("--messages", type=int, default=5, help="ids of messages per client in the DedupCache")
+    snapshot.add_argument("--rooms", type=int, default=1000)
+    snapshot.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    globals()["bench_" + args.bench](args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,954 @@
+"""
+    @author Ertl Marvin
+    @version 2016-12-19
+
+    Client library for the simple chat without the gui, so it can be used by bots, tests and load tools. There is a
+    blocking ChatClient, which uses two threads for one connection, and an AsyncChatClient for asyncio, with which one
+    process can keep thousands of connections. Both get every message of the server as dictionary, see Protocol,
+    either through a callback or by iterating over the client. Besides the messages of the server there are the events
+
+        error       text: the client gave up to connect and stops
+        download    from: name of the sender, name: name of the file, path: where the received file was saved
+        closed      the client is stopped, it is always the last event
+
+    The chunks of the received files are not given as messages, they are written to the file in directory.
+"""
+from abc import ABCMeta, abstractmethod
+import collections
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+import Protocol
+import Trace
+
+
+class Stoppable(metaclass=ABCMeta):
+    """
+        @author Ertl Marvin
+        @version 2016-12-02
+
+        This class inherits from the metaclass ABCMeta, abstract base class, it offers a method stopping, which need to
+        be overwritten
+    """
+
+    @abstractmethod
+    def stopping(self):
+        """
+        Abstract method, must be overwritten, will be called, when the thread need to be stopped
+        :return: None
+        """
+        pass
+
+
+class BaseClient(object):
+    """
+        @author Ertl Marvin
+        @version 2016-12-19
+
+        The part of the client, which is the same for the blocking and the async client. Every message gets a number
+        and stays in pending till the server sent the ack for it, after a reconnect all pending messages will be sent
+        again and the server only sends them once to the other clients.
+
+            :ivar host:         The ip on which the client connect to the server
+            :ivar port:         The port on which the client connect to the server
+            :ivar ssl_context:  The ssl.SSLContext for tls, None for plaintext
+            :ivar client:       Id of the client, which stays the same after a reconnect
+            :ivar next_id:      Number of the last message
+            :ivar pending:      OrderedDictionary with the messages, for which the server didn't send an ack yet
+            :ivar sent:         Number of the last message, which was written to the connection
+            :ivar echoes:       Dictionary with the room as key, None for the lobby, and a deque with the numbers of
+                                the own messages, which the server will send back, so they can be matched with the msg
+            :ivar name:         The own name on the server, from the last ack
+            :ivar retries:      How often the client tries to connect again, before it gives up
+            :ivar roster:       Dictionary with the names and the status of the connected clients
+            :ivar state:        The own status, online or away, which will be sent again after a reconnect
+            :ivar writing:      Set with the names of the clients, which are typing at the moment
+            :ivar typed:        True if the own typing event, which was sent last, was True
+            :ivar uploads:      OrderedDictionary with the number of the file as key and [file, name, size, sent bytes,
+                                bytes the server has got] as value, for the files which are sent at the moment
+            :ivar next_file:    Number of the last sent file
+            :ivar downloads:    Dictionary with the number of the file as key and [file, path, missing bytes,
+                                file message] as value, for the files which are received at the moment
+            :ivar directory:    Directory for the received files
+            :ivar rooms:        Set of the rooms, which the client joined
+            :ivar nick:         The name, which the client chose with /nick, None for the name of the server
+            :ivar user:         The name of the account, None if the server has no accounts
+            :ivar password:     The password of the account
+            :ivar token:        The token of the last login, a reconnect logs in with it instead of the password
+            :ivar history:      History.History, in which the received messages are kept, None for no history
+            :ivar tracer:       Trace.Tracer, which traces a sample of the messages, None for no tracing
+            :ivar render:       True if the gui adds the render stamp and records the traces, else they are recorded
+                                when they are received
+    """
+
+    RETRY_DELAY = 0.5
+    OUTBOX = 256
+    CHUNK_SIZE = 65536
+    WINDOW = 1024 * 1024
+    CONNECT_ERROR = "Es konnte keine Verbindung mit den Server hergestellt werden."
+    LOST_ERROR = "Verbindung zum Server verloren."
+
+    def __init__(self, host="localhost", port=4242, ssl_context=None, client=None, retries=5):
+        """
+        Set the attributes
+        :param host: The ip of the server
+        :param port: The port of the server
+        :param ssl_context: The ssl.SSLContext for tls, None for plaintext
+        :param client: Id of the client, None for a random id
+        :param retries: How often the client tries to connect again
+        """
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context
+        self.client = client if client is not None else uuid.uuid4().hex
+        self.next_id = 0
+        self.pending = collections.OrderedDict()
+        self.sent = 0
+        self.echoes = {}
+        self.name = None
+        self.retries = retries
+        self.roster = {}
+        self.state = "online"
+        self.writing = set()
+        self.typed = False
+        self.uploads = collections.OrderedDict()
+        self.next_file = 0
+        self.downloads = {}
+        self.directory = "."
+        self.rooms = set()
+        self.nick = None
+        self.user = None
+        self.password = None
+        self.token = None
+        self.history = None
+        self.tracer = None
+        self.render = False
+
+    def hello(self):
+        """
+        :return: The encoded hello frame with the id of the client and the login frame, if there is a user
+        """
+        frame = Protocol.encode({"type": "hello", "client": self.client})
+        if self.user is not None:
+            frame += self.login_frame()
+        return frame
+
+    def login_frame(self):
+        """
+        :return: The encoded login frame with the token of the last login, or with name and password if there is none
+        """
+        if self.token is not None:
+            return Protocol.encode({"type": "login", "token": self.token})
+        return Protocol.encode({"type": "login", "name": self.user, "password": self.password})
+
+    def relogin(self, message):
+        """
+        :param message: The login message of the server, which says that the login failed
+        :return: The encoded login frame with the password, if the server allows to try it again, else None
+        """
+        if message.get("retry") and self.user is not None and self.password:
+            return self.login_frame()
+        return None
+
+    @staticmethod
+    def chat(text):
+        """
+        :param text: The message
+        :return: True if the text is a message for the other clients, False if it is a command, which starts with /
+        """
+        return not text.startswith("/") or text.startswith("//")
+
+    def full(self):
+        """
+        :return: True if OUTBOX messages wait for their ack, then no more messages should be taken
+        """
+        return len(self.pending) >= self.OUTBOX
+
+    def post(self, text, room=None):
+        """
+        Gives the message the next number and puts it into pending, a message for the other clients will be matched
+        with the msg, which the server sends back
+        :param text: The message
+        :param room: The room of the message, None for the lobby
+        :return: Tuple with the number and the encoded frame
+        """
+        self.next_id += 1
+        self.pending[self.next_id] = (text, room)
+        if self.chat(text):
+            self.echoes.setdefault(room, collections.deque()).append(self.next_id)
+        trace = self.tracer.sample() if self.tracer is not None else None
+        return self.next_id, self.frame(self.next_id, text, room, trace)
+
+    def frame(self, msg_id, text, room=None, trace=None):
+        """
+        :param msg_id: The number of the message
+        :param text: The message
+        :param room: The room of the message, None for the lobby
+        :param trace: The trace of the message, None if it is not traced
+        :return: The encoded frame of the message
+        """
+        message = {"type": "msg", "id": msg_id, "text": text}
+        if room is not None:
+            message["room"] = room
+        if trace is not None:
+            message["trace"] = trace
+        return Protocol.encode(message)
+
+    def room_frame(self, kind, room):
+        """
+        Adds the room to rooms or removes it
+        :param kind: join or leave
+        :param room: The name of the room
+        :return: The encoded join or leave frame
+        """
+        if kind == "join":
+            self.rooms.add(room)
+            return self.join_frame(room)
+        self.rooms.discard(room)
+        return Protocol.encode({"type": kind, "room": room})
+
+    def join_frame(self, room):
+        """
+        :param room: The name of the room
+        :return: The encoded join frame, with the seq of the last message in the history, so the server only sends the
+                 newer messages
+        """
+        message = {"type": "join", "room": room}
+        since = self.history.last(room) if self.history is not None else None
+        if since is not None:
+            message["since"] = since
+        return Protocol.encode(message)
+
+    def status_frame(self, status):
+        """
+        Sets the own status
+        :param status: online or away
+        :return: The encoded status frame
+        """
+        self.state = status
+        return Protocol.encode({"type": "status", "status": status})
+
+    def typing_frame(self, typing):
+        """
+        Remembers if the user is typing, the event will only be sent if it changed
+        :param typing: True if the user is typing
+        :return: The encoded typing frame, or empty bytes if it didn't change
+        """
+        typing = bool(typing)
+        if typing == self.typed:
+            return b""
+        self.typed = typing
+        return Protocol.encode({"type": "typing", "typing": typing})
+
+    def upload(self, file, name, size):
+        """
+        Starts to send a file, the chunks are taken with next_chunk
+        :param file: The file, opened for reading bytes
+        :param name: Name of the file
+        :param size: Number of bytes of the file
+        :return: The encoded file frame
+        """
+        self.next_file += 1
+        self.uploads[self.next_file] = [file, name, size, 0, 0]
+        return self.announce(self.next_file)
+
+    def announce(self, file_id):
+        """
+        :param file_id: Number of the file
+        :return: The encoded file frame of the file
+        """
+        file, name, size = self.uploads[file_id][:3]
+        return Protocol.encode({"type": "file", "id": file_id, "name": name, "size": size})
+
+    def sendable(self):
+        """
+        :return: True if a file has bytes, which can be sent, because the server has got the bytes before them
+        """
+        return any(sent < size and sent - got < self.WINDOW for file, name, size, sent, got in
+                   list(self.uploads.values()))
+
+    def next_chunk(self):
+        """
+        Reads the next chunk of the files one after the other, a file will only be sent on, if the server has got all
+        but WINDOW bytes of it, so a file can't fill the memory of the server and chat messages can go in between
+        :return: The encoded CHUNK frame, or empty bytes if nothing can be sent at the moment
+        """
+        for file_id, upload in list(self.uploads.items()):
+            file, name, size, sent, got = upload
+            if sent < size and sent - got < self.WINDOW:
+                data = file.read(min(self.CHUNK_SIZE, size - sent))
+                if not data:
+                    data = bytes(size - sent)
+                upload[3] += len(data)
+                self.uploads.move_to_end(file_id)
+                return Protocol.encode_chunk(file_id, data)
+        return b""
+
+    def download(self, message):
+        """
+        Opens the file for a file, which the server announced, in directory, a file with the same name will not be
+        overwritten
+        :param message: The file message of the server
+        :return: None
+        """
+        name = os.path.basename(str(message.get("name")).replace("\\", "/")) or "Datei"
+        root, ext = os.path.splitext(name)
+        path = os.path.join(self.directory, name)
+        number = 1
+        while os.path.exists(path):
+            path = os.path.join(self.directory, "%s (%d)%s" % (root, number, ext))
+            number += 1
+        self.downloads[message.get("file")] = [open(path, "wb"), path, message.get("size", 0), message]
+
+    def received_chunk(self, file_id, data):
+        """
+        Writes the chunk to the received file
+        :param file_id: Number of the file
+        :param data: The bytes of the file
+        :return: The download event, if the file is complete, else None
+        """
+        download = self.downloads.get(file_id)
+        if download is None:
+            return None
+        file, path, missing, message = download
+        file.write(data)
+        download[2] -= len(data)
+        if download[2] > 0:
+            return None
+        file.close()
+        del self.downloads[file_id]
+        return {"type": "download", "from": message.get("from"), "name": message.get("name"), "path": path}
+
+    def resend(self):
+        """
+        The files, which were received, are thrown away and the files, which were sent, will be sent again from the
+        beginning, because the server forgot them with the old connection
+        :return: The encoded join frames of the rooms, the nick, the frames of all messages, for which the server
+                 didn't send an ack, the file frames and the status if the client is away
+        """
+        for file, path, missing, message in list(self.downloads.values()):
+            file.close()
+            os.remove(path)
+        self.downloads.clear()
+        frames = b"".join(self.join_frame(room) for room in list(self.rooms))
+        if self.nick is not None:
+            frames += Protocol.encode({"type": "msg", "text": "/nick " + self.nick})
+        pending = list(self.pending.items())
+        frames += b"".join(self.frame(msg_id, text, room) for msg_id, (text, room) in pending)
+        if pending:
+            self.sent = max(self.sent, pending[-1][0])
+        for file_id, upload in list(self.uploads.items()):
+            upload[0].seek(0)
+            upload[3] = upload[4] = 0
+            frames += self.announce(file_id)
+        if self.state != "online":
+            frames += Protocol.encode({"type": "status", "status": self.state})
+        return frames
+
+    def handle(self, message):
+        """
+        Handles a message of the server, if it is an ack the message will be removed from pending, a roster replaces
+        the roster and a presence changes it, a typing event changes writing. A credit says how many bytes of a file
+        the server has got, a file starts a download and a chunk is written to it. A traced msg gets the stamp
+        client_recv, an own msg has the id of the message and gets it as echo. A msg and the new messages of a history
+        are appended to the history. The reply of /join or /nick changes rooms or
+        nick, so they stay after a reconnect. After a login
+        the token is kept for the next reconnect, a token, which is not valid anymore, is thrown away.
+        :param message: The received message
+        :return: The message, which should be given to the user, or None
+        """
+        kind = message.get("type")
+        if kind == "chunk":
+            return self.received_chunk(message["file"], message["data"])
+        elif kind == "file":
+            self.download(message)
+            if message.get("size") == 0:
+                return self.received_chunk(message.get("file"), b"")
+        elif kind == "credit":
+            upload = self.uploads.get(message.get("file"))
+            if upload is not None:
+                upload[4] = message.get("size")
+                if upload[4] >= upload[2]:
+                    upload[0].close()
+                    del self.uploads[message.get("file")]
+        elif kind == "msg":
+            if self.tracer is not None and isinstance(message.get("trace"), dict):
+                Trace.stamp(message["trace"], "client_recv")
+                if not self.render:
+                    self.tracer.record(message["trace"])
+            if message.get("id") is not None and "to" not in message:
+                waiting = self.echoes.get(message.get("room"))
+                if waiting and message["id"] in waiting:
+                    waiting.remove(message["id"])
+                message["echo"] = message["id"]
+            if self.history is not None and "to" not in message:
+                self.history.append(message.get("room"), [message], message.get("seq"))
+        elif kind == "history":
+            if self.history is not None and isinstance(message.get("room"), str):
+                self.history.received(message["room"], message.get("messages", []), message.get("seq", 0))
+        elif kind == "ack":
+            entry = self.pending.pop(message.get("id"), None)
+            self.name = message.get("from", self.name)
+            if entry is not None and message.get("echo") is False:
+                waiting = self.echoes.get(entry[1])
+                if waiting and message.get("id") in waiting:
+                    waiting.remove(message.get("id"))
+        elif kind == "reply":
+            if message.get("command") == "join" and "room" in message:
+                self.rooms.add(message["room"])
+            elif message.get("command") == "nick" and "name" in message:
+                self.nick = message["name"]
+        elif kind == "login":
+            if message.get("ok"):
+                self.user = message.get("name", self.user)
+                self.token = message.get("token")
+            else:
+                self.token = None
+        elif kind == "roster":
+            self.roster = dict(message.get("clients", {}))
+        elif kind == "presence":
+            for name, status in message.get("clients", {}).items():
+                if status is None:
+                    self.roster.pop(name, None)
+                    self.writing.discard(name)
+                else:
+                    self.roster[name] = status
+        elif kind == "typing":
+            if message.get("typing"):
+                self.writing.add(message.get("from"))
+            else:
+                self.writing.discard(message.get("from"))
+        return message
+
+
+class ChatClient(threading.Thread, Stoppable, BaseClient):
+    """
+        @author Ertl Marvin
+        @version 2016-12-19
+
+        This class inherits from threading.Thread, Stoppable and BaseClient, it is the blocking client. The thread
+        connects to the server and sends the messages of the queue, a Recv thread receives the messages of the
+        server. If the connection is lost, the thread connects again. If a callback is given every message will be
+        given to it, it will be called from the threads of the client, else the messages can be taken by iterating over
+        the client.
+
+            :ivar queue:    The queue from which the run method will get the message for sending, a tuple with
+                            the number and the frame of a message, an already encoded frame or a file
+            :ivar events:   Queue for the received messages, if there is no callback
+            :ivar callback: Function which will be called with every received message, or None
+            :ivar con:      Connection to the server
+            :ivar recv:     The Recv thread of the current connection
+            :ivar running:  Running says, if the run method is running or not
+            :ivar session:  The tls session of the last connection, so a reconnect doesn't need a full handshake
+    """
+
+    def __init__(self, host="localhost", port=4242, ssl_context=None, callback=None, client=None, retries=5):
+        """
+        Initial the base classes and set the attributes
+        :param host: The ip of the server
+        :param port: The port of the server
+        :param ssl_context: The ssl.SSLContext for tls, None for plaintext
+        :param callback: Function, which will be called with every received message, None to iterate over the client
+        :param client: Id of the client, None for a random id
+        :param retries: How often the client tries to connect again
+        """
+        threading.Thread.__init__(self, daemon=True)
+        BaseClient.__init__(self, host, port, ssl_context, client, retries)
+        self.queue = queue.Queue()
+        self.events = queue.Queue()
+        self.callback = callback
+        self.con = None
+        self.recv = None
+        self.running = True
+        self.session = None
+
+    def send(self, text, room=None):
+        """
+        Gives the message its number and puts it into the queue, the thread will send it, so this method never waits
+        for the network. If OUTBOX messages wait for their ack, the message is not taken, so the caller can show that
+        the connection is too slow.
+        :param text: The message
+        :param room: The room of the message, None for the lobby
+        :return: The number of the message, None if the outbox is full
+        """
+        if self.full():
+            return None
+        self.typed = False
+        msg_id, frame = self.post(text, room)
+        self.queue.put((msg_id, frame))
+        return msg_id
+
+    def send_file(self, path):
+        """
+        Opens the file and puts it into the queue, the thread will send it in chunks between the messages
+        :param path: Path of the file
+        :return: None
+        """
+        self.queue.put(open(path, "rb"))
+
+    def join_room(self, room):
+        """
+        Joins the room, the server sends the last messages of the room as history
+        :param room: The name of the room
+        :return: None
+        """
+        self.queue.put(self.room_frame("join", room))
+
+    def leave_room(self, room):
+        """
+        Leaves the room
+        :param room: The name of the room
+        :return: None
+        """
+        self.queue.put(self.room_frame("leave", room))
+
+    def status(self, status):
+        """
+        Sends the own status to the server, the other clients see it in their roster
+        :param status: online or away
+        :return: None
+        """
+        self.queue.put(self.status_frame(status))
+
+    def typing(self, typing):
+        """
+        Tells the other clients if the user is typing, only a change will be sent, the server doesn't send an ack
+        :param typing: True if the user is typing
+        :return: None
+        """
+        frame = self.typing_frame(typing)
+        if frame:
+            self.queue.put(frame)
+
+    def run(self):
+        """
+        The method will connect to the server and then run in a loop for sending the messages to the server, it will
+        also start a Recv thread for receiving the messages from the server. While there are bytes of a file, which
+        can be sent, it sends one chunk whenever the queue is empty. If the connection is lost, the method
+        connects again and sends all messages again, for which the server didn't send an ack, a message of the queue,
+        which was already sent again, is skipped. If it can't connect
+        after retries attempts, the error event will be given and the client stops.
+        :return: None
+        """
+        attempts = 0
+        connected = False
+        while self.running:
+            try:
+                self.connect()
+                connected = True
+                attempts = 0
+                self.con.sendall(self.resend())
+                while self.running:
+                    try:
+                        text = self.queue.get(block=not self.sendable())
+                    except queue.Empty:
+                        self.con.sendall(self.next_chunk())
+                        continue
+                    if text is False:
+                        self.running = False
+                    elif text is None:
+                        raise ConnectionResetError
+                    elif isinstance(text, bytes):
+                        self.con.sendall(text)
+                    elif isinstance(text, tuple):
+                        if text[0] > self.sent:
+                            self.con.sendall(text[1])
+                            self.sent = text[0]
+                    else:
+                        self.con.sendall(self.upload(text, os.path.basename(text.name),
+                                                     os.fstat(text.fileno()).st_size))
+            except socket.error as serr:
+                if not self.running:
+                    break
+                attempts += 1
+                if attempts > self.retries:
+                    self.deliver({"type": "error", "text": self.LOST_ERROR if connected else self.CONNECT_ERROR})
+                    self.stopping()
+                    break
+                time.sleep(self.RETRY_DELAY * attempts)
+        self.deliver({"type": "closed"})
+
+    def flush(self, timeout=None):
+        """
+        Waits till all messages and files are sent and the server sent the ack for them
+        :param timeout: Seconds to wait at most, None for no limit
+        :return: True if all messages got an ack, else False
+        """
+        end = None if timeout is None else time.monotonic() + timeout
+        while self.running and (self.pending or self.uploads or not self.queue.empty()):
+            if end is not None and time.monotonic() >= end:
+                return False
+            time.sleep(0.01)
+        return not self.pending
+
+    def connect(self):
+        """
+        Closes the old connection, connects to the server, starts a new Recv thread and sends the hello with the id of
+        the client. With tls the session of the old connection will be resumed.
+        :return: None
+        """
+        if self.recv is not None:
+            self.recv.running = False
+        if self.con is not None:
+            if getattr(self.con, "session", None) is not None:
+                self.session = self.con.session
+            self.con.close()
+        self.con = socket.create_connection((self.host, self.port))
+        self.con.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.ssl_context is not None:
+            self.con = self.ssl_context.wrap_socket(self.con, server_hostname=self.host, session=self.session)
+        self.recv = Recv(self.con, self)
+        self.recv.start()
+        self.con.sendall(self.hello())
+
+    def deliver(self, message):
+        """
+        Gives the message to the callback or puts it into the events queue
+        :param message: The message
+        :return: None
+        """
+        if self.callback is not None:
+            self.callback(message)
+        else:
+            self.events.put(message)
+
+    def received(self, message):
+        """
+        Will be called by the Recv thread with every message of the server, after a credit the run method will be
+        woken up, so it sends the next chunks of the file. If the login failed, the client logs in with the password
+        or, if that is not possible, gives the error event and stops.
+        :param message: The received message
+        :return: None
+        """
+        if message.get("type") == "credit":
+            self.queue.put(b"")
+        message = self.handle(message)
+        if message is not None and message.get("type") == "login" and not message.get("ok"):
+            frame = self.relogin(message)
+            if frame is not None:
+                return self.queue.put(frame)
+            self.deliver({"type": "error", "text": message.get("error")})
+            return self.stopping()
+        if message is not None:
+            self.deliver(message)
+
+    def lost(self):
+        """
+        Will be called by the Recv thread, if the connection is lost, puts None into the queue so the run method
+        connects again
+        :return: None
+        """
+        self.queue.put(None)
+
+    def __iter__(self):
+        """
+        Iterates over the received messages till the client is stopped, only if there is no callback
+        :return: Generator of the messages
+        """
+        while True:
+            message = self.events.get()
+            yield message
+            if message.get("type") == "closed":
+                return
+
+    def stopping(self):
+        """
+        The method will set running to False, which breaks the loop in the run method, it also puts a False to the queue
+        in case, that the method will wait at the queue for a input and close the connection to the server
+        :return: None
+        """
+        self.running = False
+        self.queue.put(False)
+        if self.recv is not None:
+            self.recv.running = False
+        if self.con is not None:
+            try:
+                self.con.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.con.close()
+
+
+class Recv(threading.Thread, Stoppable):
+    """
+        @author Ertl Marvin
+        @version 2016-12-19
+
+        This class inherits from the threading.Thread and from Stoppable, this class will receive the messages from the
+        server and gives them to the ChatClient
+
+            :ivar con:      Connection to the server
+            :ivar client:   The ChatClient of the connection
+            :ivar running:  Running says, if the run method is running or not
+            :ivar reader:   FrameReader, which collects the received bytes to frames
+    """
+
+    def __init__(self, con, client):
+        """
+        Initial the base class threading.Thread and Stoppable, will set the attributes
+        :param con:     Connection to the server
+        :param client:  The ChatClient
+        """
+        threading.Thread.__init__(self, daemon=True)
+        self.con = con
+        self.client = client
+        self.running = True
+        self.reader = Protocol.FrameReader()
+
+    def run(self):
+        """
+        The method listen to the server for receiving messages and gives them to the client, if the connection to the
+        server is lost, the client will connect again
+        :return: None
+        """
+        while self.running:
+            try:
+                data = self.con.recv(65536)
+                if not data:
+                    raise ConnectionResetError
+                for message in self.reader.feed(data):
+                    self.client.received(message)
+            except (ConnectionResetError, Protocol.ProtocolError):
+                if self.running:
+                    self.running = False
+                    self.client.lost()
+            except (ConnectionAbortedError, OSError):
+                self.running = False
+
+    def stopping(self):
+        """
+        Set running to false
+        :return: None
+        """
+        self.running = False
+
+
+class AsyncChatClient(BaseClient):
+    """
+        @author Ertl Marvin
+        @version 2016-12-19
+
+        This class inherits from BaseClient, it is the client for asyncio. It needs no thread, so one process can keep
+        thousands of connections. The messages of the server can be taken with async for or with a callback. asyncio
+        is only imported when this class is used, so the blocking client starts faster.
+
+            :ivar callback:     Function which will be called with every received message, or None
+            :ivar events:       asyncio.Queue for the received messages, if there is no callback
+            :ivar reader:       asyncio.StreamReader of the connection
+            :ivar writer:       asyncio.StreamWriter of the connection
+            :ivar task:         Task which reads from the connection
+            :ivar running:      Running says, if the client is running or not
+            :ivar credit:       asyncio.Event, which will be set if the server has got bytes of a file
+    """
+
+    def __init__(self, host="localhost", port=4242, ssl_context=None, callback=None, client=None, retries=5):
+        """
+        Initial the base class and set the attributes
+        :param host: The ip of the server
+        :param port: The port of the server
+        :param ssl_context: The ssl.SSLContext for tls, None for plaintext
+        :param callback: Function, which will be called with every received message, None to use async for
+        :param client: Id of the client, None for a random id
+        :param retries: How often the client tries to connect again
+        """
+        import asyncio
+        BaseClient.__init__(self, host, port, ssl_context, client, retries)
+        self.callback = callback
+        self.events = asyncio.Queue()
+        self.reader = None
+        self.writer = None
+        self.task = None
+        self.running = True
+        self.credit = asyncio.Event()
+
+    async def connect(self):
+        """
+        Connects to the server, tries it again retries times, and starts the task for reading
+        :return: None
+        """
+        import asyncio
+        await self.open(self.CONNECT_ERROR)
+        self.task = asyncio.ensure_future(self.read())
+
+    async def open(self, error):
+        """
+        Opens the connection, sends the hello and all messages without ack
+        :param error: The error for the exception, if it can't connect
+        :return: None
+        """
+        import asyncio
+        for attempt in range(self.retries + 1):
+            try:
+                self.reader, self.writer = await asyncio.open_connection(
+                    self.host, self.port, ssl=self.ssl_context,
+                    server_hostname=self.host if self.ssl_context is not None else None)
+                self.writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.writer.write(self.hello() + self.resend())
+                await self.writer.drain()
+                self.credit.set()
+                return
+            except OSError:
+                if attempt == self.retries:
+                    raise ConnectionError(error)
+                await asyncio.sleep(self.RETRY_DELAY * (attempt + 1))
+
+    async def send(self, text, room=None):
+        """
+        Sends the message, if the connection is lost at the moment it will be sent after the reconnect. If OUTBOX
+        messages wait for their ack, the message is not taken, like in ChatClient.
+        :param text: The message
+        :param room: The room of the message, None for the lobby
+        :return: The number of the message, None if the outbox is full
+        """
+        if self.full():
+            return None
+        msg_id, frame = self.post(text, room)
+        self.typed = False
+        await self.write(frame)
+        return msg_id
+
+    async def send_file(self, path):
+        """
+        Sends the file in chunks, the chunks of other files and the messages go in between, the method returns when
+        the server has got the whole file
+        :param path: Path of the file
+        :return: The number of the file
+        """
+        file = open(path, "rb")
+        frame = self.upload(file, os.path.basename(path), os.fstat(file.fileno()).st_size)
+        file_id = self.next_file
+        await self.write(frame)
+        while self.running and file_id in self.uploads:
+            chunk = self.next_chunk()
+            if chunk:
+                await self.write(chunk)
+            else:
+                self.credit.clear()
+                await self.credit.wait()
+        return file_id
+
+    async def join_room(self, room):
+        """
+        Joins the room, the server sends the last messages of the room as history
+        :param room: The name of the room
+        :return: None
+        """
+        await self.write(self.room_frame("join", room))
+
+    async def leave_room(self, room):
+        """
+        Leaves the room
+        :param room: The name of the room
+        :return: None
+        """
+        await self.write(self.room_frame("leave", room))
+
+    async def status(self, status):
+        """
+        Sends the own status to the server, if the connection is lost at the moment it will be sent after the reconnect
+        :param status: online or away
+        :return: None
+        """
+        await self.write(self.status_frame(status))
+
+    async def typing(self, typing):
+        """
+        Tells the other clients if the user is typing, only a change will be sent, it will not be sent again after a
+        reconnect
+        :param typing: True if the user is typing
+        :return: None
+        """
+        frame = self.typing_frame(typing)
+        if frame:
+            await self.write(frame)
+
+    async def write(self, frame):
+        """
+        Writes the frame to the connection, if the connection is lost at the moment, the frame will not be sent, a msg
+        will be sent again after the reconnect
+        :param frame: The encoded frame
+        :return: None
+        """
+        try:
+            self.writer.write(frame)
+            await self.writer.drain()
+        except (OSError, AttributeError):
+            pass
+
+    async def read(self):
+        """
+        Reads the messages of the server and connects again, if the connection is lost
+        :return: None
+        """
+        frames = Protocol.FrameReader()
+        while self.running:
+            try:
+                data = await self.reader.read(65536)
+                if not data:
+                    raise ConnectionResetError
+                for message in frames.feed(data):
+                    if message.get("type") == "credit":
+                        self.credit.set()
+                    message = self.handle(message)
+                    if message is not None and message.get("type") == "login" and not message.get("ok"):
+                        frame = self.relogin(message)
+                        if frame is None:
+                            await self.deliver({"type": "error", "text": message.get("error")})
+                            self.running = False
+                            self.writer.close()
+                            break
+                        await self.write(frame)
+                    elif message is not None:
+                        await self.deliver(message)
+            except (OSError, Protocol.ProtocolError):
+                if not self.running:
+                    break
+                self.writer.close()
+                frames = Protocol.FrameReader()
+                try:
+                    await self.open(self.LOST_ERROR)
+                except ConnectionError as error:
+                    await self.deliver({"type": "error", "text": str(error)})
+                    break
+        self.running = False
+        self.credit.set()
+        await self.deliver({"type": "closed"})
+
+    async def deliver(self, message):
+        """
+        Gives the message to the callback or puts it into the events queue
+        :param message: The message
+        :return: None
+        """
+        if self.callback is not None:
+            self.callback(message)
+        else:
+            await self.events.put(message)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        """
+        :return: The next received message, the iteration stops after the closed event
+        """
+        if self.events is None:
+            raise StopAsyncIteration
+        message = await self.events.get()
+        if message.get("type") == "closed":
+            self.events = None
+        return message
+
+    async def close(self):
+        """
+        Closes the connection and waits for the reading task
+        :return: None
+        """
+        self.running = False
+        if self.writer is not None:
+            self.writer.close()
+        if self.task is not None:
+            await self.task
@@ -0,0 +1,357 @@
+"""
+    @author Ertl Marvin
+    @version 2016-12-20
+
+    The gui of the client, this module will only be imported by Client, if the client is not started headless
+"""
+from PySide import QtGui
+from PySide.QtCore import QEvent, QThread, SIGNAL
+import sys
+import ClientView
+import ChatClient
+import Client
+import History
+import Render
+import Trace
+import queue
+
+
+class Update(QThread):
+    """
+        @author Ertl Marvin
+        @version 2016-12-07
+
+        This class inherits from the QThread, in the run method the queue will deliver the message, which got send
+        from the client, these message will be send via signal to the gui
+
+            :ivar queue:    The queue, from which the gui will get the received messages
+    """
+
+    def __init__(self, queue):
+        """
+        Initial the base class QThread and and set queue to the parameter queue
+        :param queue: The queue, which will deliver the message
+        """
+        QThread.__init__(self)
+        self.queue = queue
+
+    def run(self):
+        """
+        Will run till the queue gets False, the queue will deliver the received message and send via a signal the text
+        to the gui, a traced message comes as tuple with the trace
+        :return: None
+        """
+        while True:
+            text = self.queue.get()
+            if text is False:
+                break
+            if isinstance(text, tuple):
+                self.emit(SIGNAL('add_traced(QString, PyObject)'), *text)
+            else:
+                self.emit(SIGNAL('add_post(QString)'), text)
+
+    def message(self, text, title):
+        """
+        Will send the text and title to the gui, which will display a critical message with the title and the error
+        :param text: The text of the message
+        :param title: The title of the message
+        :return: None
+        """
+        self.emit(SIGNAL('message(QString, QString)'), text, title)
+
+    def roster(self, text):
+        """
+        Will send the connected clients and who is typing to the gui, which will display it in the statusbar
+        :param text: The text for the statusbar
+        :return: None
+        """
+        self.emit(SIGNAL('roster(QString)'), text)
+
+    def state(self, msg_id, text="", trace=None):
+        """
+        Will send the new state of an own message to the gui, which changes the line of the message
+        :param msg_id: The number of the message
+        :param text: The text of the msg, which the server sent back, empty if only the ack came
+        :param trace: The trace of the msg, None if it is not traced
+        :return: None
+        """
+        self.emit(SIGNAL('state(int, QString, PyObject)'), msg_id, text, trace)
+
+
+class View(QtGui.QMainWindow, ClientView.Ui_MainWindow):
+    """
+        @author Ertl Marvin
+        @version 2016-12-07
+
+        This class inherits from the QtGui.QMainWindow and from ClientView.Ui_MainWindow,
+        this class will setup the view and connection and will wait for signal to change the gui
+
+            :ivar queueR:       The queue in which the received messages will be put
+            :ivar update:       Class update, which send the signal to the view
+            :ivar client:       The ChatClient, which sends the messages and receives the messages of the server
+            :ivar fileButton:   Button for sending a file
+            :ivar echoes:       Dictionary with the number of an own message as key and [number of the line, name,
+                                text] as value, till the server sent the message back
+            :ivar outboxLabel:  Label in the statusbar with the number of the messages without ack
+            :ivar renderer:     The Render.Renderer, which formats the messages to HTML
+            :ivar lines:        Number of the lines, which were appended to the textBrowser
+    """
+
+    PENDING = " …"
+    ACKED = " ✓"
+    DROPPED = " ✗"
+    MAX_LINES = 5000
+
+    def __init__(self, ssl_context=None, host="localhost", port=4242, directory=".", trace_rate=0.01, user=None,
+                 password=None, history=None):
+        """
+        Initial the base class threading.Thread, set up the Ui, create the queues for the classes and connect the method
+        to the signal receiver, it will also start the update thread for updating the gui and the chat client for
+        sending the messages to the server, the last messages of the local history are shown before it connects
+        :param ssl_context: The ssl.SSLContext for tls, None for plaintext
+        :param host: The ip of the server
+        :param port: The port of the server
+        :param directory: The directory for the received files
+        :param trace_rate: Part of the messages, which are traced
+        :param user: The name of the account, None if the server has no accounts
+        :param password: The password of the account
+        :param history: The directory for the local history, None for no history
+        """
+        super(self.__class__, self).__init__()
+        self.setupUi(self)
+        self.queueR = queue.Queue()
+        self.update = Update(self.queueR)
+        self.connect(self.update, SIGNAL("add_post(QString)"), self.add_post)
+        self.connect(self.update, SIGNAL("add_traced(QString, PyObject)"), self.add_traced)
+        self.connect(self.update, SIGNAL("message(QString, QString)"), self.message)
+        self.connect(self.update, SIGNAL("roster(QString)"), self.statusbar.showMessage)
+        self.connect(self.update, SIGNAL("state(int, QString, PyObject)"), self.state)
+        self.update.start()
+        self.renderer = Render.Renderer()
+        self.lines = 0
+        self.textBrowser.document().setMaximumBlockCount(self.MAX_LINES)
+        self.textBrowser.setOpenExternalLinks(True)
+
+        self.client = ChatClient.ChatClient(host, port, ssl_context, callback=self.received)
+        self.client.directory = directory
+        self.client.tracer = Trace.Tracer(trace_rate)
+        self.client.render = True
+        self.client.user = user
+        self.client.password = password
+        if history is not None:
+            self.client.history = History.History(history, host, port)
+            for old in self.client.history.load(None):
+                self.add_post(self.renderer.line(old.get("from"), old.get("text")))
+        self.client.start()
+        self.pushButton.clicked.connect(self.send_post)
+        self.fileButton = QtGui.QPushButton("Datei senden", self.centralwidget)
+        self.verticalLayout.insertWidget(self.verticalLayout.indexOf(self.pushButton) + 1, self.fileButton)
+        self.fileButton.clicked.connect(self.send_file)
+        self.lineEdit.textEdited.connect(self.typing)
+        self.echoes = {}
+        self.outboxLabel = QtGui.QLabel(self.statusbar)
+        self.statusbar.addPermanentWidget(self.outboxLabel)
+
+    def send_post(self):
+        """
+        Read the text out of the input field and give it to the chat client and clear the input line, the message is
+        shown right away with … till the server sent the ack. If the outbox of the client is full, the text stays in
+        the input field.
+        :return: None
+        """
+        text = self.lineEdit.text()
+        msg_id = self.client.send(text)
+        if msg_id is None:
+            self.outboxLabel.setText("Ausgang voll, %d ungesendet" % len(self.client.pending))
+            return
+        self.lineEdit.setText("")
+        if self.client.chat(text):
+            name = self.client.name or "Ich"
+            self.add_post(self.renderer.line(name, text, mark=self.PENDING, key=("own", msg_id)))
+            self.echoes[msg_id] = [self.lines - 1, name, text]
+        self.outbox()
+
+    def state(self, msg_id, text, trace):
+        """
+        Changes the line of an own message, after the ack it gets a ✓, when the server sent the message back, it is
+        replaced with the message of the server, which plugins may have changed. A message, which the rate limit
+        dropped, gets a ✗.
+        :param msg_id: The number of the message
+        :param text: The HTML of the msg, which the server sent back, empty if only the ack came, DROPPED if the
+                     message was dropped
+        :param trace: The trace of the msg, None if it is not traced
+        :return: None
+        """
+        entry = self.echoes.get(msg_id)
+        if entry is not None:
+            if text == self.DROPPED:
+                del self.echoes[msg_id]
+                text = self.renderer.line(entry[1], entry[2], mark=self.DROPPED, key=("own", msg_id))
+            elif text:
+                del self.echoes[msg_id]
+            else:
+                text = self.renderer.line(entry[1], entry[2], mark=self.ACKED, key=("own", msg_id))
+            block = self.block(entry[0])
+            if block is not None:
+                cursor = QtGui.QTextCursor(block)
+                cursor.movePosition(QtGui.QTextCursor.EndOfBlock, QtGui.QTextCursor.KeepAnchor)
+                cursor.insertHtml(text)
+        elif text:
+            self.add_post(text)
+        if trace is not None:
+            Trace.stamp(trace, "render")
+            self.client.tracer.record(trace)
+        self.outbox()
+
+    def block(self, line):
+        """
+        :param line: The number of the line, counted from the start of the client
+        :return: The QTextBlock of the line, None if it was already removed, because there were more than MAX_LINES
+        """
+        number = line - (self.lines - self.textBrowser.document().blockCount())
+        return self.textBrowser.document().findBlockByNumber(number) if number >= 0 else None
+
+    def outbox(self):
+        """
+        Shows the number of the messages without ack in the statusbar
+        :return: None
+        """
+        count = len(self.client.pending)
+        self.outboxLabel.setText("%d ungesendet" % count if count else "")
+
+    def send_file(self):
+        """
+        Lets the user choose a file and gives it to the chat client, which sends it between the messages
+        :return: None
+        """
+        path = QtGui.QFileDialog.getOpenFileName(self, "Datei senden")[0]
+        if path:
+            try:
+                self.client.send_file(path)
+            except OSError as error:
+                QtGui.QMessageBox.warning(self, "Datei senden", str(error))
+
+    def typing(self, text):
+        """
+        Tells the other clients if the user is typing, will be called if the user changes the input field
+        :param text: The text of the input field
+        :return: None
+        """
+        self.client.typing(bool(text))
+
+    def received(self, message):
+        """
+        Will be called by the threads of the chat client with every message, the messages are formatted to HTML here,
+        so the gui thread only appends them, and put into the queue for the update thread, an error will be shown by
+        the update thread as critical message and the connected clients and who is typing will be shown in the
+        statusbar, if it changed. An ack or an own message, which the server sent back, changes the line of the
+        message. A message of a room is cached with its seq, the other messages with their text.
+        :param message: The received message
+        :return: None
+        """
+        kind = message.get("type")
+        if kind == "msg":
+            prefix = "[%s] " % message["room"] if "room" in message else "(privat) " if "to" in message else ""
+            key = ("seq", message["room"], message["seq"]) if message.get("seq") is not None else None
+            trace = message["trace"] if isinstance(message.get("trace"), dict) else None
+            if "echo" in message:
+                text = self.renderer.line(message.get("from"), message.get("text"), prefix, self.ACKED)
+                self.update.state(message["echo"], text, trace)
+            else:
+                text = self.renderer.line(message.get("from"), message.get("text"), prefix, key=key)
+                self.queueR.put((text, trace) if trace is not None else text)
+        elif kind == "ack":
+            self.update.state(message.get("id"), self.DROPPED if message.get("dropped") else "")
+        elif kind == "mailbox":
+            for old in message.get("messages", []):
+                self.queueR.put(self.renderer.line(old.get("from"), old.get("text"), "(offline) "))
+        elif kind == "reply":
+            self.queueR.put(self.renderer.plain("/%s: %s" % (message.get("command"),
+                                                             message.get("text", message.get("error")))))
+        elif kind == "history":
+            room = message.get("room")
+            for old in message.get("messages", []):
+                key = ("seq", room, old["seq"]) if old.get("seq") is not None else None
+                self.queueR.put(self.renderer.line(old.get("from"), old.get("text"), "[%s] " % room, key=key))
+        elif kind == "download":
+            self.queueR.put(self.renderer.plain("%s: [Datei %s gespeichert in %s]" % (
+                message.get("from"), message.get("name"), message.get("path"))))
+        elif kind in ("roster", "presence", "typing"):
+            text = "Verbunden: " + ", ".join(name if status == "online" else "%s (abwesend)" % name
+                                              for name, status in sorted(self.client.roster.items()))
+            if self.client.writing:
+                text += " - %s schreibt..." % ", ".join(sorted(self.client.writing))
+            self.update.roster(text)
+        elif kind == "error":
+            self.update.message(message.get("text"), "ERROR")
+            self.queueR.put(False)
+
+    def add_post(self, text):
+        """
+        Append the HTML of a message as a new line to the textBrowser
+        :param text: The HTML of the message
+        :return: None
+        """
+        self.textBrowser.append(str(text))
+        self.lines += 1
+
+    def add_traced(self, text, trace):
+        """
+        Append the received text of a traced message to the textBrowser and records the trace with the render stamp
+        :param text: The received text from the client
+        :param trace: The trace of the message
+        :return: None
+        """
+        self.add_post(text)
+        Trace.stamp(trace, "render")
+        self.client.tracer.record(trace)
+
+    def message(self, text, title):
+        """
+        Display a critical message with the given text and title and closes the gui
+        :param text: Text for the message
+        :param title: Title for the message
+        :return: None
+        """
+        QtGui.QMessageBox.critical(self, title, text)
+        self.close()
+
+    def changeEvent(self, event):
+        """
+        Override the change event, if the window gets or loses the focus the status will be sent to the server, so the
+        other clients see if the user is away
+        :param event: The event of the change
+        :return: None
+        """
+        if event.type() == QEvent.ActivationChange:
+            self.client.status("online" if self.isActiveWindow() else "away")
+        super(self.__class__, self).changeEvent(event)
+
+    def closeEvent(self, event):
+        """
+        Override the close event, puts a False to the receive queue to stop the threads and calls the stopping from the
+        chat client
+        :param event: event which get calls from clicking on the exit button
+        :return: None
+        """
+        self.queueR.put(False)
+        self.client.stopping()
+
+
+def main(args, qt_args):
+    """
+    Setups the app and view and display it
+    :param args: The parsed command line arguments of Client
+    :param qt_args: The command line arguments for qt
+    :return: None
+    """
+    app = QtGui.QApplication(sys.argv[:1] + qt_args)
+    form = View(Client.client_context(args.cafile) if args.tls or args.cafile else None, args.host, args.port,
+                args.directory, args.trace_rate, args.user, args.password, None if args.no_history else args.history)
+    form.show()
+    app.exec_()
+    if form.client.history is not None:
+        form.client.history.close()
+    if args.trace:
+        form.client.tracer.export(args.trace)
+        print(form.client.tracer.report(), file=sys.stderr)
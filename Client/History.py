@@ -0,0 +1,211 @@
+"""
+    @author Ertl Marvin
+    @version 2016-12-31
+
+    Local history of the client on the disk, one file per server and room. Every received message is appended to the
+    file as a frame of Protocol, so the file is compact, a message costs one write and a part of a frame at the end,
+    which was written when the client was killed, is cut off before the next message is appended. The gui shows the
+    last messages of the file before the client is connected, and a join only asks the server for the messages after
+    the last seq of the room.
+"""
+import os
+import threading
+import urllib.parse
+import Protocol
+
+
+class History(object):
+    """
+        @author Ertl Marvin
+        @version 2016-12-31
+
+        The history files of one server. A file is only appended, if it gets larger than MAX_SIZE, it is written again
+        with the last KEEP messages.
+
+            :ivar directory:    The directory of the server, in which the files of the rooms are
+            :ivar files:        Dictionary with the room as key and the file opened for appending as value
+            :ivar seqs:         Dictionary with the room as key and the seq of the last message in the file
+            :ivar lock:         Lock for the files
+    """
+
+    MAX_SIZE = 1024 * 1024
+    KEEP = 1000
+    LINES = 100
+
+    def __init__(self, directory, host, port):
+        """
+        Creates the directory of the server, if it doesn't exist
+        :param directory: The directory for the histories of all servers
+        :param host: The ip of the server
+        :param port: The port of the server
+        """
+        self.directory = os.path.join(directory, urllib.parse.quote("%s-%d" % (host, port), safe=""))
+        os.makedirs(self.directory, exist_ok=True)
+        self.files = {}
+        self.seqs = {}
+        self.lock = threading.Lock()
+
+    def path(self, room):
+        """
+        :param room: The name of the room, None for the lobby
+        :return: Path of the file of the room
+        """
+        if room is None:
+            return os.path.join(self.directory, "lobby.log")
+        return os.path.join(self.directory, "room-%s.log" % urllib.parse.quote(room, safe=""))
+
+    @staticmethod
+    def decode(data):
+        """
+        Decodes the frames of a file till the first frame, which is not whole or can't be decoded
+        :param data: The bytes of the file
+        :return: Tuple with the list of the messages and the end of the last good frame
+        """
+        reader = Protocol.FrameReader()
+        messages = []
+        end = 0
+        while end + Protocol.HEADER.size <= len(data):
+            stop = end + Protocol.HEADER.size + Protocol.HEADER.unpack_from(data, end)[0]
+            if stop > len(data):
+                break
+            try:
+                messages.extend(reader.feed(data[end:stop]))
+            except Protocol.ProtocolError:
+                break
+            end = stop
+        return messages, end
+
+    def load_file(self, room):
+        """
+        :param room: The name of the room, None for the lobby
+        :return: The bytes of the file of the room, empty if there is no file
+        """
+        try:
+            with open(self.path(room), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return b""
+
+    def read(self, room):
+        """
+        Reads all messages of the room from its file, a broken frame and everything after it is skipped
+        :param room: The name of the room, None for the lobby
+        :return: List of the messages
+        """
+        return self.decode(self.load_file(room))[0]
+
+    def open_file(self, room):
+        """
+        Opens the file of the room for appending, before that the file is cut after the last good frame, so a part of
+        a frame, which was written when the client was killed, doesn't break the new messages. The lock must be held.
+        :param room: The name of the room, None for the lobby
+        :return: The opened file
+        """
+        data = self.load_file(room)
+        end = self.decode(data)[1]
+        if end < len(data):
+            os.truncate(self.path(room), end)
+        f = self.files[room] = open(self.path(room), "ab")
+        return f
+
+    def load(self, room, count=None):
+        """
+        :param room: The name of the room, None for the lobby
+        :param count: Number of the messages, None for LINES
+        :return: List with the last messages of the room
+        """
+        messages = self.read(room)
+        with self.lock:
+            self.scan(room, messages)
+        return messages[-(count or self.LINES):]
+
+    def scan(self, room, messages):
+        """
+        Remembers the seq of the last message of the room, if it is not known yet
+        :param room: The name of the room, None for the lobby
+        :param messages: All messages of the file of the room
+        :return: None
+        """
+        if room not in self.seqs:
+            self.seqs[room] = next((m["seq"] for m in reversed(messages) if isinstance(m.get("seq"), int)), None)
+
+    def last(self, room):
+        """
+        :param room: The name of the room, None for the lobby
+        :return: The seq of the last message of the room, None if there is none
+        """
+        with self.lock:
+            if room not in self.seqs:
+                self.scan(room, self.read(room))
+            return self.seqs[room]
+
+    @staticmethod
+    def record(message):
+        """
+        :param message: A received message
+        :return: The frame of the message for the file, only with from, text and seq
+        """
+        record = {"type": "msg", "from": message.get("from"), "text": message.get("text")}
+        if message.get("seq") is not None:
+            record["seq"] = message["seq"]
+        return Protocol.encode(record)
+
+    def append(self, room, messages, seq=None):
+        """
+        Appends the messages to the file of the room with one write
+        :param room: The name of the room, None for the lobby
+        :param messages: The messages with from, text and maybe seq
+        :param seq: The seq of the last message, None if it doesn't change
+        :return: None
+        """
+        data = b"".join(self.record(m) for m in messages)
+        with self.lock:
+            if seq is not None:
+                self.seqs[room] = seq
+            if not data:
+                return
+            f = self.files.get(room)
+            if f is None:
+                f = self.open_file(room)
+            f.write(data)
+            f.flush()
+            if f.tell() > self.MAX_SIZE:
+                self.compact(room)
+
+    def received(self, room, messages, seq):
+        """
+        Appends the messages of a history of the server, which are newer than the last message of the file. If the
+        seq of the server is lower than the own, the room was created again and all messages are new.
+        :param room: The name of the room
+        :param messages: The messages of the history
+        :param seq: The seq of the last message of the room on the server
+        :return: None
+        """
+        last = self.last(room)
+        if last is not None and seq >= last:
+            messages = [m for m in messages if isinstance(m.get("seq"), int) and m["seq"] > last]
+        self.append(room, messages, seq)
+
+    def compact(self, room):
+        """
+        Writes the file of the room again with the last KEEP messages, the new file replaces the old one at once, so
+        the history is never lost. The lock must be held.
+        :param room: The name of the room, None for the lobby
+        :return: None
+        """
+        self.files.pop(room).close()
+        path = self.path(room)
+        messages = self.read(room)[-self.KEEP:]
+        with open(path + ".tmp", "wb") as f:
+            f.write(b"".join(Protocol.encode(m) for m in messages))
+        os.replace(path + ".tmp", path)
+
+    def close(self):
+        """
+        Closes all files
+        :return: None
+        """
+        with self.lock:
+            for f in self.files.values():
+                f.close()
+            self.files.clear()
@@ -0,0 +1,151 @@
+"""
+    @author Ertl Marvin
+    @version 2016-12-17
+
+    Protocol between the client and the server. Every message is sent as a frame, the frame starts with a header of
+    4 bytes for the length of the payload and 1 byte for the type of the frame. The payload of a JSON frame is a
+    dictionary with the key "type", the other keys depend on the type:
+
+        hello   client -> server    client: id of the client, which stays the same after a reconnect
+        login   client -> server    name and password, or token: the token of the last login, only if the server
+                                    has accounts, the other messages wait till the login was successful
+        login   server -> client    ok: True, name: name of the account, token: for the next login, or ok: False,
+                                    error: why the login failed, retry: True if the client should send the password
+        msg     client -> server    id: number of the message, text: the message, room: only for a room
+        msg     server -> client    from: name of the sender, text: the message, room and seq: number of the message
+                                    in the room, only for a room, to: only for a private message of /msg, id: only
+                                    in the copy for the sender, the id of its msg
+        ack     server -> client    id: number of the message, which the server got, from: name of the client,
+                                    echo: True if the message will be sent back to the client as msg, dropped:
+                                    True if the rate limit threw the message away
+        reply   server -> client    command: name of the command of a msg, which started with /, text: the answer or
+                                    error: why the command failed, and more keys depending on the command
+        status  client -> server    status: online or away
+        roster  server -> client    clients: dictionary with the name and the status of every client, after the join
+        presence server -> client   clients: dictionary with the name and the new status, None if the client left
+        typing  client -> server    typing: True if the user is writing a message, no ack
+        typing  server -> client    from: name of the client, typing: True or False, can be lost
+        file    client -> server    id: number of the file, name: name of the file, size: number of bytes
+        credit  server -> client    file: number of the file, size: number of bytes, which the server has got
+        file    server -> client    from: name of the sender, file: number of the file, name, size
+        join    client -> server    room: name of the room, the lobby is no room, every client is in it, since: seq
+                                    of the last message, which the client has, the history has only newer messages
+        leave   client -> server    room: name of the room
+        history server -> client    room: name of the room, messages: list of the last messages with from, text and
+                                    seq, seq: number of the last message of the room, if it is lower than the seq
+                                    of the client, the room was created again
+        mailbox server -> client    messages: list of the messages with from, text and time, which were sent with /msg
+                                    while the user was not connected
+        link    server -> server    node: name of the server, the connection is a link of the cluster from now on
+        batch   server -> server    messages: list of msg with from, text, origin: node of the sender, mid: number
+                                    and of room messages with op, see Server.Rooms
+
+    A msg in the lobby can have the key trace with the stamps of Trace, every station adds its stamp.
+
+    The bytes of a file are sent in CHUNK frames, their payload starts with 4 bytes for the number of the file and the
+    rest are the bytes of the file. So the chunks of many files and the JSON messages can be sent in between.
+    The FrameReader returns a chunk as dictionary with the type chunk, file: number of the file and data: the bytes.
+"""
+import json
+import struct
+
+HEADER = struct.Struct("!IB")
+CHUNK_HEADER = struct.Struct("!I")
+JSON = 1
+CHUNK = 2
+MAX_FRAME = 16 * 1024 * 1024
+
+
+def encode(message):
+    """
+    Encodes the message to a JSON frame
+    :param message: Dictionary with the key type
+    :return: The frame as bytes
+    """
+    payload = json.dumps(message, separators=(",", ":")).encode()
+    return HEADER.pack(len(payload), JSON) + payload
+
+
+def chunk_header(file_id, length):
+    """
+    Encodes the header of a CHUNK frame, the bytes of the file must be sent directly after it
+    :param file_id: Number of the file
+    :param length: Number of the bytes of the file in this frame
+    :return: The header as bytes
+    """
+    return HEADER.pack(length + CHUNK_HEADER.size, CHUNK) + CHUNK_HEADER.pack(file_id)
+
+
+def encode_chunk(file_id, data):
+    """
+    Encodes a part of a file to a CHUNK frame
+    :param file_id: Number of the file
+    :param data: The bytes of the file
+    :return: The frame as bytes
+    """
+    return chunk_header(file_id, len(data)) + data
+
+
+class ProtocolError(Exception):
+    """
+        @author Ertl Marvin
+        @version 2016-12-17
+
+        Will be raised if the other side sends something, which is not a valid frame
+    """
+    pass
+
+
+class FrameReader(object):
+    """
+        @author Ertl Marvin
+        @version 2016-12-17
+
+        Collects the received bytes till a whole frame is there, because recv can return a part of a frame or many
+        frames at once.
+
+            :ivar buffer:   The received bytes, which are not a whole frame yet
+    """
+
+    def __init__(self):
+        """
+        Create the empty buffer
+        """
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """
+        Adds the received bytes to the buffer and decodes all whole frames
+        :param data: The received bytes
+        :return: List of the decoded messages
+        """
+        self.buffer += data
+        messages = []
+        offset = 0
+        while len(self.buffer) - offset >= HEADER.size:
+            length, kind = HEADER.unpack_from(self.buffer, offset)
+            if length > MAX_FRAME:
+                raise ProtocolError("Frame too large: %d bytes" % length)
+            end = offset + HEADER.size + length
+            if len(self.buffer) < end:
+                break
+            payload = bytes(self.buffer[offset + HEADER.size:end])
+            offset = end
+            if kind == CHUNK:
+                if length < CHUNK_HEADER.size:
+                    raise ProtocolError("Chunk frame too short")
+                messages.append({"type": "chunk", "file": CHUNK_HEADER.unpack_from(payload)[0],
+                                 "data": payload[CHUNK_HEADER.size:]})
+                continue
+            if kind != JSON:
+                raise ProtocolError("Unknown frame type: %d" % kind)
+            try:
+                message = json.loads(payload.decode())
+            except ValueError:
+                raise ProtocolError("Invalid JSON frame")
+            if not isinstance(message, dict):
+                raise ProtocolError("Message is not a dictionary")
+            messages.append(message)
+        if offset:
+            del self.buffer[:offset]
+        return messages
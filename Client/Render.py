@@ -0,0 +1,111 @@
+"""
+    @author Ertl Marvin
+    @version 2016-12-31
+
+    Formatting of the messages for the gui. A message is turned into HTML once, with the color of the sender, links and
+    emoji, and the HTML is kept in a LRU cache, so a message, which is shown again, isn't formatted again. The module
+    doesn't need qt, the HTML is made in the threads of the client and the gui only appends it.
+"""
+import collections
+import html
+import re
+import threading
+import zlib
+
+
+class Renderer(object):
+    """
+        @author Ertl Marvin
+        @version 2016-12-31
+
+        Formats the messages to HTML, every message is one line, so it is one block of the QTextDocument. The HTML is
+        cached with the key of the message, the least recently used HTML is forgotten first, if there are more than
+        SIZE.
+
+            :ivar cache:    OrderedDictionary with the key and the mark as key and the HTML as value
+            :ivar colors:   Dictionary with the name of a sender and its color
+            :ivar hits:     Number of the messages, which were taken from the cache
+            :ivar lock:     Lock for the cache
+    """
+
+    SIZE = 2000
+    COLORS = ("#c0392b", "#2980b9", "#27ae60", "#8e44ad", "#d35400", "#16a085", "#2c3e50", "#b7950b", "#a93226",
+              "#1f618d", "#196f3d", "#6c3483")
+    EMOJI = {":)": "\U0001F642", ":-)": "\U0001F642", ":D": "\U0001F600", ";)": "\U0001F609", ":(": "\U0001F641",
+             ":P": "\U0001F61B", "<3": "❤", ":smile:": "\U0001F604", ":thumbsup:": "\U0001F44D",
+             ":heart:": "❤", ":fire:": "\U0001F525", ":tada:": "\U0001F389"}
+    TOKEN = re.compile(r"(?P<link>https?://[^\s<>\"']+)|(?<!\S)(?P<emoji>%s)(?!\S)" %
+                       "|".join(re.escape(e) for e in sorted(EMOJI, key=len, reverse=True)))
+    MARK = '<span style="color:#888888">%s</span>'
+
+    def __init__(self):
+        """
+        Creates the empty cache
+        """
+        self.cache = collections.OrderedDict()
+        self.colors = {}
+        self.hits = 0
+        self.lock = threading.Lock()
+
+    def color(self, name):
+        """
+        :param name: The name of a sender
+        :return: The color of the name, it is the same in every client, because it is taken from the crc32 of the name
+        """
+        color = self.colors.get(name)
+        if color is None:
+            color = self.colors[name] = self.COLORS[zlib.crc32(name.encode()) % len(self.COLORS)]
+        return color
+
+    def text(self, text):
+        """
+        :param text: The text of a message
+        :return: The text as HTML with the links as anchors, the emoji and the line breaks as <br>
+        """
+        parts = []
+        position = 0
+        for match in self.TOKEN.finditer(text):
+            parts.append(html.escape(text[position:match.start()]))
+            if match.lastgroup == "link":
+                link = html.escape(match.group())
+                parts.append('<a href="%s">%s</a>' % (link, link))
+            else:
+                parts.append(self.EMOJI[match.group()])
+            position = match.end()
+        parts.append(html.escape(text[position:]))
+        return "".join(parts).replace("\n", "<br>")
+
+    def line(self, sender, text, prefix="", mark="", key=None):
+        """
+        Formats a message, the HTML is taken from the cache, if the message was formatted before
+        :param sender: The name of the sender
+        :param text: The text of the message
+        :param prefix: Text before the name, like the room
+        :param mark: Text after the message, like the state of an own message
+        :param key: The key of the message, None to use prefix, sender and text as key
+        :return: The HTML of the message
+        """
+        cache = (key if key is not None else (prefix, sender, text), mark)
+        with self.lock:
+            result = self.cache.get(cache)
+            if result is not None:
+                self.cache.move_to_end(cache)
+                self.hits += 1
+                return result
+        sender = str(sender)
+        result = '%s<b style="color:%s">%s</b>: %s' % (html.escape(prefix), self.color(sender), html.escape(sender),
+                                                      self.text(str(text)))
+        if mark:
+            result += self.MARK % html.escape(mark)
+        with self.lock:
+            self.cache[cache] = result
+            while len(self.cache) > self.SIZE:
+                self.cache.popitem(last=False)
+        return result
+
+    def plain(self, text):
+        """
+        :param text: A text of the client, like an answer of a command
+        :return: The text as HTML, with the links and the emoji
+        """
+        return self.text(str(text))
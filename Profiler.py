@@ -0,0 +1,160 @@
+"""
+    @author Ertl Marvin
+    @version 2016-12-29
+
+    Profiling of the running server, which can be switched on and off at runtime. The Profiler samples the stacks of
+    all threads for some seconds and writes them in the collapsed format of flamegraph.pl, one line per stack with
+    the frames separated by ";" and the number of the samples. The Timers measure the wall time of the handlers of
+    the server, they only cost the check of enabled while they are off.
+"""
+import collections
+import os
+import sys
+import threading
+import time
+
+
+class Timers(object):
+    """
+        @author Ertl Marvin
+        @version 2016-12-29
+
+        Counts how often the handlers ran and how long they took, only while enabled is True.
+
+            :ivar enabled:  True if the handlers should be measured
+            :ivar times:    Dictionary with the name of the handler and [count, total seconds, max seconds]
+            :ivar lock:     Lock for times
+    """
+
+    def __init__(self):
+        """
+        Set the attributes, the timers are off
+        """
+        self.enabled = False
+        self.times = {}
+        self.lock = threading.Lock()
+
+    def record(self, name, seconds):
+        """
+        Adds the time of one run of the handler
+        :param name: The name of the handler
+        :param seconds: The wall time of the run
+        :return: None
+        """
+        with self.lock:
+            entry = self.times.get(name)
+            if entry is None:
+                entry = self.times[name] = [0, 0.0, 0.0]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+    def reset(self):
+        """
+        Forgets all times
+        :return: None
+        """
+        with self.lock:
+            self.times = {}
+
+    def report(self):
+        """
+        :return: Text with count, total, average and max of every handler, the slowest first
+        """
+        lines = ["%-20s %9s %10s %10s %10s" % ("handler", "count", "total ms", "avg us", "max us")]
+        with self.lock:
+            items = sorted(self.times.items(), key=lambda item: -item[1][1])
+        for name, (count, total, most) in items:
+            lines.append("%-20s %9d %10.1f %10.1f %10.1f" % (name, count, total * 1000, total / count * 1000000,
+                                                             most * 1000000))
+        return "\n".join(lines)
+
+
+class Profiler(threading.Thread):
+    """
+        @author Ertl Marvin
+        @version 2016-12-29
+
+        This class inherits from threading.Thread, it takes the stacks of all other threads every INTERVAL seconds
+        with sys._current_frames, for the given seconds or till it is stopped, and writes them collapsed to the file.
+        The first frame of every stack is the class of the thread, so all Recv or Worker threads are added up. While
+        it runs, the Timers are enabled and their report is written to the file with ".timers" at the end.
+
+            :ivar seconds:  How long the profiler samples
+            :ivar path:     The file for the collapsed stacks
+            :ivar timers:   The Timers of the server, or None
+            :ivar stacks:   Counter with the collapsed stacks
+            :ivar samples:  Number of the samples
+            :ivar running:  Set if the run method should take samples
+    """
+
+    INTERVAL = 0.005
+
+    def __init__(self, seconds, path, timers=None):
+        """
+        Initial the base class threading.Thread and set the attributes
+        :param seconds: How long the profiler samples
+        :param path: The file for the collapsed stacks
+        :param timers: The Timers of the server, or None
+        """
+        threading.Thread.__init__(self, name="Profiler", daemon=True)
+        self.seconds = seconds
+        self.path = path
+        self.timers = timers
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.running = True
+
+    def run(self):
+        """
+        Takes the samples and writes the files at the end
+        :return: None
+        """
+        if self.timers is not None:
+            self.timers.reset()
+            self.timers.enabled = True
+        end = time.monotonic() + self.seconds
+        while self.running and time.monotonic() < end:
+            self.sample()
+            time.sleep(self.INTERVAL)
+        if self.timers is not None:
+            self.timers.enabled = False
+        self.write()
+
+    def sample(self):
+        """
+        Adds the current stacks of all other threads
+        :return: None
+        """
+        names = {t.ident: type(t).__name__ for t in threading.enumerate()}
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append("%s:%s" % (os.path.basename(code.co_filename), code.co_name))
+                frame = frame.f_back
+            stack.append(names.get(ident, "Thread"))
+            self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def write(self):
+        """
+        Writes the collapsed stacks and the report of the Timers
+        :return: None
+        """
+        with open(self.path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write("%s %d\n" % (stack, count))
+        if self.timers is not None:
+            with open(self.path + ".timers", "w") as f:
+                f.write(self.timers.report() + "\n")
+
+    def stopping(self):
+        """
+        Stops the sampling, the files will be written
+        :return: None
+        """
+        self.running = False
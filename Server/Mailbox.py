@@ -0,0 +1,140 @@
+"""
+    @author Ertl Marvin
+    @version 2016-12-30
+
+    Offline mailboxes of the server in a sqlite database. A user is a client, which chose a name with /nick, a /msg to a
+    user, which is not connected, is kept in the mailbox of the user and sent in batches, when the user comes back.
+    The database uses the write ahead log, so writing doesn't block reading and a commit doesn't wait for the disk.
+"""
+import sqlite3
+import threading
+import time
+import Protocol
+
+
+class Mailboxes(object):
+    """
+        @author Ertl Marvin
+        @version 2016-12-30
+
+        The mailboxes of all users in one database, which is used by all threads with one connection and a lock. A
+        mailbox keeps at most MAX_MESSAGES messages, the oldest are deleted first, and a message is deleted after
+        MAX_AGE seconds. Users, which were not seen for MAX_AGE seconds, are forgotten.
+
+            :ivar path:     Path of the database
+            :ivar db:       The sqlite3 connection
+            :ivar lock:     Lock for the connection
+            :ivar puts:     Number of the messages since the last purge
+    """
+
+    MAX_MESSAGES = 1000
+    MAX_AGE = 30 * 24 * 3600
+    BATCH = 500
+    PURGE_EVERY = 1000
+
+    def __init__(self, path, max_messages=None, max_age=None):
+        """
+        Opens the database and creates the tables, if they don't exist
+        :param path: Path of the database
+        :param max_messages: Maximum number of messages per mailbox, None for MAX_MESSAGES
+        :param max_age: Seconds how long messages and users are kept, None for MAX_AGE
+        """
+        self.path = path
+        if max_messages is not None:
+            self.MAX_MESSAGES = max_messages
+        if max_age is not None:
+            self.MAX_AGE = max_age
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS users (name TEXT PRIMARY KEY, seen REAL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS mail (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, time REAL, "
+                        "sender TEXT, text TEXT)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS mail_name ON mail (name, id)")
+        self.lock = threading.Lock()
+        self.puts = 0
+        self.purge()
+
+    def seen(self, name):
+        """
+        Registers the user or updates the time, when the user was seen
+        :param name: The name of the user
+        :return: None
+        """
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO users VALUES (?, ?)", (name, time.time()))
+
+    def known(self, name):
+        """
+        :param name: The name of the user
+        :return: True if the user has a mailbox
+        """
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM users WHERE name = ?", (name,)).fetchone() is not None
+
+    def put(self, name, sender, text):
+        """
+        Puts the message into the mailbox of the user, if it is full the oldest messages are deleted
+        :param name: The name of the user
+        :param sender: The name of the sender
+        :param text: The message
+        :return: None
+        """
+        with self.lock:
+            self.db.execute("BEGIN")
+            self.db.execute("INSERT INTO mail (name, time, sender, text) VALUES (?, ?, ?, ?)",
+                            (name, time.time(), sender, text))
+            self.db.execute("DELETE FROM mail WHERE name = ? AND id <= (SELECT id FROM mail WHERE name = ? "
+                            "ORDER BY id DESC LIMIT 1 OFFSET ?)", (name, name, self.MAX_MESSAGES))
+            self.db.execute("COMMIT")
+            self.puts += 1
+        if self.puts >= self.PURGE_EVERY:
+            self.purge()
+
+    def deliver(self, name, send):
+        """
+        Sends all messages of the mailbox in mailbox frames of at most BATCH messages, which are sent at once, and
+        deletes them after they were sent
+        :param name: The name of the user
+        :param send: Function, which sends the encoded frames to the client
+        :return: Number of the sent messages
+        """
+        with self.lock:
+            rows = self.db.execute("SELECT id, time, sender, text FROM mail WHERE name = ? ORDER BY id",
+                                   (name,)).fetchall()
+        if not rows:
+            return 0
+        frames = b"".join(Protocol.encode({"type": "mailbox", "messages": [
+            {"from": sender, "text": text, "time": sent} for _, sent, sender, text in rows[i:i + self.BATCH]]})
+            for i in range(0, len(rows), self.BATCH))
+        send(frames)
+        with self.lock:
+            self.db.execute("DELETE FROM mail WHERE name = ? AND id <= ?", (name, rows[-1][0]))
+        return len(rows)
+
+    def purge(self):
+        """
+        Deletes the messages and the users, which are older than MAX_AGE
+        :return: None
+        """
+        limit = time.time() - self.MAX_AGE
+        with self.lock:
+            self.db.execute("DELETE FROM mail WHERE time < ?", (limit,))
+            self.db.execute("DELETE FROM users WHERE seen < ?", (limit,))
+            self.puts = 0
+
+    def stats(self):
+        """
+        :return: Dictionary with the number of the users and of the messages
+        """
+        with self.lock:
+            return {"users": self.db.execute("SELECT COUNT(*) FROM users").fetchone()[0],
+                    "messages": self.db.execute("SELECT COUNT(*) FROM mail").fetchone()[0]}
+
+    def close(self):
+        """
+        Closes the database
+        :return: None
+        """
+        with self.lock:
+            self.db.close()
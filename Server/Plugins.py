@@ -0,0 +1,269 @@
+"""
+    @author Ertl Marvin
+    @version 2016-12-29
+
+    Plugins of the server, which change or drop the messages of the clients before they are sent. The Pipeline calls
+    its plugins in order, every plugin gets the message and returns it, maybe changed, or None if the message should
+    not be sent. The rules of the plugins are compiled once at the start, so a message costs the same with 10 or with
+    10000 rules.
+"""
+from abc import ABCMeta, abstractmethod
+import re
+import threading
+
+
+class Plugin(metaclass=ABCMeta):
+    """
+        @author Ertl Marvin
+        @version 2016-12-29
+
+        Interface for the plugins of the Pipeline
+    """
+
+    @abstractmethod
+    def process(self, recv, message):
+        """
+        Changes or drops the message of the client
+        :param recv: The Recv object of the client, which sent the message
+        :param message: The message with from, text and maybe room
+        :return: The message, which will be sent, or None if it should be dropped
+        """
+        pass
+
+
+class Pipeline(object):
+    """
+        @author Ertl Marvin
+        @version 2016-12-29
+
+        The ordered list of the plugins, a new list is created for every change, so the receive threads can go through
+        the list without lock.
+
+            :ivar plugins:  Tuple with the plugins in the order, in which they are called
+            :ivar lock:     Lock for the changes of the plugins
+    """
+
+    def __init__(self, plugins=()):
+        """
+        Set the plugins
+        :param plugins: The plugins in the order, in which they are called
+        """
+        self.plugins = tuple(plugins)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        """
+        :return: Number of the plugins
+        """
+        return len(self.plugins)
+
+    def add(self, plugin, index=None):
+        """
+        Adds the plugin to the pipeline
+        :param plugin: The Plugin
+        :param index: Position of the plugin, None for the end
+        :return: None
+        """
+        with self.lock:
+            plugins = list(self.plugins)
+            plugins.insert(len(plugins) if index is None else index, plugin)
+            self.plugins = tuple(plugins)
+
+    def remove(self, plugin):
+        """
+        Removes the plugin from the pipeline
+        :param plugin: The Plugin
+        :return: None
+        """
+        with self.lock:
+            self.plugins = tuple(p for p in self.plugins if p is not plugin)
+
+    def process(self, recv, message):
+        """
+        Gives the message to all plugins in order, till one of them drops it
+        :param recv: The Recv object of the client, which sent the message
+        :param message: The message with from, text and maybe room
+        :return: The message, which will be sent, or None if it should be dropped
+        """
+        for plugin in self.plugins:
+            message = plugin.process(recv, message)
+            if message is None:
+                return None
+        return message
+
+
+def trie_pattern(words):
+    """
+    Creates a regular expression, which matches all words. The words are put into a trie first, so the words with the
+    same start share one branch and the regular expression doesn't have to try every word at every position.
+    :param words: The words
+    :return: The regular expression as string, None if there are no words
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = True
+    if not trie or list(trie) == [""]:
+        return None
+
+    def pattern(node):
+        end = "" in node
+        branches = [re.escape(char) + pattern(node[char]) for char in sorted(node) if char]
+        if not branches:
+            return ""
+        if all(len(node[char]) == 1 and "" in node[char] for char in node if char) and len(branches) > 1:
+            result = "[" + "".join(branches) + "]"
+        elif len(branches) == 1:
+            result = branches[0]
+        else:
+            result = "(?:" + "|".join(branches) + ")"
+        if end:
+            result = "(?:" + result + ")?"
+        return result
+
+    return pattern(trie)
+
+
+class WordFilter(Plugin):
+    """
+        @author Ertl Marvin
+        @version 2016-12-29
+
+        Replaces the forbidden words with stars, upper and lower case don't matter and only whole words are replaced.
+        All words are compiled into one regular expression with trie_pattern.
+
+            :ivar regex:    The compiled regular expression, None without words
+            :ivar drop:     If True a message with a forbidden word is dropped instead of changed
+            :ivar hits:     Number of the messages, which contained forbidden words
+    """
+
+    def __init__(self, words, drop=False):
+        """
+        Compiles the words
+        :param words: The forbidden words
+        :param drop: If True a message with a forbidden word is dropped instead of changed
+        """
+        pattern = trie_pattern(sorted({w.strip().lower() for w in words if w.strip()}))
+        self.regex = re.compile(r"(?<!\w)" + pattern + r"(?!\w)", re.IGNORECASE) if pattern is not None else None
+        self.drop = drop
+        self.hits = 0
+
+    @classmethod
+    def load(cls, path, drop=False):
+        """
+        Reads the words from the file, one word per line, lines with # at the start are comments
+        :param path: Path of the file
+        :param drop: If True a message with a forbidden word is dropped instead of changed
+        :return: The WordFilter
+        """
+        with open(path, encoding="utf-8") as f:
+            return cls([line for line in f if not line.startswith("#")], drop)
+
+    def process(self, recv, message):
+        """
+        Replaces the forbidden words of the text with stars
+        :param recv: The Recv object of the client, which sent the message
+        :param message: The message with from, text and maybe room
+        :return: The message with the replaced words, None if it has forbidden words and drop is True
+        """
+        if self.regex is None:
+            return message
+        text, count = self.regex.subn(lambda match: "*" * len(match.group()), message["text"])
+        if count:
+            self.hits += 1
+            if self.drop:
+                return None
+            message["text"] = text
+        return message
+
+
+class LinkRewriter(Plugin):
+    """
+        @author Ertl Marvin
+        @version 2016-12-29
+
+        Rewrites the links in the messages, the host of a link is replaced if it is in the hosts and the parameters
+        for tracking, which start with utm_, are removed. The hosts are a dictionary, so a link costs the same with
+        any number of rules.
+
+            :ivar hosts:    Dictionary with the old host as key and the new host as value
+            :ivar count:    Number of the rewritten links
+    """
+
+    LINK = re.compile(r"https?://[^\s<>\"']+", re.IGNORECASE)
+    TRACKING = ("utm_",)
+
+    def __init__(self, hosts=None):
+        """
+        Set the attributes, urllib.parse is only imported by rewrite, so a server without rewriter doesn't load it
+        :param hosts: Dictionary with the old host as key and the new host as value
+        """
+        self.hosts = {old.lower(): new for old, new in (hosts or {}).items()}
+        self.count = 0
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads the hosts from the file, one rule per line with the old and the new host separated by a space, lines
+        with # at the start are comments
+        :param path: Path of the file
+        :return: The LinkRewriter
+        """
+        hosts = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2 and not line.startswith("#"):
+                    hosts[parts[0]] = parts[1]
+        return cls(hosts)
+
+    def rewrite(self, match):
+        """
+        :param match: The match of a link
+        :return: The rewritten link, the link itself if it can't be parsed
+        """
+        import urllib.parse
+        link = match.group()
+        try:
+            parts = urllib.parse.urlsplit(link)
+            host = self.hosts.get((parts.hostname or "").lower())
+        except ValueError:
+            return link
+        query = parts.query
+        if query and any(t in query for t in self.TRACKING):
+            query = "&".join(p for p in query.split("&") if not p.startswith(self.TRACKING))
+        if host is None and query == parts.query:
+            return link
+        self.count += 1
+        netloc = parts.netloc if host is None else parts.netloc.lower().replace(parts.hostname, host, 1)
+        return urllib.parse.urlunsplit((parts.scheme, netloc, parts.path, query, parts.fragment))
+
+    def process(self, recv, message):
+        """
+        Rewrites all links of the text
+        :param recv: The Recv object of the client, which sent the message
+        :param message: The message with from, text and maybe room
+        :return: The message with the rewritten links
+        """
+        text = message["text"]
+        if "://" in text:
+            message["text"] = self.LINK.sub(self.rewrite, text)
+        return message
+
+
+def load(filter_file=None, rewrite_file=None, drop=False):
+    """
+    Creates the plugins from the files, first the links are rewritten and then the words filtered
+    :param filter_file: File with the forbidden words, None without WordFilter
+    :param rewrite_file: File with the hosts for the LinkRewriter, None without LinkRewriter
+    :param drop: If True messages with forbidden words are dropped
+    :return: List with the plugins
+    """
+    plugins = []
+    if rewrite_file:
+        plugins.append(LinkRewriter.load(rewrite_file))
+    if filter_file:
+        plugins.append(WordFilter.load(filter_file, drop))
+    return plugins
@@ -1,316 +1,3364 @@
-from PySide import QtGui
-from PySide.QtCore import QThread, SIGNAL
+"""
+    @author Ertl Marvin
+    @version 2016-12-20
+
+    The server of the simple chat, this module doesn't need the gui, the gui is in ServerGui and will only be imported
+    if it is needed, so the server starts fast with --headless. Server.View and Server.Update still work, they import
+    ServerGui the first time they are used.
+"""
 from abc import ABCMeta, abstractmethod
-import sys
-import ServerView
+import Plugins
+import Protocol
+import Profiler
+import Trace
 import threading
 import queue
 import socket
+import time
+import collections
+import select
+import selectors
+import heapq
+import itertools
+import hashlib
+import bisect
+import json
+import os
+import sys
 
 
-class Update(QThread):
+class Stoppable(metaclass=ABCMeta):
     """
         @author Ertl Marvin
-        @version 2016-12-07
+        @version 2016-12-02
 
-        This class inherits from the QThread, the model will be started and handel the receive, send and listen thread,
-        this class will send the signal to the view, to change the gui
+        This class inherits from the metaclass ABCMeta, abstract base class, it offers a method stopping, which need to
+        be overwritten
+    """
 
-            :ivar queue:    The queue for the received messages
-            :ivar model:    Model which handles the receive, send and listen thread
+    @abstractmethod
+    def stopping(self):
+        """
+        Abstract method, must be overwritten, will be called, when the thread need to be stopped
+        :return: None
+        """
+        pass
+
+
+class RateLimiter(object):
+    """
+        @author Ertl Marvin
+        @version 2016-12-14
+
+        Token bucket rate limiter for the connected clients, there is one bucket for the messages and one for the bytes
+        per connection. The buckets are not refilled by a timer, they are refilled lazily every time a client sends a
+        message, so all connections share this one object and no extra thread is needed.
+
+            :ivar msg_rate:     Messages per second, which a client is allowed to send
+            :ivar msg_burst:    Number of messages, which a client can send at once
+            :ivar byte_rate:    Bytes per second, which a client is allowed to send
+            :ivar byte_burst:   Number of bytes, which a client can send at once
+            :ivar action:       What happens with a client over the limit, DELAY, DROP or DISCONNECT
+            :ivar buckets:      Dictionary with the name of the client as key and the bucket [msgs, bytes, time]
+            :ivar stats:        Dictionary which counts the delays, drops and disconnects
+            :ivar lock:         Lock for the buckets
     """
 
-    def __init__(self, queue):
+    DELAY = "delay"
+    DROP = "drop"
+    DISCONNECT = "disconnect"
+
+    def __init__(self, msg_rate=20, msg_burst=40, byte_rate=65536, byte_burst=262144, action=DELAY):
         """
-        Initial the base class QThread and create Model
-        :param queue: The queue for the receiving messages
+        Set the limits and create the empty dictionary for the buckets
+        :param msg_rate: Messages per second
+        :param msg_burst: Maximum number of messages at once
+        :param byte_rate: Bytes per second
+        :param byte_burst: Maximum number of bytes at once
+        :param action: DELAY, DROP or DISCONNECT
         """
-        QThread.__init__(self)
-        self.queue = queue
-        self.model = Model(self.queue, self)
+        self.msg_rate = msg_rate
+        self.msg_burst = msg_burst
+        self.byte_rate = byte_rate
+        self.byte_burst = byte_burst
+        self.action = action
+        self.buckets = {}
+        self.stats = {RateLimiter.DELAY: 0, RateLimiter.DROP: 0, RateLimiter.DISCONNECT: 0}
+        self.lock = threading.Lock()
 
-    def run(self):
+    def configure(self, **limits):
         """
-        The run method start the model and get the received messages to send a signal to change the gui
+        Change the limits while the server is running, the buckets of the clients will keep their tokens. The rates
+        and bursts must be greater than 0, because consume divides by the rates.
+        :param limits: msg_rate, msg_burst, byte_rate, byte_burst and action as keywords
         :return: None
         """
-        self.model.start()
-        while True:
-            text = self.queue.get()
-            if text is False:
-                break
-            self.emit(SIGNAL('add_post(QString)'), text)
-        self.model.stopping()
-        self.model.join()
+        with self.lock:
+            for key, value in limits.items():
+                if not hasattr(self, key) or key in ("buckets", "stats", "lock"):
+                    raise ValueError("Unknown limit: %s" % key)
+                if key != "action" and not value > 0:
+                    raise ValueError("The limit %s must be greater than 0" % key)
+            for key, value in limits.items():
+                setattr(self, key, value)
+
+    def consume(self, name, size):
+        """
+        Refill the bucket of the client with the tokens since the last message and take one message and size bytes out
+        of it. If the action is DELAY the tokens will be taken anyway and the bucket goes into debt, so the client has
+        to wait till the debt is paid back.
+        :param name: Name of the client
+        :param size: Number of bytes of the message
+        :return: 0 if the message is allowed, else the number of seconds till it would be allowed
+        """
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(name)
+            if bucket is None:
+                bucket = self.buckets[name] = [self.msg_burst, self.byte_burst, now]
+            elapsed = now - bucket[2]
+            bucket[0] = min(self.msg_burst, bucket[0] + elapsed * self.msg_rate)
+            bucket[1] = min(self.byte_burst, bucket[1] + elapsed * self.byte_rate)
+            bucket[2] = now
+            wait = max(0.0, (1 - bucket[0]) / self.msg_rate, (size - bucket[1]) / self.byte_rate)
+            if wait == 0 or self.action == RateLimiter.DELAY:
+                bucket[0] -= 1
+                bucket[1] -= size
+            if wait > 0:
+                self.stats[self.action] += 1
+            return wait
 
-    def send(self, text):
+    def rename(self, old, new):
         """
-        Will send the text via the model to all clients
-        :param text: The text which the server received from one client and will be send ot all clients
+        Moves the bucket of a client, which changed its name, so it keeps its tokens
+        :param old: The old name of the client
+        :param new: The new name of the client
         :return: None
         """
-        self.model.send(text)
+        with self.lock:
+            if old in self.buckets:
+                self.buckets[new] = self.buckets.pop(old)
 
-    def set_client(self, text):
+    def forget(self, name):
         """
-        Send a signal to the view to add the text to the connected clients text field
-        :param text: The client name which will be added to the list in the view
+        Remove the bucket of a client, which is disconnected
+        :param name: Name of the client
         :return: None
         """
-        self.emit(SIGNAL('set_client(QString)'), text)
+        with self.lock:
+            self.buckets.pop(name, None)
 
-    def remove_client(self, text):
+
+class IngressQueue(object):
+    """
+        @author Ertl Marvin
+        @version 2016-12-15
+
+        Queue for the received messages with many receive threads and one consumer. The messages are appended to a
+        deque, which is thread safe without a lock, the consumer takes all messages at once with get_batch. The
+        consumer only waits on an event if the deque is empty and the receive threads only set the event if the
+        consumer is waiting, so in the normal case no lock is used at all. It offers put, put_nowait, get and empty like
+        the queue.Queue, so it can be used instead of it.
+
+            :ivar maxsize:      Maximum number of messages, 0 for unbounded
+            :ivar items:        Deque with the messages
+            :ivar waiting:      True if the consumer waits for a message
+            :ivar ready:        Event for the consumer, will be set if a message is put
+            :ivar space:        Event for the receive threads, will be set if the consumer took messages
+    """
+
+    def __init__(self, maxsize=0):
+        """
+        Create the deque and the events
+        :param maxsize: Maximum number of messages, 0 for unbounded
+        """
+        self.maxsize = maxsize
+        self.items = collections.deque()
+        self.waiting = False
+        self.ready = threading.Event()
+        self.space = threading.Event()
+
+    def put_nowait(self, item):
         """
-        Will send a signal to the view to remove one of the client names from the gui
-        :param text: The client name which will be removed from the list
+        Put the item into the queue without waiting
+        :param item: The message
         :return: None
         """
-        self.emit(SIGNAL('remove_client(QString)'), text)
+        if 0 < self.maxsize <= len(self.items):
+            raise queue.Full
+        self.items.append(item)
+        if self.waiting:
+            self.ready.set()
 
+    def put(self, item, block=True, timeout=None):
+        """
+        Put the item into the queue, if the queue is full it will wait for the consumer
+        :param item: The message
+        :param block: If False it will not wait
+        :param timeout: Seconds to wait at most, None for no limit
+        :return: None
+        """
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self.space.clear()
+            try:
+                return self.put_nowait(item)
+            except queue.Full:
+                if not block:
+                    raise
+            remaining = None if end is None else end - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise queue.Full
+            self.space.wait(remaining)
 
-class Stoppable(metaclass=ABCMeta):
+    def get_batch(self, timeout=None, limit=None):
+        """
+        Waits for messages and takes all messages out of the queue at once
+        :param timeout: Seconds to wait at most, None for no limit
+        :param limit: Maximum number of messages, None for all
+        :return: List of the messages, empty if the timeout is over
+        """
+        if not self.items:
+            self.ready.clear()
+            self.waiting = True
+            if not self.items:
+                self.ready.wait(timeout)
+            self.waiting = False
+        batch = []
+        items = self.items
+        while items and (limit is None or len(batch) < limit):
+            batch.append(items.popleft())
+        if batch:
+            self.space.set()
+        return batch
+
+    def get(self, block=True, timeout=None):
+        """
+        Takes one message out of the queue
+        :param block: If False it will not wait
+        :param timeout: Seconds to wait at most, None for no limit
+        :return: The message
+        """
+        while True:
+            batch = self.get_batch(timeout if block else 0, 1)
+            if batch:
+                return batch[0]
+            if not block or timeout is not None:
+                raise queue.Empty
+
+    def empty(self):
+        """
+        :return: True if there is no message in the queue
+        """
+        return not self.items
+
+    def qsize(self):
+        """
+        :return: Number of messages in the queue
+        """
+        return len(self.items)
+
+
+class Backpressure(object):
     """
         @author Ertl Marvin
-        @version 2016-12-02
+        @version 2016-12-14
 
-        This class inherits from the metaclass ABCMeta, abstract base class, it offers a method stopping, which need to
-        be overwritten
+        This class counts how often and how long the receive threads had to wait, because the queue for the received
+        messages was full. While a thread waits it doesn't read from its connection, so the tcp flow control slows down
+        the client.
+
+            :ivar engaged:      How often a thread had to wait
+            :ivar waiting:      Number of threads, which are waiting at the moment
+            :ivar total:        Seconds which all threads waited together
+            :ivar longest:      Longest wait in seconds
+            :ivar lock:         Lock for the counters
     """
 
-    @abstractmethod
-    def stopping(self):
+    def __init__(self):
         """
-        Abstract method, must be overwritten, will be called, when the thread need to be stopped
+        Set all counters to 0
+        """
+        self.engaged = 0
+        self.waiting = 0
+        self.total = 0.0
+        self.longest = 0.0
+        self.lock = threading.Lock()
+
+    def begin(self):
+        """
+        Will be called when a thread starts to wait for the queue
         :return: None
         """
-        pass
+        with self.lock:
+            self.engaged += 1
+            self.waiting += 1
 
+    def end(self, seconds):
+        """
+        Will be called when the thread stopped waiting
+        :param seconds: How long the thread waited
+        :return: None
+        """
+        with self.lock:
+            self.waiting -= 1
+            self.total += seconds
+            self.longest = max(self.longest, seconds)
 
-class Model(threading.Thread, Stoppable):
+    def stats(self):
+        """
+        Returns the counters as dictionary
+        :return: Dictionary with engaged, waiting, total and longest
+        """
+        with self.lock:
+            return {"engaged": self.engaged, "waiting": self.waiting, "total": self.total, "longest": self.longest}
+
+
+class DedupCache(object):
     """
         @author Ertl Marvin
-        @version 2016-12-07
+        @version 2016-12-17
 
-        This class inherits from threading.Thread and Stoppable, the class will listen for client, which try to connect
-        to the server and handel the threads, receiving form these threads and sending messages to these threads.
+        Remembers the ids of the last received messages, so a message, which a client sends again after a reconnect,
+        will only be sent once to all clients. The ids are kept in the order of their last use and the oldest will be
+        removed if there are more than size ids or if they are older than the window.
 
-            :ivar port:             The port on which the socket listen for clients
-            :ivar threads:          List of all connected threads to the server
-            :ivar queue:            The queue for the received messages
-            :ivar update:           Class for updating the gui
-            :ivar running:          Set if the run methode will listen for threads
-            :ivar serversocket:     The serversocket on which the server listen for clients
+            :ivar size:     Maximum number of ids
+            :ivar window:   Seconds how long an id will be remembered
+            :ivar entries:  OrderedDictionary with the id as key and the time as value
+            :ivar lock:     Lock for the entries
     """
 
-    def __init__(self, queue, update):
+    def __init__(self, size=65536, window=300):
         """
-        Initial the base class threading.Thread and Stoppable, also setup the port to 4242, running to true and all
-        other variables to the default value
-        :param queue: The queue for the receiving messages
-        :param update: Update class for making changes in the gui
+        Set the limits and create the empty entries
+        :param size: Maximum number of ids
+        :param window: Seconds how long an id will be remembered
+        """
+        self.size = size
+        self.window = window
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def seen(self, key):
+        """
+        Checks if the id was seen in the window and remembers it
+        :param key: The id of the message
+        :return: True if the message was already received, else False
+        """
+        now = time.monotonic()
+        with self.lock:
+            stamp = self.entries.get(key)
+            if stamp is not None and now - stamp <= self.window:
+                self.entries.move_to_end(key)
+                return True
+            self.entries[key] = now
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+            while self.entries:
+                oldest = next(iter(self.entries.values()))
+                if now - oldest <= self.window:
+                    break
+                self.entries.popitem(last=False)
+            return False
+
+    def __len__(self):
+        """
+        :return: Number of the remembered ids
+        """
+        return len(self.entries)
+
+    def snapshot(self):
+        """
+        :return: List with the ids and their times, the oldest first
+        """
+        with self.lock:
+            return list(self.entries.items())
+
+    def restore(self, entries, shift):
+        """
+        Adds the ids of a snapshot
+        :param entries: List with the ids and their times, the oldest first
+        :param shift: Seconds, which are added to the times, so they fit to time.monotonic of this process
+        :return: None
+        """
+        with self.lock:
+            for key, stamp in entries:
+                self.entries[key] = stamp + shift
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+class Presence(threading.Thread, Stoppable):
+    """
+        @author Ertl Marvin
+        @version 2016-12-21
+
+        This class inherits from threading.Thread and Stoppable, it tells the clients who is connected. A new client
+        gets the whole roster once, after that all clients only get the changes. The changes are collected for WINDOW
+        seconds and sent together in one presence message, a client which joins and leaves in the same window is not
+        sent at all, so many clients connecting at once don't cause a message for every client to every client.
+
+            :ivar model:    The Model, which sends the messages to the clients
+            :ivar roster:   Dictionary with the name of the client as key and the status as value
+            :ivar sent:     The roster as the clients know it, from the last presence message
+            :ivar changed:  Set of the names, which changed since the last presence message
+            :ivar joined:   List of the Recv objects, which need the whole roster
+            :ivar dirty:    Event, which will be set if something changed
+            :ivar running:  Set if the run method should wait for changes
+            :ivar lock:     Lock for the roster and the changes
+    """
+
+    WINDOW = 0.1
+
+    def __init__(self, model):
+        """
+        Initial the base class threading.Thread and create the empty roster
+        :param model: The Model, which sends the messages to the clients
         """
         threading.Thread.__init__(self)
-        self.port = 4242
-        self.threads = []
-        self.queue = queue
-        self.update = update
+        self.model = model
+        self.roster = {}
+        self.sent = {}
+        self.changed = set()
+        self.joined = []
+        self.dirty = threading.Event()
         self.running = True
-        self.serversocket = None
+        self.lock = threading.Lock()
 
-    def run(self):
+    def join_client(self, recv):
         """
-        The run methode will create a socket and listen for clients, if a client connects to the server, the client will
-        be added to the list threads and the server starts to recv messages from these connections, if the server
-        shuts down, the socket will be closed and all threads for the clients will be stopped.
+        Adds the client to the roster, it will get the whole roster with the next presence message
+        :param recv: The Recv object of the client
         :return: None
         """
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as self.serversocket:
-            self.serversocket.bind(("", self.port))
-            self.serversocket.listen(5)
-            try:
-                while self.running:
-                    con, addr = self.serversocket.accept()
-                    r = Recv(con, self.queue, "Client " + str(len(self.threads) + 1), self.update)
-                    r.start()
-                    self.threads += [r]
-                    self.update.set_client(r.name)
-            except socket.error as serr:
-                pass
+        self.set(recv.name, "online", recv)
 
-            for t in self.threads:
-                t.con.close()
-                t.stopping()
-                t.join()
+    def leave(self, name):
+        """
+        Removes the client from the roster
+        :param name: The name of the client
+        :return: None
+        """
+        self.set(name, None)
 
-    def send(self, text):
+    def set(self, name, status, recv=None):
+        """
+        Changes the status of the client, None removes it
+        :param name: The name of the client
+        :param status: The new status, online or away
+        :param recv: The Recv object of a new client, which needs the whole roster
+        :return: None
         """
-        Send the text messages to all clients. which are connect to the server
-        :param text:
-        :return:
+        with self.lock:
+            if status is None:
+                self.roster.pop(name, None)
+            else:
+                self.roster[name] = status
+            self.changed.add(name)
+            if recv is not None:
+                self.joined.append(recv)
+        self.dirty.set()
+
+    def run(self):
         """
-        for t in self.threads:
-            t.send(text)
+        Waits for changes, collects them for WINDOW seconds and sends them
+        :return: None
+        """
+        while self.running:
+            self.dirty.wait()
+            if not self.running:
+                break
+            time.sleep(self.WINDOW)
+            self.dirty.clear()
+            self.flush()
+
+    def flush(self):
+        """
+        Sends the roster to the new clients and the changes since the last presence message to all clients, if a
+        status is the same as in the last message, it will not be sent. The new clients get the roster before the
+        changes, so the changes are the same for every client.
+        :return: None
+        """
+        with self.lock:
+            joined, self.joined = self.joined, []
+            roster = dict(self.sent)
+            changes = {}
+            for name in self.changed:
+                status = self.roster.get(name)
+                if self.sent.get(name) != status:
+                    changes[name] = status
+                    if status is None:
+                        del self.sent[name]
+                    else:
+                        self.sent[name] = status
+            self.changed.clear()
+        if joined:
+            data = Protocol.encode({"type": "roster", "clients": roster})
+            for recv in joined:
+                try:
+                    recv.send(data)
+                except OSError:
+                    pass
+        if changes:
+            self.model.send({"type": "presence", "clients": changes})
 
     def stopping(self):
         """
-        Sets running to False, which stops the loop in the run method and closes the serversocket.
+        Sets running to False and wakes up the thread
         :return: None
         """
         self.running = False
-        self.serversocket.close()
+        self.dirty.set()
 
 
-class Recv(threading.Thread, Stoppable):
+class Ephemeral(threading.Thread, Stoppable):
     """
         @author Ertl Marvin
-        @version 2016-12-07
+        @version 2016-12-22
 
-        This class inherits from threading.Thread and Stoppable, the class will wait to receive messages from the
-        client, these messages will be put into the queue, so that it can be displayed by the update class
+        This class inherits from threading.Thread and Stoppable, it sends the ephemeral events like typing to the
+        clients. They don't go through the queue and Model.send, so they never delay the chat messages. Only the
+        latest event of every type per client is kept, if many events come in faster than they are sent, the old ones
+        are thrown away. If a client is just getting a chat message, the events are not sent to it at all.
 
-            :ivar running:          Set if the run methode will listen for threads
-            .ivar con:              Connection to the thread
-            :ivar queue:            The queue for the received messages
-            :ivar name:             Name of the client
-            :ivar update:           Class for updating the gui
+            :ivar model:    The Model with the connected clients
+            :ivar latest:   OrderedDictionary with the name of the client and the type as key and the last event as
+                            value
+            :ivar dirty:    Event, which will be set if there is a new event
+            :ivar running:  Set if the run method should wait for events
+            :ivar dropped:  Number of the events, which were not sent to a client
+            :ivar lock:     Lock for latest
     """
 
-    def __init__(self, con, queue, name, update):
+    WINDOW = 0.05
+
+    def __init__(self, model):
         """
-        Initial the threading.Thread class, set running to true and set the attributes to the given values
-        :param con: The connection to the thread
-        :param queue: The queue for the received messages
-        :param name: The name of the thread
-        :param update: Class update to make changes to the gui
+        Initial the base class threading.Thread and set the attributes
+        :param model: The Model with the connected clients
         """
         threading.Thread.__init__(self)
+        self.model = model
+        self.latest = collections.OrderedDict()
+        self.dirty = threading.Event()
         self.running = True
-        self.con = con
-        self.queue = queue
-        self.name = name
-        self.update = update
+        self.dropped = 0
+        self.lock = threading.Lock()
 
-    def stopping(self):
+    def post(self, message):
         """
-        Will set running to false, loop in run method will stop
+        Replaces the last event of the same client and type with this one
+        :param message: The event with the keys type and from
         :return: None
         """
-        self.running = False
+        with self.lock:
+            self.latest[(message["from"], message["type"])] = message
+        self.dirty.set()
 
     def run(self):
         """
-        Waits to get a messages from the client until running is False or the connections will be closed, if a messages
-        is received it wiil be put into the queue, so that the update class can display it in the gui, if the connection
-        is closed the name of the client will be removed from the connected clients list
+        Waits for events, collects them for WINDOW seconds and sends them
         :return: None
         """
         while self.running:
-            try:
-                data = self.con.recv(1024).decode()
-                if not data:
-                    self.con.close()
-                    break
-                self.queue.put(self.name + ": %s" % data)
-            except ConnectionResetError:
-                self.running = False
-                self.update.remove_client(self.name)
-            except ConnectionAbortedError:
-                pass
+            self.dirty.wait()
+            if not self.running:
+                break
+            time.sleep(self.WINDOW)
+            self.dirty.clear()
+            self.flush()
 
-    def send(self, text):
+    def flush(self):
         """
-        Sends the message to the client
-        :param text: The message, which will be sent do the client
+        Sends all collected events together to every client, which is not busy
         :return: None
         """
-        self.con.send(text.encode())
+        with self.lock:
+            events, self.latest = self.latest, collections.OrderedDict()
+        data = b"".join(Protocol.encode(message) for message in events.values())
+        for t in list(self.model.threads):
+            if not t.try_send(data):
+                self.dropped += len(events)
+
+    def stopping(self):
+        """
+        Sets running to False and wakes up the thread
+        :return: None
+        """
+        self.running = False
+        self.dirty.set()
 
 
-class View(QtGui.QMainWindow, ServerView.Ui_MainWindow):
+class Spool(object):
     """
         @author Ertl Marvin
-        @version 2016-12-07
+        @version 2016-12-23
 
-        This class inherits from the QtGui.QMainWindow and from ServerView.Ui_MainWindow,
-        this class will setup the view and connection and will wait for a client to connect to
+        A temporary file for the bytes of a sent file or of a large encoded message, so the server doesn't keep it in
+        the memory. It is written once and read for every client, the file will be closed and deleted when no one needs
+        it anymore.
 
-            :ivar queue:        The queue in which the received messages will be put
-            :ivar update:       Class update, which send the signal to the view
-            :ivar names:        List of the names of the connected clients
+            :ivar file:     The temporary file
+            :ivar size:     Number of the written bytes
+            :ivar refs:     Number of the users of the file
+            :ivar lock:     Lock for refs
     """
 
     def __init__(self):
         """
-        Initial the base class threading.Thread, set up the Ui, create the queues for the classes and connect the method
-        to the signal receiver, it will also start the update thread for updating the gui and will wait for a client
-        to connect to the serversocket
+        Creates the temporary file, tempfile is only imported when the first file is sent
         """
-        super(self.__class__, self).__init__()
-        self.setupUi(self)
-        self.queue = queue.Queue()
-        self.update = Update(self.queue)
-        self.connect(self.update, SIGNAL("add_post(QString)"), self.add_post)
-        self.connect(self.update, SIGNAL("set_client(QString)"), self.set_client)
-        self.connect(self.update, SIGNAL("remove_client(QString)"), self.remove_client)
-        self.update.start()
-        self.names = []
+        import tempfile
+        self.file = tempfile.TemporaryFile()
+        self.size = 0
+        self.refs = 1
+        self.lock = threading.Lock()
 
-    def add_post(self, text):
+    def write(self, data):
         """
-        Adds the received message to the text field in the gui
-        :param text: The messages which will be added
+        Appends the bytes to the file
+        :param data: The bytes
         :return: None
         """
-        self.textBrowser_2.append(str(text))
-        self.update.send(text)
+        self.file.write(data)
+        self.size += len(data)
 
-    def set_client(self, text):
+    def finish(self):
         """
-        Adds the name of the client to the connect clients field
-        :param text: The name of the client
+        Writes the buffer of the file to the disk, so it can be read with sendfile
         :return: None
         """
-        self.textBrowser.append(str(text))
-        self.names += [text]
+        self.file.flush()
 
-    def remove_client(self, text):
+    def read(self):
+        """
+        Reads the whole file without moving its position, only the links of the cluster need the bytes in the memory
+        :return: The bytes of the file
+        """
+        return os.pread(self.file.fileno(), self.size, 0)
+
+    def acquire(self):
         """
-        Removes the name of the disconnected client from the name list and also remove it from the gui
-        :param text: The name of the client which should be removed
+        Adds a user of the file
         :return: None
         """
-        name2 = []
-        for name in self.names:
-            if name != text:
-                name2 += [name]
-        self.names = name2
-        text2 = ""
-        for name in self.names:
-            text2 += name + "\n"
-        self.textBrowser.setText(text2)
-        for t in self.update.model.threads:
-            if t.name not in self.names:
-                self.update.model.threads.remove(t)
+        with self.lock:
+            self.refs += 1
 
-    def closeEvent(self, event):
+    def release(self):
         """
-        Overwritten closeEvent, will be called if the user exit the program, will put a False into the queue to stop all
-        threads and exit the program correctly
-        :param event: The event which will be given when the user exit the program
+        Removes a user of the file, the last one closes it
         :return: None
         """
-        self.queue.put(False)
+        with self.lock:
+            self.refs -= 1
+            if self.refs == 0:
+                self.file.close()
 
 
-def main():
+class Transfers(threading.Thread, Stoppable):
     """
-    Setups the app and view and display it
-    :return: None
+        @author Ertl Marvin
+        @version 2016-12-23
+
+        This class inherits from threading.Thread and Stoppable, it sends the received files to the clients. Every
+        client gets one chunk after the other, so the chat messages and other files go in between. The chunks are sent
+        with sendfile directly from the Spool, without reading them into the memory. If the Model or the Ephemeral
+        thread is sending to the client at the moment, the client will be skipped till the next round.
+
+            :ivar jobs:     Deque with [Recv, Spool, number, offset, announcement] for every client and file
+            :ivar next_id:  Number of the last file
+            :ivar wake:     Event, which will be set if there is a new job
+            :ivar running:  Set if the run method should send the files
+    """
+
+    CHUNK_SIZE = 65536
+
+    def __init__(self):
+        """
+        Initial the base class threading.Thread and set the attributes
+        """
+        threading.Thread.__init__(self)
+        self.jobs = collections.deque()
+        self.next_id = 0
+        self.wake = threading.Event()
+        self.running = True
+
+    def add(self, message, threads):
+        """
+        Sends the file to all clients, first a file message and then the chunks
+        :param message: The message of the Recv with from, name, size and the Spool
+        :param threads: List of the Recv objects of the clients
+        :return: None
+        """
+        self.next_id += 1
+        spool = message["spool"]
+        announcement = Protocol.encode({"type": "file", "from": message["from"], "file": self.next_id,
+                                        "name": message["name"], "size": spool.size})
+        for t in threads:
+            spool.acquire()
+            self.jobs.append([t, spool, self.next_id, 0, announcement])
+        spool.release()
+        self.wake.set()
+
+    def run(self):
+        """
+        Sends one chunk of the first job and puts the job to the end of the deque, if the file isn't sent completely
+        :return: None
+        """
+        while self.running:
+            if not self.jobs:
+                self.wake.wait()
+                self.wake.clear()
+                continue
+            job = self.jobs.popleft()
+            if self.step(job):
+                job[1].release()
+            else:
+                self.jobs.append(job)
+                if job[0].lock.locked():
+                    time.sleep(0.001)
+        while self.jobs:
+            self.jobs.popleft()[1].release()
+
+    def step(self, job):
+        """
+        Sends the announcement or the next chunk of the job to the client
+        :param job: The job
+        :return: True if the job is done, also if the connection is closed
+        """
+        recv, spool, file_id, offset, announcement = job
+        if not recv.lock.acquire(blocking=False):
+            return False
+        try:
+            if announcement is not None:
+                recv.write(announcement)
+                job[4] = None
+            count = min(self.CHUNK_SIZE, spool.size - offset)
+            if count > 0:
+                recv.write(Protocol.chunk_header(file_id, count))
+                recv.write_file(spool.file, offset, count)
+                job[3] = offset + count
+            return job[3] >= spool.size
+        except (OSError, ValueError):
+            return True
+        finally:
+            recv.lock.release()
+
+    def stopping(self):
+        """
+        Sets running to False and wakes up the thread
+        :return: None
+        """
+        self.running = False
+        self.wake.set()
+
+
+class Cluster(threading.Thread, Stoppable):
     """
-    app = QtGui.QApplication(sys.argv)
-    form = View()
-    form.show()
-    app.exec_()
+        @author Ertl Marvin
+        @version 2016-12-24
+
+        This class inherits from threading.Thread and Stoppable, it links the server with other servers, so the clients
+        of all servers see all messages. The server connects to its peers and sends a link message, the connection is
+        read like a client, but its messages are batches of chat messages of the other servers. Every message gets the
+        node, where it was sent first, and a number, every server sends it on to its other links once, a message which
+        comes back over another link is found in the DedupCache and thrown away. The messages for a link are collected
+        for WINDOW seconds and sent together in one batch. The messages of the rooms are only sent to one node, for
+        this every server should be linked with every other server. A link is only accepted with the shared secret
+        or, without a secret, from the address of a peer, so nobody else can send messages with any name.
+
+            :ivar model:    The Model of the server
+            :ivar node:     Name of this server in the cluster
+            :ivar peers:    List of host:port of the servers, to which this server connects
+            :ivar links:    Dictionary with the Recv objects of the links as key and a deque of the messages for it
+            :ivar outgoing: Dictionary with host:port as key and the Recv object of the link, which this server opened
+            :ivar seen:     DedupCache with the node and number of the messages, which were already sent
+            :ivar secret:   Shared secret of the servers in the cluster, None to accept only links from the peers
+            :ivar proofs:   DedupCache with the proofs of the accepted links, so a link message can't be sent again
+            :ivar prefix:   Start of the number of the messages, so they are new after a restart of the server
+            :ivar count:    Number of the last message of this server
+            :ivar wake:     Event, which will be set if there are messages for the links
+            :ivar running:  Set if the run method should send the batches
+            :ivar lock:     Lock for links
+    """
+
+    WINDOW = 0.005
+    BATCH = 256
+    RETRY = 1.0
+    SKEW = 60
+
+    def __init__(self, model, node, peers=()):
+        """
+        Initial the base class threading.Thread and set the attributes
+        :param model: The Model of the server
+        :param node: Name of this server in the cluster
+        :param peers: List of host:port of the servers, to which this server connects
+        """
+        threading.Thread.__init__(self)
+        self.model = model
+        self.node = node
+        self.peers = list(peers)
+        self.links = {}
+        self.outgoing = {}
+        self.seen = DedupCache()
+        self.secret = None
+        self.proofs = DedupCache(window=2 * self.SKEW)
+        self.prefix = "%x:" % time.time_ns()
+        self.count = 0
+        self.wake = threading.Event()
+        self.running = True
+        self.lock = threading.Lock()
+
+    def run(self):
+        """
+        Connects to the peers, again every RETRY seconds if a link is lost, and sends the collected messages
+        :return: None
+        """
+        retry = 0
+        while self.running:
+            if time.monotonic() >= retry:
+                self.connect()
+                retry = time.monotonic() + self.RETRY
+            if self.wake.wait(self.RETRY) and self.running:
+                time.sleep(self.WINDOW)
+                self.wake.clear()
+                self.flush()
+        for recv in list(self.links):
+            recv.stopping()
+            recv.close()
+
+    def connect(self):
+        """
+        Opens the links to the peers, which are not connected
+        :return: None
+        """
+        for peer in self.peers:
+            recv = self.outgoing.get(peer)
+            if recv is not None and recv.running:
+                continue
+            host, port = peer.rsplit(":", 1)
+            try:
+                con = socket.create_connection((host, int(port)), timeout=self.RETRY)
+                con.settimeout(None)
+                con.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                con.sendall(Protocol.encode(self.hello()))
+            except OSError:
+                continue
+            recv = Recv(con, self.model.queue, "Link " + peer, self.model.update, cluster=self)
+            recv.link = peer
+            self.outgoing[peer] = recv
+            with self.lock:
+                self.links[recv] = collections.deque()
+            self.model.read(recv)
+
+    def hello(self):
+        """
+        :return: The link message of this server, with a secret it has a random nonce, the time and the HMAC of them
+        """
+        message = {"type": "link", "node": self.node}
+        if self.secret is not None:
+            message["nonce"] = os.urandom(8).hex()
+            message["time"] = time.time()
+            message["proof"] = self.proof(self.node, message["nonce"], message["time"])
+        return message
+
+    def proof(self, node, nonce, stamp):
+        """
+        :param node: Name of the server
+        :param nonce: Random string of the link message
+        :param stamp: Time of the link message
+        :return: HMAC of the values with the secret as hex string
+        """
+        import hmac
+        return hmac.new(self.secret.encode(), ("%s|%s|%r" % (node, nonce, stamp)).encode(), hashlib.sha256).hexdigest()
+
+    def trusted(self, recv, message):
+        """
+        Checks the link message of a connection, a refused link is written to stderr, so a server with a wrong secret
+        or without the peer can be found
+        :param recv: The Recv object of the connection
+        :param message: The link message
+        :return: True if the connection can become a link
+        """
+        if self.check(recv, message):
+            return True
+        try:
+            address = "%s:%d" % recv.con.getpeername()[:2]
+        except OSError:
+            address = "?"
+        print("Link von %s (%s) abgelehnt, %s" % (message.get("node"), address, "falsches oder altes Geheimnis"
+                                                  if self.secret is not None else "die Adresse ist kein --peer"),
+              file=sys.stderr, flush=True)
+        return False
+
+    def check(self, recv, message):
+        """
+        With a secret the link message must have the right proof, which is not older than SKEW seconds and was not
+        used before, without a secret the connection must come from a peer.
+        :param recv: The Recv object of the connection
+        :param message: The link message
+        :return: True if the connection can become a link
+        """
+        if self.secret is None:
+            try:
+                return recv.con.getpeername()[0] in self.addresses()
+            except OSError:
+                return False
+        nonce = message.get("nonce")
+        stamp = message.get("time")
+        proof = message.get("proof")
+        if not isinstance(nonce, str) or not isinstance(stamp, (int, float)) or not isinstance(proof, str) or \
+                abs(time.time() - stamp) > self.SKEW:
+            return False
+        import hmac
+        if not hmac.compare_digest(self.proof(str(message.get("node")), nonce, stamp), proof):
+            return False
+        return not self.proofs.seen(proof)
+
+    def addresses(self):
+        """
+        :return: Set of the ip addresses of the peers
+        """
+        addresses = set()
+        for peer in self.peers:
+            try:
+                addresses.update(info[4][0] for info in socket.getaddrinfo(peer.rsplit(":", 1)[0], None))
+            except OSError:
+                pass
+        return addresses
+
+    def accept(self, recv, node):
+        """
+        Turns a connection into a link, because it sent a link message, usually it was never added to the clients,
+        else it is removed from them
+        :param recv: The Recv object of the connection
+        :param node: Name of the other server
+        :return: None
+        """
+        if recv in self.model.threads:
+            self.model.threads.remove(recv)
+            if recv.presence is not None:
+                recv.presence.leave(recv.name)
+            self.model.update.remove_client(recv.name)
+        recv.link = str(node)
+        recv.name = "Link " + recv.link
+        with self.lock:
+            self.links[recv] = collections.deque()
+        try:
+            recv.send(Protocol.encode({"type": "link", "node": self.node}))
+        except OSError:
+            pass
+        self.model.rooms.add_node(recv.link)
+
+    def named(self, recv, node):
+        """
+        Will be called, if the server of a link, which this server opened, sent its name
+        :param recv: The Recv object of the link
+        :param node: Name of the other server
+        :return: None
+        """
+        recv.link = str(node)
+        self.model.rooms.add_node(recv.link)
+
+    def detach(self, recv):
+        """
+        Removes a closed link
+        :param recv: The Recv object of the link
+        :return: None
+        """
+        with self.lock:
+            self.links.pop(recv, None)
+            linked = any(other.link == recv.link for other in self.links)
+        if not linked:
+            self.model.rooms.remove_node(recv.link)
+
+    def unicast(self, node, item):
+        """
+        Sends the item with the next batch to the node, it is lost if the node is not linked
+        :param node: Name of the node
+        :param item: The room message
+        :return: None
+        """
+        with self.lock:
+            for recv, outbox in self.links.items():
+                if recv.link == node:
+                    outbox.append(item)
+                    break
+        self.wake.set()
+
+    def publish(self, message, relay=None):
+        """
+        Sends the chat message to all links, but not back over the link where it came from. A message of a client of
+        this server gets the node and a number, the name of the client gets the node, so the other servers can tell
+        the clients apart. Files stay on this server, the text of a large message is read from its Spool.
+        :param message: The message, which was sent to the clients of this server
+        :param relay: None for a message of a client of this server, else [node, number, link] of the other server
+        :return: None
+        """
+        if message.get("type") != "msg" or "spool" in message:
+            return
+        if "frame" in message:
+            message = dict(message, text=Protocol.FrameReader().feed(message["frame"].read())[0]["text"])
+        if relay is None:
+            self.count += 1
+            relay = [self.node, self.prefix + str(self.count), None]
+            self.seen.seen((relay[0], relay[1]))
+            message = dict(message, **{"from": "%s@%s" % (message["from"], self.node)})
+        forward = {"type": "msg", "from": message["from"], "text": message["text"], "origin": relay[0],
+                   "mid": relay[1]}
+        with self.lock:
+            for recv, outbox in self.links.items():
+                if recv.link != relay[2]:
+                    outbox.append(forward)
+        self.wake.set()
+
+    def receive(self, recv, messages):
+        """
+        Puts the messages of a batch into the queue, the messages which were already sent are thrown away, the room
+        messages are given to the Rooms
+        :param recv: The Recv object of the link
+        :param messages: List of the messages of the batch
+        :return: None
+        """
+        if not isinstance(messages, list):
+            return
+        for message in messages:
+            if not isinstance(message, dict):
+                continue
+            if message.get("type") == "room":
+                self.model.rooms.handle(message)
+                continue
+            if not isinstance(message.get("text"), str):
+                continue
+            key = (str(message.get("origin")), str(message.get("mid")))
+            if key[0] == self.node or self.seen.seen(key):
+                continue
+            post = {"type": "msg", "from": str(message.get("from")), "text": message["text"]}
+            if len(post["text"]) > recv.SPOOL_SIZE:
+                post = recv.spool(post)
+            post["cluster"] = [key[0], key[1], recv.link]
+            recv.put(post)
+
+    def flush(self):
+        """
+        Sends the collected messages to the links, at most BATCH messages in one batch and a batch ends after the
+        texts are longer than SPOOL_SIZE of Recv, so even large messages fit into a frame
+        :return: None
+        """
+        with self.lock:
+            batches = [(recv, list(outbox)) for recv, outbox in self.links.items() if outbox]
+            for outbox in self.links.values():
+                outbox.clear()
+        for recv, messages in batches:
+            batch = []
+            size = 0
+            for index, message in enumerate(messages):
+                batch.append(message)
+                size += len(message.get("text") or "")
+                if len(batch) < self.BATCH and size <= Recv.SPOOL_SIZE and index < len(messages) - 1:
+                    continue
+                try:
+                    recv.send(Protocol.encode({"type": "batch", "messages": batch}))
+                except OSError:
+                    break
+                batch = []
+                size = 0
+
+    def stopping(self):
+        """
+        Sets running to False and wakes up the thread
+        :return: None
+        """
+        self.running = False
+        self.wake.set()
+
+
+class HashRing(object):
+    """
+        @author Ertl Marvin
+        @version 2016-12-27
+
+        Consistent hashing for the rooms in the cluster. Every node gets VNODES points on a ring of 64 bit numbers, a
+        room belongs to the node of the next point after the hash of its name. So the rooms are spread evenly over the
+        nodes and if a node comes or goes, only the rooms of this node move to another node.
+
+            :ivar points:   Sorted list of the points on the ring
+            :ivar owners:   List with the node of every point, in the same order as points
+            :ivar nodes:    Set of the nodes
+    """
+
+    VNODES = 64
+
+    def __init__(self, nodes=()):
+        """
+        Creates the ring with the nodes
+        :param nodes: The names of the nodes
+        """
+        self.points = []
+        self.owners = []
+        self.nodes = set()
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def hash(key):
+        """
+        :param key: A string
+        :return: The position of the string on the ring
+        """
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    def add(self, node):
+        """
+        Adds the node with VNODES points to the ring
+        :param node: The name of the node
+        :return: None
+        """
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for i in range(self.VNODES):
+            point = self.hash("%s#%d" % (node, i))
+            index = bisect.bisect(self.points, point)
+            self.points.insert(index, point)
+            self.owners.insert(index, node)
+
+    def remove(self, node):
+        """
+        Removes the node and its points from the ring
+        :param node: The name of the node
+        :return: None
+        """
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        keep = [i for i, owner in enumerate(self.owners) if owner != node]
+        self.points = [self.points[i] for i in keep]
+        self.owners = [self.owners[i] for i in keep]
+
+    def lookup(self, key):
+        """
+        :param key: The name of the room
+        :return: The node, to which the room belongs
+        """
+        index = bisect.bisect(self.points, self.hash(key)) % len(self.points)
+        return self.owners[index]
+
+
+class Rooms(object):
+    """
+        @author Ertl Marvin
+        @version 2016-12-27
+
+        The rooms of the chat, the lobby is not a room, its messages go to all clients like before. Every room has a
+        home node, which is chosen by the HashRing, only the home knows which nodes have members of the room and keeps
+        the last HISTORY messages. A message for a room goes to its home, the home sends it to the nodes with members
+        and every node sends it to its members. Without cluster this server is the home of all rooms. If a node comes
+        or goes, the nodes tell the new homes about their members and the old homes give their history to them.
+
+            :ivar model:    The Model of the server
+            :ivar ring:     The HashRing with this node and the linked nodes
+            :ivar members:  Dictionary with the room as key and the set of the Recv objects of the members on this node
+            :ivar homes:    Dictionary with the room as key and the home, at which this node is registered
+            :ivar state:    Dictionary with the room as key and [set of the nodes with members, deque of the messages,
+                            number of the last message] for the rooms, of which this node is the home, every message
+                            of a room gets the next number as seq, so a client can ask only for the newer messages
+            :ivar empty:    OrderedDictionary with the rooms without members as key, a room keeps its history, when
+                            the last member leaves, only the oldest of more than MAX_EMPTY such rooms are forgotten
+            :ivar lock:     Lock for the rooms
+    """
+
+    LOBBY = "lobby"
+    HISTORY = 50
+    MAX_NAME = 64
+    MAX_EMPTY = 1000
+
+    def __init__(self, model):
+        """
+        Set the attributes
+        :param model: The Model of the server
+        """
+        self.model = model
+        self.ring = HashRing([self.node])
+        self.members = {}
+        self.homes = {}
+        self.state = {}
+        self.empty = collections.OrderedDict()
+        self.lock = threading.RLock()
+
+    @property
+    def node(self):
+        """
+        :return: The name of this node
+        """
+        return self.model.cluster.node if self.model.cluster is not None else "local"
+
+    def join(self, recv, room, since=None):
+        """
+        Adds the client to the room, the client gets the history of the room from the home
+        :param recv: The Recv object of the client
+        :param room: The name of the room
+        :param since: The seq of the last message, which the client has, only newer messages are in the history
+        :return: None
+        """
+        with self.lock:
+            self.members.setdefault(room, set()).add(recv)
+            recv.rooms.add(room)
+            home = self.homes[room] = self.ring.lookup(room)
+            self.route(home, {"type": "room", "op": "join", "room": room, "node": self.node, "client": recv.name,
+                              "since": since})
+
+    def leave(self, recv, room):
+        """
+        Removes the client from the room, if it was the last member on this node, the home forgets this node
+        :param recv: The Recv object of the client
+        :param room: The name of the room
+        :return: None
+        """
+        with self.lock:
+            recv.rooms.discard(room)
+            members = self.members.get(room)
+            if members is None or recv not in members:
+                return
+            members.discard(recv)
+            if not members:
+                del self.members[room]
+                self.route(self.homes.pop(room), {"type": "room", "op": "leave", "room": room, "node": self.node})
+
+    def left(self, recv):
+        """
+        Removes the closed client from all its rooms
+        :param recv: The Recv object of the client
+        :return: None
+        """
+        for room in list(recv.rooms):
+            self.leave(recv, room)
+
+    def publish(self, message, sender=None):
+        """
+        Sends the message of a client of this node to the home of its room, the home sends the serial and the id back
+        with the message, so the copy for the sender gets the id
+        :param message: The message with from, text and room
+        :param sender: List with the serial of the Recv and the id of the message, None if the message has no id
+        :return: None
+        """
+        name = message["from"]
+        if self.model.cluster is not None:
+            name = "%s@%s" % (name, self.node)
+        item = {"type": "room", "op": "msg", "room": message["room"], "from": name, "text": message["text"]}
+        if sender is not None:
+            item["sender"] = [self.node] + list(sender)
+        with self.lock:
+            self.route(self.ring.lookup(message["room"]), item)
+
+    def route(self, node, item):
+        """
+        Handles the item, if it is for this node, else it will be sent over the link to the node
+        :param node: The name of the node
+        :param item: The room message for the node
+        :return: None
+        """
+        if node == self.node:
+            self.handle(item)
+        elif self.model.cluster is not None:
+            self.model.cluster.unicast(node, item)
+
+    def fetch(self, recv, room):
+        """
+        Asks the home of the room for its history, the client must be a member of the room
+        :param recv: The Recv object of the client
+        :param room: The name of the room
+        :return: None
+        """
+        with self.lock:
+            home = self.homes.get(room)
+            if home is not None:
+                self.route(home, {"type": "room", "op": "fetch", "room": room, "node": self.node, "client": recv.name})
+
+    def room_state(self, room):
+        """
+        :param room: The name of the room
+        :return: The state of the room, it is created, if this node doesn't have it yet
+        """
+        state = self.state.get(room)
+        if state is None:
+            state = self.state[room] = [set(), collections.deque(maxlen=self.HISTORY), 0]
+        return state
+
+    def park(self, room):
+        """
+        Keeps the room without members, the oldest rooms without members are forgotten, if there are more than
+        MAX_EMPTY, the lock must be held
+        :param room: The name of the room
+        :return: None
+        """
+        self.empty[room] = None
+        self.empty.move_to_end(room)
+        while len(self.empty) > self.MAX_EMPTY:
+            self.state.pop(self.empty.popitem(last=False)[0], None)
+
+    @staticmethod
+    def newer(state, since):
+        """
+        :param state: The state of the room
+        :param since: The seq of the last message, which the client has, None for all messages
+        :return: List with the messages, which are newer than since, all messages if since is newer than the last
+                 message, because then the room was created again
+        """
+        if not isinstance(since, int) or since > state[2]:
+            return list(state[1])
+        return [message for message in state[1] if message.get("seq", 0) > since]
+
+    def handle(self, item):
+        """
+        Handles a room message of this or another node. As home: join, leave, msg, fetch of the history and handover,
+        which is the state of a room from the old home. As node with members: deliver a message to the members and
+        history for a client.
+        :param item: The room message
+        :return: None
+        """
+        op = item.get("op")
+        room = item.get("room")
+        with self.lock:
+            if op == "join":
+                state = self.room_state(room)
+                state[0].add(item.get("node"))
+                self.empty.pop(room, None)
+                if item.get("client") is not None:
+                    self.route(item.get("node"), {"type": "room", "op": "history", "room": room,
+                                                  "client": item.get("client"), "seq": state[2],
+                                                  "messages": self.newer(state, item.get("since"))})
+            elif op == "fetch":
+                state = self.state.get(room)
+                self.route(item.get("node"), {"type": "room", "op": "history", "room": room,
+                                              "client": item.get("client"), "seq": state[2] if state is not None else 0,
+                                              "messages": list(state[1]) if state is not None else []})
+            elif op == "leave":
+                state = self.state.get(room)
+                if state is not None:
+                    state[0].discard(item.get("node"))
+                    if not state[0]:
+                        self.park(room)
+            elif op == "msg":
+                state = self.room_state(room)
+                state[2] += 1
+                state[1].append({"from": item.get("from"), "text": item.get("text"), "seq": state[2]})
+                for node in list(state[0]):
+                    self.route(node, {"type": "room", "op": "deliver", "room": room, "from": item.get("from"),
+                                      "text": item.get("text"), "seq": state[2], "sender": item.get("sender")})
+            elif op == "handover":
+                state = self.room_state(room)
+                state[0].update(item.get("nodes", []))
+                if state[0]:
+                    self.empty.pop(room, None)
+                else:
+                    self.park(room)
+                history = list(item.get("messages", [])) + list(state[1])
+                state[1].clear()
+                state[1].extend(history[-self.HISTORY:])
+                state[2] = max([state[2], item.get("seq", 0)] + [m.get("seq", 0) for m in history])
+            elif op == "deliver":
+                message = {"type": "msg", "room": room, "from": item.get("from"), "text": item.get("text"),
+                           "seq": item.get("seq")}
+                data = Protocol.encode(message)
+                sender = item.get("sender")
+                if not isinstance(sender, list) or len(sender) != 3 or sender[0] != self.node:
+                    sender = None
+                for recv in list(self.members.get(room, ())):
+                    try:
+                        if sender is not None and recv.serial == sender[1]:
+                            recv.send(Protocol.encode(dict(message, id=sender[2])))
+                        else:
+                            recv.send(data)
+                    except OSError:
+                        pass
+            elif op == "history":
+                data = Protocol.encode({"type": "history", "room": room, "seq": item.get("seq", 0),
+                                        "messages": item.get("messages", [])})
+                for recv in list(self.members.get(room, ())):
+                    if recv.name == item.get("client"):
+                        try:
+                            recv.send(data)
+                        except OSError:
+                            pass
+
+    def snapshot(self):
+        """
+        :return: Dictionary with the room as key and the list of the messages and the seq of the last message, for the
+                 rooms, of which this node is the home
+        """
+        with self.lock:
+            return {room: (list(state[1]), state[2]) for room, state in self.state.items()}
+
+    def restore(self, rooms):
+        """
+        Takes the rooms of a snapshot, the nodes with members register again, when their clients join
+        :param rooms: Dictionary with the room as key and the list of the messages and the seq of the last message
+        :return: None
+        """
+        with self.lock:
+            for room, (messages, seq) in rooms.items():
+                state = self.room_state(room)
+                state[1].extend(messages)
+                state[2] = max(state[2], seq)
+                if not state[0]:
+                    self.park(room)
+
+    def add_node(self, node):
+        """
+        Adds a linked node to the ring
+        :param node: The name of the node
+        :return: None
+        """
+        with self.lock:
+            if node not in self.ring.nodes:
+                self.ring.add(node)
+                self.rebalance()
+
+    def remove_node(self, node):
+        """
+        Removes a node, which is not linked anymore, from the ring
+        :param node: The name of the node
+        :return: None
+        """
+        with self.lock:
+            if node in self.ring.nodes and node != self.node:
+                self.ring.remove(node)
+                self.rebalance()
+
+    def rebalance(self):
+        """
+        Registers the members of this node at the new homes of their rooms and gives the rooms, of which this node is
+        not the home anymore, to their new home
+        :return: None
+        """
+        for room in list(self.members):
+            home = self.ring.lookup(room)
+            if self.homes.get(room) != home:
+                self.homes[room] = home
+                self.route(home, {"type": "room", "op": "join", "room": room, "node": self.node, "client": None})
+        for room, state in list(self.state.items()):
+            home = self.ring.lookup(room)
+            if home != self.node:
+                del self.state[room]
+                self.empty.pop(room, None)
+                self.route(home, {"type": "room", "op": "handover", "room": room, "nodes": list(state[0]),
+                                  "messages": list(state[1]), "seq": state[2]})
+
+
+class Commands(Plugins.Plugin):
+    """
+        @author Ertl Marvin
+        @version 2016-12-29
+
+        The first plugin of the pipeline, a text which starts with / is a command and is not sent to the other clients.
+        The command is parsed once and looked up in the dictionary table, the answer is a reply message only for the
+        client, which sent the command, so commands never go through the queue, the gui or the other clients. A text
+        which starts with // is a normal message, which starts with /.
+
+            /nick NAME          changes the name of the client, the messages of its mailbox are sent to it
+            /join ROOM          joins the room
+            /msg NAME TEXT      sends the text only to the client NAME, or into its mailbox if it is not connected
+            /who [ROOM]         the clients with their status, or the members of the room on this server
+            /history [ROOM]     the last messages of the room, the room of the command if none is given
+
+            :ivar model:    The Model of the server
+            :ivar table:    Dictionary with the name of the command as key and its function as value
+    """
+
+    MAX_NAME = 32
+
+    def __init__(self, model):
+        """
+        Set the attributes and the table of the commands
+        :param model: The Model of the server
+        """
+        self.model = model
+        self.table = {"nick": self.nick, "join": self.join, "msg": self.msg, "who": self.who, "history": self.history}
+
+    def process(self, recv, message):
+        """
+        Executes the command and sends the reply to the client
+        :param recv: The Recv object of the client, which sent the message
+        :param message: The message with from, text and maybe room
+        :return: The message if it is no command, else None
+        """
+        text = message["text"]
+        if not text.startswith("/"):
+            return message
+        if text.startswith("//"):
+            message["text"] = text[1:]
+            return message
+        name, _, args = text[1:].partition(" ")
+        command = self.table.get(name)
+        try:
+            if command is None:
+                raise ValueError("Unbekannter Befehl: /%s" % name)
+            reply = command(recv, args.strip(), message)
+        except ValueError as e:
+            reply = {"error": str(e)}
+        if reply is not None:
+            reply.update({"type": "reply", "command": name})
+            try:
+                recv.send(Protocol.encode(reply))
+            except OSError:
+                pass
+        return None
+
+    def find(self, name):
+        """
+        :param name: The name of a client
+        :return: The Recv object of the client on this server, None if it is not connected
+        """
+        for t in list(self.model.threads):
+            if t.name == name and t.link is None:
+                return t
+        return None
+
+    def room(self, name):
+        """
+        Checks the name of a room
+        :param name: The name of the room
+        :return: The name of the room
+        """
+        if not name or len(name) > Rooms.MAX_NAME or name == Rooms.LOBBY:
+            raise ValueError("Ungültiger Raum: %s" % name)
+        return name
+
+    def nick(self, recv, args, message):
+        """
+        Changes the name of the client, the other clients see it leave and join with the new name
+        :param recv: The Recv object of the client
+        :param args: The new name
+        :param message: The message with the command
+        :return: The reply
+        """
+        if self.model.login is not None:
+            raise ValueError("Mit Anmeldung kann der Name nicht geändert werden")
+        if not self.valid(args):
+            raise ValueError("Ungültiger Name: %s" % args)
+        if self.find(args) is not None:
+            raise ValueError("Der Name %s ist vergeben" % args)
+        old = recv.name
+        status = self.model.presence.roster.get(old, "online")
+        recv.name = args
+        if recv.limiter is not None:
+            recv.limiter.rename(old, args)
+        self.model.presence.leave(old)
+        self.model.presence.set(args, status)
+        self.model.update.set_client(args)
+        self.model.update.remove_client(old)
+        return {"text": "Du heißt jetzt %s" % args, "name": args, "mailbox": self.mailbox(recv)}
+
+    @classmethod
+    def valid(cls, name):
+        """
+        :param name: A name, which a client wants
+        :return: True if the name has no spaces and no @ and can't be mixed up with the names of the server
+        """
+        return 0 < len(name) <= cls.MAX_NAME and not any(c.isspace() for c in name) and "@" not in name and \
+            not name.startswith(("Client ", "Link "))
+
+    def mailbox(self, recv):
+        """
+        Registers the name of the client as user and sends the messages of its mailbox
+        :param recv: The Recv object of the client
+        :return: Number of the sent messages, None without mailboxes
+        """
+        if self.model.mailboxes is None:
+            return None
+        self.model.mailboxes.seen(recv.name)
+        try:
+            return self.model.mailboxes.deliver(recv.name, recv.send)
+        except OSError:
+            return 0
+
+    def join(self, recv, args, message):
+        """
+        Adds the client to the room
+        :param recv: The Recv object of the client
+        :param args: The name of the room
+        :param message: The message with the command
+        :return: The reply
+        """
+        room = self.room(args)
+        self.model.rooms.join(recv, room)
+        return {"text": "Raum %s betreten" % room, "room": room}
+
+    def msg(self, recv, args, message):
+        """
+        Sends the text only to one client of this server, the name can contain spaces like the names of the server, so
+        the longest name of a client at the start is taken. If the client is not connected, but has a mailbox, the
+        text is put into the mailbox
+        :param recv: The Recv object of the client
+        :param args: The name of the receiver and the text
+        :param message: The message with the command
+        :return: The reply
+        """
+        targets = [t for t in list(self.model.threads) if t.link is None and args.startswith(t.name + " ")]
+        if not targets:
+            name, _, text = args.partition(" ")
+            if not text:
+                raise ValueError("/msg NAME TEXT")
+            if self.model.mailboxes is None or not self.model.mailboxes.known(name):
+                raise ValueError("%s ist nicht verbunden" % name)
+            self.model.mailboxes.put(name, recv.name, text)
+            return {"text": "%s ist nicht verbunden, die Nachricht wurde gespeichert" % name, "to": name,
+                    "stored": True}
+        target = max(targets, key=lambda t: len(t.name))
+        name, text = target.name, args[len(target.name) + 1:]
+        try:
+            target.send(Protocol.encode({"type": "msg", "from": recv.name, "text": text, "to": name}))
+        except OSError:
+            raise ValueError("%s ist nicht verbunden" % name)
+        return {"text": "An %s: %s" % (name, text), "to": name}
+
+    def who(self, recv, args, message):
+        """
+        :param recv: The Recv object of the client
+        :param args: The name of a room or nothing
+        :param message: The message with the command
+        :return: The reply with the clients and their status
+        """
+        roster = dict(self.model.presence.roster)
+        if args:
+            members = {t.name for t in list(self.model.rooms.members.get(self.room(args), ()))}
+            roster = {name: status for name, status in roster.items() if name in members}
+        return {"text": ", ".join("%s (%s)" % item for item in sorted(roster.items())), "clients": roster}
+
+    def history(self, recv, args, message):
+        """
+        Asks the home of the room for its last messages, they come as history message, only members of the room get it
+        :param recv: The Recv object of the client
+        :param args: The name of the room, if empty the room of the message
+        :param message: The message with the command
+        :return: None, the history is the reply
+        """
+        room = self.room(args or message.get("room", ""))
+        if room not in recv.rooms:
+            raise ValueError("Du bist nicht im Raum %s" % room)
+        self.model.rooms.fetch(recv, room)
+        return None
+
+
+class Login(object):
+    """
+        @author Ertl Marvin
+        @version 2016-12-30
+
+        The login of the clients, if the server has accounts. A new connection is not added to the clients, till it
+        sent a login message, which the Auth.Authenticator accepted, it gets the name of the account. The messages,
+        which the client sends before, wait in the backlog of the Recv object and are handled after the login. The
+        result of the Authenticator is given back to the Recv, so the login is finished by the thread or the worker of
+        the connection and not by the thread of the pool. A connection, which doesn't log in within TIMEOUT seconds, is
+        closed.
+
+            :ivar model:    The Model of the server
+            :ivar auth:     The Auth.Authenticator, which checks the logins
+            :ivar waiting:  Dictionary with the Recv objects, which are not logged in yet, and the time of their connect
+            :ivar started:  Set of the Recv objects, whose login is checked at the moment
+            :ivar lock:     Lock for waiting and started
+    """
+
+    TIMEOUT = 30
+    BACKLOG = 64
+
+    def __init__(self, model, auth):
+        """
+        Set the attributes
+        :param model: The Model of the server
+        :param auth: The Auth.Authenticator
+        """
+        self.model = model
+        self.auth = auth
+        self.waiting = {}
+        self.started = set()
+        self.lock = threading.Lock()
+
+    def wait(self, recv):
+        """
+        Lets the new connection wait for its login, the connections, which waited longer than TIMEOUT, are closed
+        :param recv: The Recv object of the connection
+        :return: None
+        """
+        now = time.monotonic()
+        recv.backlog = []
+        with self.lock:
+            expired = [r for r, since in self.waiting.items() if now - since > self.TIMEOUT]
+            self.waiting[recv] = now
+        for r in expired:
+            r.kick()
+
+    def forget(self, recv):
+        """
+        Removes the connection from the waiting connections, because it was closed or is a link of the cluster
+        :param recv: The Recv object of the connection
+        :return: None
+        """
+        with self.lock:
+            self.waiting.pop(recv, None)
+            self.started.discard(recv)
+        recv.backlog = None
+
+    def start(self, recv, message):
+        """
+        Gives the login message to the Authenticator, a second login during the check is ignored. The result is given
+        to logged_in of the Recv, which only hands it over, because it can be called by the pool.
+        :param recv: The Recv object of the connection
+        :param message: The login message
+        :return: True if the login was started, False if it was ignored
+        """
+        with self.lock:
+            if recv not in self.waiting or recv in self.started:
+                return False
+            self.started.add(recv)
+        name = message.get("name")
+        if message.get("token") is None and isinstance(name, str) and not Commands.valid(name):
+            recv.logged_in((None, None, "Ungültiger Name: %s" % name, False))
+            return True
+        self.auth.login(message, lambda name, token, error, retry: recv.logged_in((name, token, error, retry)))
+        return True
+
+    def finish(self, recv, name, token, error, retry):
+        """
+        Sends the result of the login to the client, it is called by the thread or the worker of the connection. After
+        a successful login an older connection of the same user is closed, the client is added to the clients, gets its
+        mailbox and the messages of its backlog are handled. After a failed login the connection is closed, except if
+        only the token was not valid.
+        :param recv: The Recv object of the connection
+        :param name: The name of the user, None if the login failed
+        :param token: The token for the next login
+        :param error: Why the login failed, None if it was successful
+        :param retry: True if the client can try it again with the password
+        :return: None
+        """
+        with self.lock:
+            self.started.discard(recv)
+            if error is None:
+                self.waiting.pop(recv, None)
+        if error is not None:
+            try:
+                recv.send(Protocol.encode({"type": "login", "ok": False, "error": error, "retry": retry}))
+            except OSError:
+                pass
+            if not retry:
+                recv.kick()
+            return
+        for other in list(self.model.threads):
+            if other.name == name and other is not recv:
+                self.replaced(other)
+        old = recv.name
+        recv.name = name
+        if recv.limiter is not None:
+            recv.limiter.rename(old, name)
+        try:
+            recv.send(Protocol.encode({"type": "login", "ok": True, "name": name, "token": token}))
+        except OSError:
+            pass
+        self.model.admit(recv)
+        self.model.commands.mailbox(recv)
+        recv.release()
+
+    def replaced(self, recv):
+        """
+        Closes the older connection of a user, who logged in again. It gets another name first, so its end doesn't
+        remove the new connection of the user from the clients and the roster, and a login message without retry, so
+        the old client doesn't connect again and replaces the new connection.
+        :param recv: The Recv object of the older connection
+        :return: None
+        """
+        try:
+            self.model.threads.remove(recv)
+        except ValueError:
+            pass
+        try:
+            recv.send(Protocol.encode({"type": "login", "ok": False, "error": "Von einer anderen Verbindung angemeldet",
+                                       "retry": False}))
+        except OSError:
+            pass
+        old = recv.name
+        recv.name = "%s (ersetzt)" % old
+        if recv.limiter is not None:
+            recv.limiter.rename(old, recv.name)
+        recv.kick()
+
+    def close(self):
+        """
+        Closes the connections, which are not logged in, when the server stops
+        :return: None
+        """
+        with self.lock:
+            waiting = list(self.waiting)
+            self.waiting.clear()
+        for recv in waiting:
+            recv.close()
+            recv.stopping()
+            recv.logged_in(None)
+            if recv.is_alive():
+                recv.join()
+
+
+class Model(threading.Thread, Stoppable):
+    """
+        @author Ertl Marvin
+        @version 2016-12-07
+
+        This class inherits from threading.Thread and Stoppable, the class will listen for client, which try to connect
+        to the server and handel the threads, receiving form these threads and sending messages to these threads.
+
+            :ivar port:             The port on which the socket listen for clients
+            :ivar threads:          List of all connected threads to the server
+            :ivar queue:            The queue for the received messages
+            :ivar update:           Class for updating the gui
+            :ivar running:          Set if the run methode will listen for threads
+            :ivar serversocket:     The serversocket on which the server listen for clients
+            :ivar limiter:          Rate limiter, which is shared by all connected clients
+            :ivar backpressure:     Counts how often the receive threads had to wait for the full queue
+            :ivar pool_size:        Number of worker threads, 0 if every client gets its own thread
+            :ivar workers:          List of the Worker threads, which read from the clients in the pool mode
+            :ivar dedup:            Ids of the last messages, so messages sent again will not be sent twice
+            :ivar count:            Number of the clients, which connected since the start
+            :ivar ssl_context:      The ssl.SSLContext for tls, None for plaintext
+            :ivar handshakes:       ThreadPoolExecutor, which does the tls handshakes, so the accept loop doesn't wait
+            :ivar presence:         Presence thread, which tells the clients who is connected
+            :ivar ephemeral:        Ephemeral thread, which sends the typing events to the clients
+            :ivar transfers:        Transfers thread, which sends the files to the clients
+            :ivar cluster:          Cluster thread, which links the server with other servers, None without peers
+            :ivar rooms:            The Rooms, which send the messages of the rooms to their members
+            :ivar tracer:           Trace.Tracer with the times of the traced messages in the server
+            :ivar tracing:          If False the traces of the messages are dropped and not recorded
+            :ivar timers:           Profiler.Timers with the wall times of the handlers, only measured while profiling
+            :ivar profiler:         The last Profiler thread, None if the server was not profiled yet
+            :ivar commands:         The Commands, which are the first plugin
+            :ivar plugins:          Plugins.Pipeline, which changes or drops the messages of the clients
+            :ivar mailboxes:        Mailbox.Mailboxes for the messages to users, which are not connected, or None
+            :ivar login:            The Login, if the clients must log in, else None
+            :ivar snapshotter:      The Snapshot.Snapshotter, which writes the snapshots of the state, or None
+    """
+
+    QUEUE_SIZE = 1024
+    BACKLOG = 128
+    HANDSHAKE_THREADS = 8
+    HANDSHAKE_TIMEOUT = 10
+    PROFILE_SECONDS = 10
+
+    def __init__(self, queue, update, limiter=None, workers=0, ssl_context=None, port=4242, peers=(), node=None):
+        """
+        Initial the base class threading.Thread and Stoppable, also setup the port to 4242, running to true and all
+        other variables to the default value
+        :param queue: The queue for the receiving messages
+        :param update: Update class for making changes in the gui
+        :param limiter: The RateLimiter for the clients, if None a limiter with the default limits will be used
+        :param workers: Number of worker threads for the pool mode, 0 to start one thread per client
+        :param ssl_context: The ssl.SSLContext of the server for tls, None for plaintext
+        :param port: The port on which the socket listen for clients
+        :param peers: List of host:port of other servers, to which the server links, empty without cluster
+        :param node: Name of the server in the cluster, None for the hostname and the port
+        """
+        threading.Thread.__init__(self)
+        self.port = port
+        self.threads = []
+        self.queue = queue
+        self.update = update
+        self.running = True
+        self.serversocket = None
+        self.limiter = limiter if limiter is not None else RateLimiter()
+        self.backpressure = Backpressure()
+        self.pool_size = workers
+        self.workers = []
+        self.dedup = DedupCache()
+        self.count = 0
+        self.ssl_context = ssl_context
+        self.handshakes = None
+        self.presence = Presence(self)
+        self.ephemeral = Ephemeral(self)
+        self.transfers = Transfers()
+        self.cluster = None
+        if peers or node is not None:
+            self.cluster = Cluster(self, node if node is not None else "%s:%d" % (socket.gethostname(), port), peers)
+        self.rooms = Rooms(self)
+        self.tracer = Trace.Tracer(0)
+        self.tracing = True
+        self.timers = Profiler.Timers()
+        self.profiler = None
+        self.commands = Commands(self)
+        self.plugins = Plugins.Pipeline([self.commands])
+        self.mailboxes = None
+        self.login = None
+        self.snapshotter = None
+
+    def run(self):
+        """
+        The run methode will create a socket and listen for clients, if a client connects to the server, the client will
+        be added to the list threads and the server starts to recv messages from these connections, if the server
+        shuts down, the socket will be closed and all threads for the clients will be stopped.
+        In the pool mode the clients don't get a own thread, they will be given to the worker with the fewest clients.
+        With tls the handshake is done by the handshake threads and the client will only be added after it.
+        :return: None
+        """
+        self.workers = [Worker() for _ in range(self.pool_size)]
+        for w in self.workers:
+            w.start()
+        self.presence.start()
+        self.ephemeral.start()
+        self.transfers.start()
+        if self.cluster is not None:
+            self.cluster.start()
+        if self.ssl_context is not None:
+            import concurrent.futures
+            self.handshakes = concurrent.futures.ThreadPoolExecutor(self.HANDSHAKE_THREADS)
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as self.serversocket:
+            self.serversocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.serversocket.bind(("", self.port))
+            self.serversocket.listen(self.BACKLOG)
+            try:
+                while self.running:
+                    con, addr = self.serversocket.accept()
+                    con.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    self.count += 1
+                    if self.ssl_context is not None:
+                        con = self.ssl_context.wrap_socket(con, server_side=True, do_handshake_on_connect=False)
+                    r = Recv(con, self.queue, "Client " + str(self.count), self.update, self.limiter,
+                             self.backpressure, self.dedup, self.presence, self.ephemeral, self.cluster, self.rooms,
+                             self.timers, self.plugins, self.login)
+                    if self.handshakes is not None:
+                        self.handshakes.submit(self.handshake, r)
+                    else:
+                        self.add(r)
+            except socket.error as serr:
+                pass
+
+            if self.handshakes is not None:
+                self.handshakes.shutdown(wait=True, cancel_futures=True)
+            if self.profiler is not None:
+                self.profiler.stopping()
+                self.profiler.join()
+            if self.login is not None:
+                self.login.close()
+            for t in (self.presence, self.ephemeral, self.transfers, self.cluster):
+                if t is None:
+                    continue
+                t.stopping()
+                t.join()
+            for w in self.workers:
+                w.stopping()
+                w.join()
+            for t in self.threads:
+                t.close()
+                t.stopping()
+                if t.is_alive():
+                    t.join()
+
+    def handshake(self, recv):
+        """
+        Does the tls handshake of the client in one of the handshake threads and adds the client if it was successful,
+        if the handshake fails or takes longer than HANDSHAKE_TIMEOUT the connection will be closed. In the pool mode
+        the connection is non-blocking after the handshake, so a worker doesn't wait for the rest of a tls record.
+        :param recv: The Recv object of the client
+        :return: None
+        """
+        try:
+            recv.con.settimeout(self.HANDSHAKE_TIMEOUT)
+            recv.con.do_handshake()
+            if self.pool_size:
+                import ssl
+                recv.con.setblocking(False)
+                recv.retry = (ssl.SSLWantReadError, ssl.SSLWantWriteError, BlockingIOError)
+            else:
+                recv.con.settimeout(None)
+        except OSError:
+            recv.con.close()
+            return
+        if self.running:
+            self.add(recv)
+        else:
+            recv.con.close()
+
+    def add(self, recv):
+        """
+        Adds the client to the list threads and to the roster and starts reading from it, in the pool mode the client
+        will be given to the worker with the fewest clients, else it gets its own thread. If the clients must log in,
+        the client is only added after the login. In the cluster the client is only added with its first message,
+        which is not a link message, so a link of another server never joins the roster.
+        :param recv: The Recv object of the client
+        :return: None
+        """
+        if self.login is not None:
+            self.login.wait(recv)
+        elif self.cluster is not None:
+            recv.admit = self.admit
+        else:
+            self.admit(recv)
+        self.read(recv)
+
+    def admit(self, recv):
+        """
+        Adds the client to the list threads and to the roster, so it gets the messages of the other clients
+        :param recv: The Recv object of the client
+        :return: None
+        """
+        self.threads += [recv]
+        self.presence.join_client(recv)
+        self.update.set_client(recv.name)
+
+    def read(self, recv):
+        """
+        Starts reading from the connection, in the pool mode the connection will be given to the worker with the fewest
+        connections, else it gets its own thread
+        :param recv: The Recv object of the connection
+        :return: None
+        """
+        if self.workers:
+            min(self.workers, key=len).add(recv)
+        else:
+            recv.start()
+
+    def pump(self, show=None):
+        """
+        Takes the received messages in batches out of the queue and sends them to all clients, till it gets a False
+        from the queue. It will be called by the update thread of the gui or by the Headless thread.
+        :param show: Function, which will be called with every message after it was sent, or None
+        :return: None
+        """
+        while True:
+            for message in self.queue.get_batch():
+                if message is False:
+                    return
+                if self.timers.enabled:
+                    start = time.perf_counter()
+                    self.send(message)
+                    self.timers.record("send " + str(message.get("type", "msg")), time.perf_counter() - start)
+                else:
+                    self.send(message)
+                if show is not None:
+                    show(message)
+
+    def profile(self, seconds=None, path=None):
+        """
+        Switches the profiling on or off, the Profiler samples all threads and the Timers measure the handlers for
+        the seconds or till profile is called again, then both are written to the file
+        :param seconds: How long the server will be profiled, None for PROFILE_SECONDS
+        :param path: The file for the collapsed stacks, None for profile-<pid>-<time>.folded in the working directory
+        :return: The path of the file, if the profiling was started, None if it was stopped
+        """
+        if self.profiler is not None and self.profiler.is_alive():
+            self.profiler.stopping()
+            return None
+        if path is None:
+            path = "profile-%d-%s.folded" % (os.getpid(), time.strftime("%Y%m%d-%H%M%S"))
+        self.profiler = Profiler.Profiler(seconds if seconds is not None else self.PROFILE_SECONDS, path, self.timers)
+        self.profiler.start()
+        return path
+
+    def send(self, message):
+        """
+        Send the message to all clients. which are connect to the server, the message will only be encoded once for
+        all clients, if the connection to a client is already closed the client will be skipped. A file will be given
+        to the Transfers thread. A large message was already encoded into a Spool by the Recv, it is streamed from
+        there to every client, so it is never in the memory more than once. In the cluster the message will also be
+        sent to the other servers. A message of a room is given to the Rooms. A traced message gets the stamps fanout
+        and socket_write, so it is encoded for every client. The sender of the message gets a copy with the id of the
+        message, so it can find its own message without comparing names.
+        :param message: The message which will be sent
+        :return: None
+        """
+        relay = message.pop("cluster", None)
+        sender = message.pop("sender", None)
+        if message.get("room") is not None:
+            self.rooms.publish(message, sender)
+            return
+        if self.cluster is not None:
+            self.cluster.publish(message, relay)
+        if "spool" in message:
+            self.transfers.add(message, list(self.threads))
+            return
+        if "frame" in message:
+            for t in self.threads:
+                try:
+                    if sender is not None and t.serial == sender[0]:
+                        own = Protocol.FrameReader().feed(message["frame"].read())[0]
+                        own["id"] = sender[1]
+                        t.send(Protocol.encode(own))
+                    else:
+                        t.stream(message["frame"])
+                except (OSError, ValueError):
+                    pass
+            message["frame"].release()
+            return
+        trace = message.get("trace")
+        if trace is not None and not self.tracing:
+            del message["trace"]
+            trace = None
+        if trace is not None:
+            Trace.stamp(trace, "fanout")
+            for t in self.threads:
+                Trace.stamp(trace, "socket_write")
+                try:
+                    if sender is not None and t.serial == sender[0]:
+                        t.send(Protocol.encode(dict(message, id=sender[1])))
+                    else:
+                        t.send(Protocol.encode(message))
+                except OSError:
+                    pass
+            self.tracer.record(trace)
+            return
+        data = Protocol.encode(message)
+        for t in self.threads:
+            try:
+                if sender is not None and t.serial == sender[0]:
+                    t.send(Protocol.encode(dict(message, id=sender[1])))
+                else:
+                    t.send(data)
+            except OSError:
+                pass
+
+    def snapshot(self):
+        """
+        Copies the state for a snapshot: the number of the clients, the ids of the last messages, the rooms, of which
+        this server is the home, and the tokens of the logins. Every part is copied while its lock is held, the
+        messages themselves are not copied, because they are never changed.
+        :return: Dictionary with the state
+        """
+        return {"time": time.time(), "monotonic": time.monotonic(), "count": self.count,
+                "dedup": self.dedup.snapshot(), "rooms": self.rooms.snapshot(),
+                "tokens": self.login.auth.tokens.snapshot() if self.login is not None else []}
+
+    def restore(self, state):
+        """
+        Takes the state of a snapshot, the times of the ids and the tokens are moved, so the time, while the server was
+        stopped, counts as well
+        :param state: Dictionary with the state
+        :return: None
+        """
+        shift = time.monotonic() - state["monotonic"] - (time.time() - state["time"])
+        self.count = max(self.count, state.get("count", 0))
+        self.dedup.restore(state.get("dedup", []), shift)
+        self.rooms.restore(state.get("rooms", {}))
+        if self.login is not None:
+            self.login.auth.tokens.restore(state.get("tokens", []), shift)
+
+    def stopping(self):
+        """
+        Sets running to False, which stops the loop in the run method and closes the serversocket, the socket will be
+        shut down first, because on linux close alone doesn't wake up the accept.
+        :return: None
+        """
+        self.running = False
+        try:
+            self.serversocket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.serversocket.close()
+
+
+class Recv(threading.Thread, Stoppable):
+    """
+        @author Ertl Marvin
+        @version 2016-12-07
+
+        This class inherits from threading.Thread and Stoppable, the class will wait to receive messages from the
+        client, these messages will be put into the queue, so that it can be displayed by the update class
+
+            :ivar running:          Set if the run methode will listen for threads
+            .ivar con:              Connection to the thread
+            :ivar queue:            The queue for the received messages
+            :ivar name:             Name of the client
+            :ivar update:           Class for updating the gui
+            :ivar limiter:          Rate limiter for the messages of the client
+            :ivar backpressure:     Counter for the waits on the full queue
+            :ivar worker:           The Worker which reads from the connection in the pool mode, else None
+            :ivar resume:           Time of time.monotonic, till the worker should not read from the connection
+            :ivar dedup:            Cache of the ids of the last messages of all clients
+            :ivar reader:           FrameReader, which collects the received bytes to frames
+            :ivar client:           Id of the client, which it sent with the hello, None till the hello
+            :ivar lock:             Lock for sending, so the frames of different threads don't get mixed
+            :ivar presence:         The Presence thread, which gets the status of the client
+            :ivar ephemeral:        The Ephemeral thread, which sends the typing events of the client
+            :ivar uploads:          Dictionary with the number of the file as key and [Spool, name, size] as value
+            :ivar cluster:          The Cluster thread, None without cluster
+            :ivar link:             Name of the other server, if the connection is a link of the cluster, else None
+            :ivar rooms:            Set of the rooms of the client
+            :ivar room_list:        The Rooms of the server, None if the client can't join rooms
+            :ivar timers:           The Profiler.Timers, which measure the handlers while they are enabled
+            :ivar since:            Time of time.time, when the client connected
+            :ivar received:         Number of the received messages
+            :ivar bytes_in:         Number of the received bytes
+            :ivar bytes_out:        Number of the sent bytes, without the files sent by the Transfers thread
+            :ivar plugins:          The Plugins.Pipeline for the messages of the client, None without plugins
+            :ivar login:            The Login of the server, None if the clients don't log in
+            :ivar backlog:          List of the messages, which the client sent before its login, None after it
+            :ivar login_lock:       Lock for the backlog
+            :ivar retry:            Tuple of the errors of a non-blocking connection, after which it is read or written
+                                    again later, empty for a blocking connection
+            :ivar admit:            Function, which adds the client with its first message, if it is not a link, None
+                                    if it was already decided
+            :ivar result:           Result of the Authenticator, till the thread or the worker finishes the login
+            :ivar granted:          Event, which is set, when the result is there, the thread of the connection waits
+                                    for it
+            :ivar serial:           Number of the connection, which is unique on this server, so the copy of a message
+                                    for its sender can be found, even if the sender changed its name
+
+        Messages longer than SPOOL_SIZE are encoded into a Spool, the queue only gets the first PREVIEW characters for
+        the gui, so the queue and the sending to many clients don't need memory for the whole message.
+    """
+
+    STATUS = ("online", "away")
+    MAX_FILE = 1024 ** 3
+    SPOOL_SIZE = 65536
+    PREVIEW = 80
+    SERIALS = itertools.count(1)
+
+    def __init__(self, con, queue, name, update, limiter=None, backpressure=None, dedup=None, presence=None,
+                 ephemeral=None, cluster=None, rooms=None, timers=None, plugins=None, login=None):
+        """
+        Initial the threading.Thread class, set running to true and set the attributes to the given values
+        :param con: The connection to the thread
+        :param queue: The queue for the received messages
+        :param name: The name of the thread
+        :param update: Class update to make changes to the gui
+        :param limiter: The RateLimiter, if None the client will not be limited
+        :param backpressure: The Backpressure counter, if None the waits will not be counted
+        :param dedup: The DedupCache, if None messages which are sent again will not be detected
+        :param presence: The Presence thread, if None the status of the client will not be sent to the other clients
+        :param ephemeral: The Ephemeral thread, if None the typing events of the client will be ignored
+        :param cluster: The Cluster thread, if None link messages will be ignored
+        :param rooms: The Rooms, if None join messages will be ignored
+        :param timers: The Profiler.Timers, if None the handlers will never be measured
+        :param plugins: The Plugins.Pipeline, if None the messages will be sent like they are
+        :param login: The Login, if None login messages will be ignored
+        """
+        threading.Thread.__init__(self)
+        self.running = True
+        self.con = con
+        self.queue = queue
+        self.name = name
+        self.update = update
+        self.limiter = limiter
+        self.backpressure = backpressure
+        self.worker = None
+        self.resume = 0
+        self.dedup = dedup
+        self.reader = Protocol.FrameReader()
+        self.client = None
+        self.serial = next(self.SERIALS)
+        self.lock = threading.Lock()
+        self.presence = presence
+        self.ephemeral = ephemeral
+        self.uploads = {}
+        self.cluster = cluster
+        self.link = None
+        self.rooms = set()
+        self.room_list = rooms
+        self.timers = timers
+        self.since = time.time()
+        self.received = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.plugins = plugins
+        self.login = login
+        self.backlog = None
+        self.login_lock = threading.Lock()
+        self.admit = None
+        self.result = None
+        self.granted = threading.Event()
+        self.retry = ()
+
+    def stopping(self):
+        """
+        Will set running to false, loop in run method will stop
+        :return: None
+        """
+        self.running = False
+
+    def run(self):
+        """
+        Waits to get a messages from the client until running is False or the connections will be closed, if a messages
+        is received it wiil be put into the queue, so that the update class can display it in the gui, if the connection
+        is closed the name of the client will be removed from the connected clients list
+        :return: None
+        """
+        try:
+            while self.running and self.receive():
+                pass
+        except Exception:
+            import traceback
+            traceback.print_exc()
+            self.abort()
+        self.closed()
+
+    def receive(self):
+        """
+        Reads one time from the connection and handles all whole frames, in the thread mode it will be called by
+        the run method and in the pool mode by the Worker, if the connection is ready to read. If the client sends
+        something, which is not a valid frame, the connection will be closed. With tls the bytes, which are already
+        decrypted will be read too, because the selector doesn't see them. A tls connection of a worker is
+        non-blocking, because the selector sees the bytes and not whole records, if a record is not complete yet, it
+        is read the next time.
+        :return: False if the connection is closed, else True
+        """
+        try:
+            try:
+                data = self.con.recv(4096)
+            except self.retry:
+                return True
+            if self.worker is not None and hasattr(self.con, "pending"):
+                while self.con.pending():
+                    data += self.con.recv(self.con.pending())
+            if not data:
+                self.con.close()
+                self.running = False
+                self.update.remove_client(self.name)
+                return False
+            self.bytes_in += len(data)
+            for message in self.reader.feed(data):
+                self.handle(message)
+                if not self.running:
+                    break
+        except (ConnectionResetError, Protocol.ProtocolError):
+            self.abort()
+        except (ConnectionAbortedError, OSError):
+            self.running = False
+        return self.running
+
+    def abort(self):
+        """
+        Closes the connection, because the client sent something, which is not valid, and removes the client
+        :return: None
+        """
+        self.running = False
+        self.con.close()
+        self.update.remove_client(self.name)
+
+    def handle(self, message):
+        """
+        Processes the message, while the Timers are enabled the time of it is added to the handler of its type. In the
+        cluster the first message decides, if the connection is added to the clients or becomes a link. Before the
+        login the message is put into the backlog.
+        :param message: The received message
+        :return: None
+        """
+        self.received += 1
+        if self.admit is not None:
+            admit, self.admit = self.admit, None
+            if message.get("type") != "link":
+                admit(self)
+        if self.backlog is not None and self.hold(message):
+            return
+        if self.timers is None or not self.timers.enabled:
+            self.process(message)
+            return
+        start = time.perf_counter()
+        self.process(message)
+        self.timers.record("handle " + str(message.get("type")), time.perf_counter() - start)
+
+    def hold(self, message):
+        """
+        Puts the message into the backlog, if the client is not logged in yet, hello, login and link are handled right
+        away. If the backlog is full, the connection is closed.
+        :param message: The received message
+        :return: True if the message is in the backlog
+        """
+        if message.get("type") in ("hello", "login", "link"):
+            return False
+        with self.login_lock:
+            if self.backlog is None:
+                return False
+            if len(self.backlog) >= Login.BACKLOG:
+                self.kick()
+            else:
+                self.backlog.append(message)
+            return True
+
+    def logged_in(self, result):
+        """
+        Hands the result of the login over to the thread or the worker of the connection, it doesn't block, because it
+        is called by the pool of the Authenticator
+        :param result: Tuple with name, token, error and retry, None if the server stops
+        :return: None
+        """
+        self.result = result
+        if self.worker is not None:
+            self.worker.ready(self)
+        else:
+            self.granted.set()
+
+    def finish_login(self):
+        """
+        Finishes the login with the result, which the Authenticator handed over
+        :return: None
+        """
+        result, self.result = self.result, None
+        if result is not None and self.running:
+            self.login.finish(self, *result)
+
+    def release(self):
+        """
+        Handles the messages of the backlog after the login, a message, which the client sends at the same time, waits
+        till the backlog is done, so the order stays the same
+        :return: None
+        """
+        with self.login_lock:
+            try:
+                for message in self.backlog or ():
+                    self.process(message)
+            except Protocol.ProtocolError:
+                self.kick()
+            self.backlog = None
+
+    def process(self, message):
+        """
+        Handles one message of the client, a hello sets the id of the client, a msg will be put into the queue and the
+        client gets an ack for it, before it goes to the queue the plugins can change or drop it. If the message was
+        already received, because the client sent it again after a reconnect, it gets only the ack again. A msg, which
+        the rate limiter drops, gets an ack with dropped, so the client doesn't send it again. A status
+        changes the status of the client in the roster. A typing event goes to the Ephemeral thread without ack, after a
+        msg the client is not typing anymore. A file will be written to a Spool chunk by chunk and put into the queue,
+        when it is complete. A link message, which the Cluster trusts, turns the connection into a link of the cluster,
+        after that only batches of the other server are handled, else the connection is closed. A join or leave adds
+        the client to a room or removes it, a msg with a room goes only to the members of the room. A traced msg in the
+        lobby gets the stamp server_recv, a trace with values of the wrong type is dropped. A msg or chunk with values
+        of the wrong type raises a ProtocolError, so only this connection is closed.
+        :param message: The received message
+        :return: None
+        """
+        kind = message.get("type")
+        if self.link is not None:
+            if kind == "batch":
+                self.cluster.receive(self, message.get("messages"))
+            elif kind == "link":
+                self.cluster.named(self, message.get("node"))
+        elif kind == "link":
+            if self.cluster is not None:
+                if not self.cluster.trusted(self, message):
+                    self.running = False
+                    self.close()
+                    return
+                if self.login is not None:
+                    self.login.forget(self)
+                self.cluster.accept(self, message.get("node"))
+        elif kind == "hello":
+            self.client = str(message.get("client"))
+        elif kind == "login":
+            if self.login is not None and self.backlog is not None and self.login.start(self, message) and \
+                    self.worker is None:
+                self.granted.wait()
+                self.granted.clear()
+                self.finish_login()
+        elif kind == "msg":
+            text = message.get("text")
+            msg_id = message.get("id")
+            room = message.get("room", Rooms.LOBBY)
+            if msg_id is not None and not isinstance(msg_id, (int, str)) or not isinstance(room, str):
+                raise Protocol.ProtocolError("Invalid id or room")
+            if not isinstance(text, str):
+                return
+            if not self.limit(len(text)):
+                if msg_id is not None and self.running:
+                    self.send(Protocol.encode({"type": "ack", "id": msg_id, "from": self.name, "echo": False,
+                                               "dropped": True}))
+                return
+            echo = False
+            if room != Rooms.LOBBY and room not in self.rooms:
+                pass
+            elif self.dedup is None or self.client is None or msg_id is None or \
+                    not self.dedup.seen((self.client, msg_id)):
+                post = {"type": "msg", "from": self.name, "text": text}
+                if room != Rooms.LOBBY:
+                    post["room"] = room
+                if self.plugins:
+                    post = self.plugins.process(self, post)
+                echo = post is not None
+                if post is None:
+                    pass
+                else:
+                    trace = Trace.received(message.get("trace")) if room == Rooms.LOBBY else None
+                    if room == Rooms.LOBBY and len(post["text"]) > self.SPOOL_SIZE:
+                        post = self.spool(post)
+                    elif trace is not None:
+                        post["trace"] = trace
+                        Trace.stamp(trace, "server_recv")
+                    if msg_id is not None:
+                        post["sender"] = [self.serial, msg_id]
+                    self.put(post)
+                if self.ephemeral is not None:
+                    self.ephemeral.post({"type": "typing", "from": self.name, "typing": False})
+            if msg_id is not None and self.running:
+                self.send(Protocol.encode({"type": "ack", "id": msg_id, "from": self.name, "echo": echo}))
+        elif kind in ("join", "leave"):
+            room = message.get("room")
+            if self.room_list is None or not isinstance(room, str) or not room or len(room) > Rooms.MAX_NAME or \
+                    room == Rooms.LOBBY:
+                return
+            if kind == "join":
+                self.room_list.join(self, room, message.get("since"))
+            else:
+                self.room_list.leave(self, room)
+        elif kind == "status":
+            if self.presence is not None and message.get("status") in self.STATUS:
+                self.presence.set(self.name, message.get("status"))
+        elif kind == "file":
+            self.upload(message)
+        elif kind == "chunk":
+            if not isinstance(message.get("file"), int) or not isinstance(message.get("data"), bytes):
+                raise Protocol.ProtocolError("Invalid chunk")
+            self.chunk(message["file"], message["data"])
+        elif kind == "typing":
+            if self.ephemeral is not None:
+                self.ephemeral.post({"type": "typing", "from": self.name, "typing": bool(message.get("typing"))})
+
+    def spool(self, message):
+        """
+        Encodes the message into a Spool
+        :param message: The message
+        :return: The message for the queue with a short text and the Spool as frame
+        """
+        spool = Spool()
+        spool.write(Protocol.encode(message))
+        spool.finish()
+        return {"type": "msg", "from": message["from"], "text": message["text"][:self.PREVIEW] + "...",
+                "frame": spool}
+
+    def upload(self, message):
+        """
+        Starts the upload of a file, the bytes will be written to a Spool
+        :param message: The file message with id, name and size
+        :return: None
+        """
+        size = message.get("size")
+        name = message.get("name")
+        if not isinstance(message.get("id"), int) or not isinstance(size, int) or not 0 <= size <= self.MAX_FILE \
+                or not isinstance(name, str):
+            return
+        self.drop(message.get("id"))
+        self.uploads[message.get("id")] = [Spool(), name.replace("\\", "/").rsplit("/", 1)[-1], size]
+        self.chunk(message.get("id"), b"")
+
+    def chunk(self, file_id, data):
+        """
+        Writes the bytes to the Spool of the file and tells the client how many bytes the server has got, so it can
+        send the next ones. The bytes are counted by the rate limiter, if they would be dropped, the whole file is
+        dropped. If the file is complete, it will be put into the queue.
+        :param file_id: The number of the file
+        :param data: The bytes of the file
+        :return: None
+        """
+        upload = self.uploads.get(file_id)
+        if upload is None:
+            return
+        spool, name, size = upload
+        if data and not self.limit(len(data)) or spool.size + len(data) > size:
+            return self.drop(file_id)
+        spool.write(data)
+        if data or spool.size == size:
+            self.send(Protocol.encode({"type": "credit", "file": file_id, "size": spool.size}))
+        if spool.size == size:
+            del self.uploads[file_id]
+            spool.finish()
+            self.put({"type": "msg", "from": self.name, "text": "[Datei %s, %d Bytes]" % (name, size),
+                      "name": name, "spool": spool})
+
+    def drop(self, file_id):
+        """
+        Throws away the upload of the file
+        :param file_id: The number of the file
+        :return: None
+        """
+        upload = self.uploads.pop(file_id, None)
+        if upload is not None:
+            upload[0].release()
+
+    def close(self):
+        """
+        Shuts the connection down and closes it, so a thread which waits in recv wakes up
+        :return: None
+        """
+        try:
+            self.con.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.con.close()
+
+    def kick(self):
+        """
+        Shuts the connection down without closing it, the thread or the worker which reads from it gets the end of the
+        connection and removes the client
+        :return: None
+        """
+        try:
+            self.con.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def closed(self):
+        """
+        Will be called when the connection is closed, removes the client from the rate limiter and from the roster and
+        throws away the files, which are not complete
+        :return: None
+        """
+        if self.login is not None and self.backlog is not None:
+            self.login.forget(self)
+        for file_id in list(self.uploads):
+            self.drop(file_id)
+        if self.link is not None:
+            self.cluster.detach(self)
+        if self.room_list is not None:
+            self.room_list.left(self)
+        if self.limiter is not None:
+            self.limiter.forget(self.name)
+        if self.presence is not None:
+            self.presence.leave(self.name)
+
+    def put(self, message):
+        """
+        Puts the message into the queue, if the queue is full the thread waits till there is space again and doesn't
+        read from the connection in the meantime, the wait will be counted by the backpressure counter
+        :param message: The message for the queue
+        :return: None
+        """
+        try:
+            self.queue.put_nowait(message)
+            return
+        except queue.Full:
+            pass
+        start = time.monotonic()
+        if self.backpressure is not None:
+            self.backpressure.begin()
+        try:
+            while self.running:
+                try:
+                    self.queue.put(message, timeout=0.5)
+                    break
+                except queue.Full:
+                    pass
+        finally:
+            if self.backpressure is not None:
+                self.backpressure.end(time.monotonic() - start)
+
+    def limit(self, size):
+        """
+        Checks the message against the rate limiter, if the client is over the limit, the action of the limiter will be
+        done. On DELAY the thread sleeps and doesn't read from the connection, so the client will be slowed down by
+        the tcp flow control, in the pool mode the worker just skips the connection till the wait is over, on DROP
+        the message will be thrown away and on DISCONNECT the connection will be closed.
+        :param size: Number of bytes of the message
+        :return: True if the message should be put into the queue, else False
+        """
+        if self.limiter is None:
+            return True
+        wait = self.limiter.consume(self.name, size)
+        if wait == 0:
+            return True
+        action = self.limiter.action
+        if action == RateLimiter.DELAY:
+            if self.worker is None:
+                time.sleep(wait)
+            else:
+                self.resume = time.monotonic() + wait
+            return True
+        if action == RateLimiter.DISCONNECT:
+            self.running = False
+            self.con.close()
+            self.update.remove_client(self.name)
+        return False
+
+    def send(self, data):
+        """
+        Sends the encoded frame to the client, the lock makes sure that the frames of the update thread and of the
+        receive thread don't get mixed
+        :param data: The frame, which will be sent do the client
+        :return: None
+        """
+        with self.lock:
+            self.write(data)
+            self.bytes_out += len(data)
+
+    def stream(self, spool):
+        """
+        Sends the whole Spool with sendfile to the client, the lock makes sure that no other frame goes in between
+        :param spool: The Spool with the encoded frame
+        :return: None
+        """
+        with self.lock:
+            self.write_file(spool.file, 0, spool.size)
+
+    def write(self, data):
+        """
+        Sends all bytes to the client, the lock must be held. A non-blocking connection waits with select till it can
+        write again.
+        :param data: The bytes
+        :return: None
+        """
+        if not self.retry:
+            self.con.sendall(data)
+            return
+        view = memoryview(data)
+        while view:
+            try:
+                view = view[self.con.send(view):]
+            except self.retry:
+                select.select([], [self.con], [], 1.0)
+
+    def write_file(self, file, offset, count):
+        """
+        Sends a part of the file to the client with sendfile, the lock must be held. sendfile doesn't work with a
+        non-blocking connection, so its part is read in pieces and sent with write.
+        :param file: The file
+        :param offset: Position of the first byte
+        :param count: Number of the bytes
+        :return: None
+        """
+        if not self.retry:
+            file.seek(offset)
+            self.con.sendfile(file, offset, count)
+            return
+        end = offset + count
+        while offset < end:
+            data = os.pread(file.fileno(), min(Transfers.CHUNK_SIZE, end - offset), offset)
+            if not data:
+                break
+            self.write(data)
+            offset += len(data)
+
+    def try_send(self, data):
+        """
+        Sends the encoded frames only if no other thread is sending to the client at the moment, for events which can
+        be lost
+        :param data: The frames, which will be sent to the client
+        :return: True if the frames were sent, else False
+        """
+        if not self.lock.acquire(blocking=False):
+            return False
+        try:
+            self.write(data)
+            self.bytes_out += len(data)
+            return True
+        except OSError:
+            return False
+        finally:
+            self.lock.release()
+
+
+class Worker(threading.Thread, Stoppable):
+    """
+        @author Ertl Marvin
+        @version 2016-12-16
+
+        This class inherits from threading.Thread and Stoppable, in the pool mode a fixed number of workers reads from
+        all clients, every worker waits with a selector till one of its connections is ready to read and then calls
+        receive of the Recv object of this connection. So the number of threads doesn't grow with the clients.
+
+            :ivar selector:     Selector for the connections of the worker
+            :ivar added:        Deque with the Recv objects, which the accept loop gave to the worker
+            :ivar paused:       Heap with (resume, number, Recv) of the clients, which are over the rate limit
+            :ivar logins:       Deque with the Recv objects, whose login was checked by the Authenticator
+            :ivar count:        Number of the connections of the worker
+            :ivar running:      Set if the run method should wait for the connections
+            :ivar wakeup:       Socket pair to wake up the selector, if a connection is added or the worker stops
+    """
+
+    def __init__(self):
+        """
+        Initial the base class threading.Thread and create the selector and the socket pair for waking it up
+        """
+        threading.Thread.__init__(self)
+        self.selector = selectors.DefaultSelector()
+        self.added = collections.deque()
+        self.logins = collections.deque()
+        self.paused = []
+        self.count = 0
+        self.running = True
+        self.wakeup = socket.socketpair()
+        self.wakeup[0].setblocking(False)
+        self.selector.register(self.wakeup[0], selectors.EVENT_READ)
+
+    def __len__(self):
+        """
+        :return: Number of the connections of the worker
+        """
+        return self.count
+
+    def add(self, recv):
+        """
+        Gives the connection to the worker, it will be registered by the worker thread itself
+        :param recv: The Recv object of the connection
+        :return: None
+        """
+        recv.worker = self
+        self.count += 1
+        self.added.append(recv)
+        self.wake()
+
+    def ready(self, recv):
+        """
+        Gives the connection, whose login was checked, to the worker, which finishes the login
+        :param recv: The Recv object of the connection
+        :return: None
+        """
+        self.logins.append(recv)
+        self.wake()
+
+    def wake(self):
+        """
+        Wakes up the selector of the worker
+        :return: None
+        """
+        try:
+            self.wakeup[1].send(b"\0")
+        except OSError:
+            pass
+
+    def run(self):
+        """
+        Waits till connections are ready to read and calls receive of them, closed connections will be removed and
+        connections over the rate limit will be taken out of the selector till their wait is over. The logins, which
+        the Authenticator checked, are finished here too.
+        :return: None
+        """
+        while self.running:
+            timeout = None
+            if self.paused:
+                timeout = max(0, self.paused[0][0] - time.monotonic())
+            for key, events in self.selector.select(timeout):
+                recv = key.data
+                if recv is None:
+                    try:
+                        self.wakeup[0].recv(4096)
+                    except BlockingIOError:
+                        pass
+                elif not self.receive(recv):
+                    self.remove(recv)
+                elif recv.resume > time.monotonic():
+                    self.selector.unregister(recv.con)
+                    heapq.heappush(self.paused, (recv.resume, id(recv), recv))
+            while self.added:
+                self.register(self.added.popleft())
+            while self.logins:
+                self.finish(self.logins.popleft())
+            while self.paused and self.paused[0][0] <= time.monotonic():
+                self.register(heapq.heappop(self.paused)[2])
+        self.selector.close()
+        for s in self.wakeup:
+            s.close()
+
+    @staticmethod
+    def receive(recv):
+        """
+        Reads from the connection, an error while its messages are handled only closes this connection, so the worker
+        keeps reading from the other connections
+        :param recv: The Recv object of the connection
+        :return: False if the connection is closed, else True
+        """
+        try:
+            return recv.receive()
+        except Exception:
+            import traceback
+            traceback.print_exc()
+            recv.abort()
+            return False
+
+    @staticmethod
+    def finish(recv):
+        """
+        Finishes the login of the connection, after an error the connection is shut down, so the selector sees its end
+        :param recv: The Recv object of the connection
+        :return: None
+        """
+        try:
+            recv.finish_login()
+        except Exception:
+            import traceback
+            traceback.print_exc()
+            recv.kick()
+
+    def register(self, recv):
+        """
+        Adds the connection to the selector, if it is still open
+        :param recv: The Recv object of the connection
+        :return: None
+        """
+        if not recv.running:
+            return self.remove(recv, False)
+        try:
+            self.selector.register(recv.con, selectors.EVENT_READ, recv)
+        except (ValueError, OSError):
+            self.remove(recv, False)
+
+    def remove(self, recv, registered=True):
+        """
+        Removes a closed connection from the worker
+        :param recv: The Recv object of the connection
+        :param registered: True if the connection is registered at the selector
+        :return: None
+        """
+        if registered:
+            try:
+                self.selector.unregister(recv.con)
+            except (KeyError, ValueError):
+                pass
+        self.count -= 1
+        recv.closed()
+
+    def stopping(self):
+        """
+        Sets running to False and wakes up the selector, so the run method stops
+        :return: None
+        """
+        self.running = False
+        self.wake()
+
+
+class Admin(threading.Thread, Stoppable):
+    """
+        @author Ertl Marvin
+        @version 2016-12-29
+
+        This class inherits from threading.Thread and Stoppable, it listens on a unix socket for the commands of the
+        operator, so a server without gui or with a busy gui can be managed. Every connection gets its own thread, a
+        command is one line with the name and the arguments separated by spaces, the answer is one line of json with ok
+        and the result or the error. The commands are looked up in the dictionary commands, other parts of the server
+        can add their commands with register. The commands work directly on the Model and don't wait for the gui.
+
+            echo list | nc -U admin.sock
+
+            :ivar model:    The Model of the server
+            :ivar path:     Path of the unix socket
+            :ivar commands: Dictionary with the name of the command as key and (function, help) as value
+            :ivar running:  Set if the run method should accept connections
+            :ivar sock:     The listening unix socket
+    """
+
+    MAX_LINE = 65536
+
+    def __init__(self, model, path):
+        """
+        Initial the base class threading.Thread and register the commands
+        :param model: The Model of the server
+        :param path: Path of the unix socket
+        """
+        threading.Thread.__init__(self, name="Admin", daemon=True)
+        self.model = model
+        self.path = path
+        self.commands = {}
+        self.running = True
+        self.sock = None
+        self.register("help", self.help, "help: list of the commands")
+        self.register("list", self.list, "list: connections with their stats")
+        self.register("kick", self.kick, "kick NAME: closes the connection of the client")
+        self.register("limits", self.limits, "limits [KEY=VALUE ...]: shows or changes the rate limits")
+        self.register("queues", self.queues, "queues: lengths of the queues of the server")
+        self.register("trace", self.trace, "trace on|off|report|export FILE: server side tracing")
+        self.register("profile", self.profile, "profile [SECONDS]: switches the profiling on or off")
+        self.register("timers", self.timers, "timers: wall times of the handlers of the last profiling")
+        self.register("plugins", self.plugins, "plugins: the plugins in their order with their counters")
+        self.register("mailboxes", self.mailboxes, "mailboxes [purge]: number of the users and stored messages")
+        self.register("snapshot", self.snapshot, "snapshot [stats]: writes a snapshot now or shows the last one")
+
+    def register(self, name, function, text):
+        """
+        Adds a command
+        :param name: The name of the command
+        :param function: Function, which gets the arguments as strings and returns a result, which can be json encoded
+        :param text: The help of the command
+        :return: None
+        """
+        self.commands[name] = (function, text)
+
+    def run(self):
+        """
+        Creates the unix socket, only the user of the server can connect, and starts a thread for every connection
+        :return: None
+        """
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o177)
+        try:
+            self.sock.bind(self.path)
+        finally:
+            os.umask(umask)
+        self.sock.listen(8)
+        try:
+            while self.running:
+                con, _ = self.sock.accept()
+                if not self.running:
+                    con.close()
+                    break
+                threading.Thread(target=self.serve, args=(con,), daemon=True).start()
+        except OSError:
+            pass
+        finally:
+            self.sock.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    def serve(self, con):
+        """
+        Answers the commands of one connection till it is closed
+        :param con: The connection of the operator
+        :return: None
+        """
+        with con, con.makefile("rwb") as f:
+            for line in iter(lambda: f.readline(self.MAX_LINE), b""):
+                answer = self.execute(line.decode("utf-8", "replace"))
+                if answer is None:
+                    continue
+                f.write(json.dumps(answer).encode() + b"\n")
+                f.flush()
+
+    def execute(self, line):
+        """
+        Executes one command
+        :param line: The line with the command and its arguments
+        :return: Dictionary with ok and result or error, None for an empty line
+        """
+        parts = line.split()
+        if not parts:
+            return None
+        command = self.commands.get(parts[0])
+        if command is None:
+            return {"ok": False, "error": "Unbekannter Befehl: %s" % parts[0]}
+        try:
+            return {"ok": True, "result": command[0](*parts[1:])}
+        except (TypeError, ValueError, KeyError, OSError) as e:
+            return {"ok": False, "error": str(e)}
+
+    def help(self):
+        """
+        :return: List with the help of all commands
+        """
+        return [text for _, text in self.commands.values()]
+
+    def list(self):
+        """
+        :return: List with a dictionary of the stats of every connection
+        """
+        now = time.time()
+        roster = dict(self.model.presence.roster)
+        return [{"name": t.name, "client": t.client, "link": t.link, "status": roster.get(t.name),
+                 "seconds": round(now - t.since, 1), "received": t.received, "bytes_in": t.bytes_in,
+                 "bytes_out": t.bytes_out, "rooms": sorted(t.rooms), "uploads": len(t.uploads)}
+                for t in list(self.model.threads)]
+
+    def kick(self, *name):
+        """
+        Shuts the connection of the client down, the thread or worker which reads from it sees the end and removes
+        the client like after a normal disconnect
+        :param name: The name of the client, it can contain spaces
+        :return: The name of the client
+        """
+        name = " ".join(name)
+        for t in list(self.model.threads):
+            if t.name == name:
+                t.kick()
+                return name
+        raise ValueError("Kein Client %s" % name)
+
+    def limits(self, *changes):
+        """
+        Changes the limits of the RateLimiter, the rates and bursts are numbers greater than 0, action is delay, drop
+        or disconnect
+        :param changes: KEY=VALUE for every limit, which should be changed
+        :return: Dictionary with the limits and the stats of the limiter
+        """
+        limiter = self.model.limiter
+        limits = {}
+        for change in changes:
+            key, _, value = change.partition("=")
+            limits[key] = value if key == "action" else float(value)
+        if limits.get("action", RateLimiter.DELAY) not in (RateLimiter.DELAY, RateLimiter.DROP, RateLimiter.DISCONNECT):
+            raise ValueError("Unbekannte Aktion: %s" % limits["action"])
+        for key, value in limits.items():
+            if key != "action" and not value > 0:
+                raise ValueError("%s muss größer als 0 sein" % key)
+        if limits:
+            limiter.configure(**limits)
+        return {"msg_rate": limiter.msg_rate, "msg_burst": limiter.msg_burst, "byte_rate": limiter.byte_rate,
+                "byte_burst": limiter.byte_burst, "action": limiter.action, "stats": dict(limiter.stats)}
+
+    def queues(self):
+        """
+        :return: Dictionary with the lengths of the queues and the counters of the backpressure
+        """
+        model = self.model
+        result = {"ingress": model.queue.qsize(), "backpressure": model.backpressure.stats(),
+                  "presence": len(model.presence.changed) + len(model.presence.joined),
+                  "ephemeral": len(model.ephemeral.latest), "ephemeral_dropped": model.ephemeral.dropped,
+                  "transfers": len(model.transfers.jobs), "workers": [len(w) for w in model.workers],
+                  "dedup": len(model.dedup)}
+        if model.cluster is not None:
+            result["cluster"] = {t.name: len(items) for t, items in list(model.cluster.links.items())}
+        return result
+
+    def trace(self, action="report", path=None):
+        """
+        Switches the tracing of the server on or off, or returns or exports the times of the traced messages
+        :param action: on, off, report or export
+        :param path: The file for export
+        :return: The report or if tracing is on
+        """
+        if action in ("on", "off"):
+            self.model.tracing = action == "on"
+            return self.model.tracing
+        if action == "report":
+            return self.model.tracer.report()
+        if action == "export" and path is not None:
+            self.model.tracer.export(path)
+            return path
+        raise ValueError("trace on|off|report|export FILE")
+
+    def profile(self, seconds=None):
+        """
+        Switches the profiling on or off
+        :param seconds: How long the server is profiled
+        :return: The file of the profile, None if the profiling was stopped
+        """
+        return self.model.profile(float(seconds) if seconds is not None else None)
+
+    def timers(self):
+        """
+        :return: The report of the Timers
+        """
+        return self.model.timers.report()
+
+    def plugins(self):
+        """
+        :return: List with the name and the counters of every plugin
+        """
+        return [dict({"name": type(p).__name__}, **{k: v for k, v in vars(p).items() if type(v) is int})
+                for p in self.model.plugins.plugins]
+
+    def mailboxes(self, action=None):
+        """
+        :param action: purge to delete the old messages and users now
+        :return: Dictionary with the number of the users and of the messages
+        """
+        if self.model.mailboxes is None:
+            raise ValueError("Der Server hat keine Mailboxen, siehe --mailbox")
+        if action == "purge":
+            self.model.mailboxes.purge()
+        return self.model.mailboxes.stats()
+
+    def snapshot(self, action=None):
+        """
+        :param action: stats to only show the last snapshot
+        :return: Dictionary with the path, the size, the pause and the whole time of the snapshot
+        """
+        if self.model.snapshotter is None:
+            raise ValueError("Der Server schreibt keine Snapshots, siehe --snapshot")
+        if action == "stats":
+            return self.model.snapshotter.stats
+        return self.model.snapshotter.save()
+
+    def stopping(self):
+        """
+        Sets running to False and connects to the socket, because on linux neither shutdown nor close wakes up the
+        accept of a unix socket
+        :return: None
+        """
+        self.running = False
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+                s.connect(self.path)
+        except OSError:
+            pass
+
+
+class Headless(threading.Thread):
+    """
+        @author Ertl Marvin
+        @version 2016-12-20
+
+        This class inherits from threading.Thread, it replaces the update thread of the gui, if the server is started
+        with --headless. It starts the model and writes the messages and the clients to the standard output.
+
+            :ivar queue:    The queue for the received messages
+            :ivar model:    Model which handles the receive, send and listen thread
+            :ivar quiet:    If True nothing will be written to the standard output
+    """
+
+    def __init__(self, queue, workers=0, ssl_context=None, port=4242, quiet=False, peers=(), node=None):
+        """
+        Initial the base class threading.Thread and create the Model
+        :param queue: The queue for the received messages
+        :param workers: Number of worker threads for the pool mode of the model, 0 for one thread per client
+        :param ssl_context: The ssl.SSLContext for tls, None for plaintext
+        :param port: The port on which the model listens for clients
+        :param quiet: If True nothing will be written to the standard output
+        :param peers: List of host:port of other servers, to which the model links
+        :param node: Name of the server in the cluster, None for the hostname and the port
+        """
+        threading.Thread.__init__(self)
+        self.queue = queue
+        self.model = Model(self.queue, self, workers=workers, ssl_context=ssl_context, port=port, peers=peers,
+                           node=node)
+        self.quiet = quiet
+
+    def run(self):
+        """
+        Starts the model and sends the received messages to the clients till the queue gets False
+        :return: None
+        """
+        self.model.start()
+        self.model.pump(None if self.quiet else self.show)
+        self.model.stopping()
+        self.model.join()
+
+    def show(self, message):
+        """
+        Writes the message to the standard output
+        :param message: The message, which was sent to the clients
+        :return: None
+        """
+        if message.get("room") is not None:
+            print("[%s] %s: %s" % (message["room"], message["from"], message["text"]), flush=True)
+        else:
+            print("%s: %s" % (message["from"], message["text"]), flush=True)
+
+    def set_client(self, text):
+        """
+        Writes the name of the new client to the standard output
+        :param text: The name of the client
+        :return: None
+        """
+        if not self.quiet:
+            print("+ %s" % text, flush=True)
+
+    def remove_client(self, text):
+        """
+        Writes the name of the disconnected client to the standard output and removes it from the model
+        :param text: The name of the client
+        :return: None
+        """
+        if not self.quiet:
+            print("- %s" % text, flush=True)
+        self.model.threads = [t for t in self.model.threads if t.name != text]
+
+    def stopping(self):
+        """
+        Puts a False into the queue, which stops the model
+        :return: None
+        """
+        self.queue.put(False)
+
+
+def server_context(certfile, keyfile=None):
+    """
+    Creates the ssl context for the server, the server sends session tickets, so reconnecting clients can resume their
+    session without a full handshake
+    :param certfile: Certificate file in PEM format
+    :param keyfile: Private key file, None if the key is in the certificate file
+    :return: The ssl.SSLContext
+    """
+    import ssl
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(certfile, keyfile)
+    return context
+
+
+def __getattr__(name):
+    """
+    Imports the gui the first time Server.View or Server.Update is used
+    :param name: Name of the attribute
+    :return: The class of ServerGui
+    """
+    if name in ("View", "Update"):
+        import ServerGui
+        return getattr(ServerGui, name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+def main():
+    """
+    Reads the options from the command line and starts the server, with --headless the server runs without gui till
+    it gets ctrl+c, else the gui will be imported and displayed. Without gui the signal SIGUSR1 switches the
+    profiling on or off. With --admin the Admin thread listens on the unix socket. With --snapshot the state of the
+    snapshot is restored and a new snapshot is written every --snapshot-interval seconds and at the end.
+    :return: None
+    """
+    import argparse
+    parser = argparse.ArgumentParser(description="Server for the simple chat")
+    parser.add_argument("--headless", action="store_true", help="run without gui")
+    parser.add_argument("--port", type=int, default=4242, help="port on which the server listens")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="number of worker threads for all clients, 0 for one thread per client")
+    parser.add_argument("--cert", help="certificate file in PEM format, enables tls")
+    parser.add_argument("--key", help="private key of the certificate, if it is not in the certificate file")
+    parser.add_argument("--peer", action="append", default=[],
+                        help="host:port of another server of the cluster, the links are not encrypted")
+    parser.add_argument("--node", help="name of the server in the cluster, default hostname:port")
+    parser.add_argument("--cluster-secret",
+                        help="shared secret of the servers in the cluster, without it only the peers can link")
+    parser.add_argument("--trace", help="file for the traces of the messages in the format of chrome://tracing")
+    parser.add_argument("--profile-seconds", type=float, default=Model.PROFILE_SECONDS,
+                        help="how long the server is profiled after SIGUSR1")
+    parser.add_argument("--admin", help="path of the unix socket for the admin commands")
+    parser.add_argument("--filter", help="file with the forbidden words, one per line")
+    parser.add_argument("--filter-drop", action="store_true", help="drop messages with forbidden words")
+    parser.add_argument("--rewrite", help="file with the rules for the links, old and new host per line")
+    parser.add_argument("--mailbox", help="sqlite database for the messages to users, which are not connected")
+    parser.add_argument("--accounts", help="sqlite database with the accounts, the clients must log in")
+    parser.add_argument("--no-register", action="store_true", help="a login with an unknown name is refused")
+    parser.add_argument("--snapshot", help="file for the snapshots of the state, it is restored at the start")
+    parser.add_argument("--snapshot-interval", type=float, help="seconds between the snapshots, default 60")
+    args, qt_args = parser.parse_known_args()
+    if not args.headless:
+        import ServerGui
+        return ServerGui.main(args, qt_args)
+    headless = Headless(IngressQueue(Model.QUEUE_SIZE), args.workers,
+                        server_context(args.cert, args.key) if args.cert else None, args.port, peers=args.peer,
+                        node=args.node)
+    if headless.model.cluster is not None:
+        headless.model.cluster.secret = args.cluster_secret
+    for plugin in Plugins.load(args.filter, args.rewrite, args.filter_drop):
+        headless.model.plugins.add(plugin)
+    if args.mailbox:
+        import Mailbox
+        headless.model.mailboxes = Mailbox.Mailboxes(args.mailbox)
+    if args.accounts:
+        import Auth
+        headless.model.login = Login(headless.model, Auth.Authenticator(args.accounts, not args.no_register))
+    if args.snapshot:
+        import Snapshot
+        headless.model.snapshotter = Snapshot.Snapshotter(headless.model, args.snapshot, args.snapshot_interval)
+        seconds = headless.model.snapshotter.restore()
+        if seconds is not None:
+            print("Snapshot %s in %.1f ms geladen" % (args.snapshot, seconds * 1000), file=sys.stderr, flush=True)
+        headless.model.snapshotter.start()
+
+    def profile(signum, frame):
+        path = headless.model.profile(args.profile_seconds)
+        print("Profiling %s" % ("nach " + path if path is not None else "beendet"), file=sys.stderr, flush=True)
+
+    import signal
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, profile)
+    admin = Admin(headless.model, args.admin) if args.admin else None
+    headless.start()
+    if admin is not None:
+        admin.start()
+    try:
+        while headless.is_alive():
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        headless.stopping()
+        headless.join()
+    if admin is not None:
+        admin.stopping()
+        admin.join()
+    if headless.model.snapshotter is not None:
+        headless.model.snapshotter.stopping()
+        headless.model.snapshotter.join()
+    if headless.model.mailboxes is not None:
+        headless.model.mailboxes.close()
+    if headless.model.login is not None:
+        headless.model.login.auth.close()
+    if args.trace:
+        headless.model.tracer.export(args.trace)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,212 @@
+"""
+    @author Ertl Marvin
+    @version 2016-12-20
+
+    The gui of the server, this module will only be imported by Server, if the server is not started headless
+"""
+from PySide import QtGui
+from PySide.QtCore import QThread, SIGNAL
+import sys
+import ServerView
+import Plugins
+import Server
+
+
+class Update(QThread):
+    """
+        @author Ertl Marvin
+        @version 2016-12-07
+
+        This class inherits from the QThread, the model will be started and handel the receive, send and listen thread,
+        this class will send the signal to the view, to change the gui
+
+            :ivar queue:    The queue for the received messages
+            :ivar model:    Model which handles the receive, send and listen thread
+    """
+
+    def __init__(self, queue, workers=0, ssl_context=None, port=4242, peers=(), node=None):
+        """
+        Initial the base class QThread and create Model
+        :param queue: The queue for the receiving messages
+        :param workers: Number of worker threads for the pool mode of the model, 0 for one thread per client
+        :param ssl_context: The ssl.SSLContext for tls, None for plaintext
+        :param port: The port on which the model listens for clients
+        :param peers: List of host:port of other servers, to which the model links
+        :param node: Name of the server in the cluster, None for the hostname and the port
+        """
+        QThread.__init__(self)
+        self.queue = queue
+        self.model = Server.Model(self.queue, self, workers=workers, ssl_context=ssl_context, port=port, peers=peers,
+                                  node=node)
+
+    def run(self):
+        """
+        The run method start the model, the model sends the received messages to all clients and this thread sends a
+        signal for every message to change the gui. The messages are sent here and not in the gui, so the queue only
+        gets free again when the messages are really sent to the clients
+        :return: None
+        """
+        self.model.start()
+        self.model.pump(self.show)
+        self.model.stopping()
+        self.model.join()
+
+    def show(self, message):
+        """
+        Sends the signal to the view to add the message to the chat
+        :param message: The message, which was sent to the clients
+        :return: None
+        """
+        if message.get("room") is not None:
+            self.emit(SIGNAL('add_post(QString)'), "[%s] %s: %s" % (message["room"], message["from"], message["text"]))
+        else:
+            self.emit(SIGNAL('add_post(QString)'), "%s: %s" % (message["from"], message["text"]))
+
+    def send(self, message):
+        """
+        Will send the message via the model to all clients
+        :param message: The message which the server received from one client and will be send ot all clients
+        :return: None
+        """
+        self.model.send(message)
+
+    def set_client(self, text):
+        """
+        Send a signal to the view to add the text to the connected clients text field
+        :param text: The client name which will be added to the list in the view
+        :return: None
+        """
+        self.emit(SIGNAL('set_client(QString)'), text)
+
+    def remove_client(self, text):
+        """
+        Will send a signal to the view to remove one of the client names from the gui
+        :param text: The client name which will be removed from the list
+        :return: None
+        """
+        self.emit(SIGNAL('remove_client(QString)'), text)
+
+
+class View(QtGui.QMainWindow, ServerView.Ui_MainWindow):
+    """
+        @author Ertl Marvin
+        @version 2016-12-07
+
+        This class inherits from the QtGui.QMainWindow and from ServerView.Ui_MainWindow,
+        this class will setup the view and connection and will wait for a client to connect to
+
+            :ivar queue:        The queue in which the received messages will be put
+            :ivar update:       Class update, which send the signal to the view
+            :ivar names:        List of the names of the connected clients
+    """
+
+    def __init__(self, workers=0, ssl_context=None, port=4242, peers=(), node=None):
+        """
+        Initial the base class threading.Thread, set up the Ui, create the queues for the classes and connect the method
+        to the signal receiver, the update thread is started by main, after the model is set up
+        :param workers: Number of worker threads for the pool mode, 0 for one thread per client
+        :param ssl_context: The ssl.SSLContext for tls, None for plaintext
+        :param port: The port on which the server listens for clients
+        :param peers: List of host:port of other servers, to which the server links
+        :param node: Name of the server in the cluster, None for the hostname and the port
+        """
+        super(self.__class__, self).__init__()
+        self.setupUi(self)
+        self.queue = Server.IngressQueue(Server.Model.QUEUE_SIZE)
+        self.update = Update(self.queue, workers, ssl_context, port, peers, node)
+        self.connect(self.update, SIGNAL("add_post(QString)"), self.add_post)
+        self.connect(self.update, SIGNAL("set_client(QString)"), self.set_client)
+        self.connect(self.update, SIGNAL("remove_client(QString)"), self.remove_client)
+        self.names = []
+
+    def add_post(self, text):
+        """
+        Adds the received message to the text field in the gui, the message is already sent to the clients by the
+        update thread
+        :param text: The messages which will be added
+        :return: None
+        """
+        self.textBrowser_2.append(str(text))
+
+    def set_client(self, text):
+        """
+        Adds the name of the client to the connect clients field
+        :param text: The name of the client
+        :return: None
+        """
+        self.textBrowser.append(str(text))
+        self.names += [text]
+
+    def remove_client(self, text):
+        """
+        Removes the name of the disconnected client from the name list and also remove it from the gui
+        :param text: The name of the client which should be removed
+        :return: None
+        """
+        name2 = []
+        for name in self.names:
+            if name != text:
+                name2 += [name]
+        self.names = name2
+        text2 = ""
+        for name in self.names:
+            text2 += name + "\n"
+        self.textBrowser.setText(text2)
+        for t in self.update.model.threads:
+            if t.name not in self.names:
+                self.update.model.threads.remove(t)
+
+    def closeEvent(self, event):
+        """
+        Overwritten closeEvent, will be called if the user exit the program, will put a False into the queue to stop all
+        threads and exit the program correctly
+        :param event: The event which will be given when the user exit the program
+        :return: None
+        """
+        self.queue.put(False)
+
+
+def main(args, qt_args):
+    """
+    Setups the app and view and display it
+    :param args: The parsed command line arguments of Server
+    :param qt_args: The command line arguments for qt
+    :return: None
+    """
+    app = QtGui.QApplication(sys.argv[:1] + qt_args)
+    form = View(args.workers, Server.server_context(args.cert, args.key) if args.cert else None, args.port, args.peer,
+                args.node)
+    if form.update.model.cluster is not None:
+        form.update.model.cluster.secret = args.cluster_secret
+    for plugin in Plugins.load(args.filter, args.rewrite, args.filter_drop):
+        form.update.model.plugins.add(plugin)
+    if args.mailbox:
+        import Mailbox
+        form.update.model.mailboxes = Mailbox.Mailboxes(args.mailbox)
+    if args.accounts:
+        import Auth
+        form.update.model.login = Server.Login(form.update.model, Auth.Authenticator(args.accounts,
+                                                                                     not args.no_register))
+    if args.snapshot:
+        import Snapshot
+        form.update.model.snapshotter = Snapshot.Snapshotter(form.update.model, args.snapshot, args.snapshot_interval)
+        form.update.model.snapshotter.restore()
+        form.update.model.snapshotter.start()
+    form.update.start()
+    admin = Server.Admin(form.update.model, args.admin) if args.admin else None
+    if admin is not None:
+        admin.start()
+    form.show()
+    app.exec_()
+    if admin is not None:
+        admin.stopping()
+        admin.join()
+    if form.update.model.snapshotter is not None:
+        form.update.model.snapshotter.stopping()
+        form.update.model.snapshotter.join()
+    if form.update.model.mailboxes is not None:
+        form.update.model.mailboxes.close()
+    if form.update.model.login is not None:
+        form.update.model.login.auth.close()
+    if args.trace:
+        form.update.model.tracer.export(args.trace)
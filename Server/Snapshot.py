@@ -0,0 +1,172 @@
+"""
+    @author Ertl Marvin
+    @version 2016-12-31
+
+    Snapshots of the state of the server, so a restart doesn't forget the rooms with their history, the ids of the last
+    messages and the tokens of the logins. The state is copied while the locks are held, only the copy of the lists and
+    dictionaries, and it is serialized and written by the Snapshotter thread, so the other threads only wait for the
+    copy. The file is a short header and the state as pickles compressed with zlib, the lists and dictionaries are
+    pickled in parts of CHUNK entries, because pickle holds the GIL, so the other threads run between the parts. The
+    file is written to a temporary file first and replaces the old snapshot at once, so there is always a whole
+    snapshot.
+"""
+import io
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+
+MAGIC = b"CHATSNAP"
+VERSION = 1
+HEADER = struct.Struct("!8sB")
+LEVEL = 1
+CHUNK = 200
+
+
+def parts(state):
+    """
+    Pickles the state in parts, first the number of the keys, then for every key the key, the type and the number of
+    the parts of the value and the parts with at most CHUNK entries, or the key, None and the value itself
+    :param state: The state of the server, a dictionary
+    :return: Generator of the pickles
+    """
+    yield pickle.dumps(len(state), pickle.HIGHEST_PROTOCOL)
+    for key, value in state.items():
+        if isinstance(value, (dict, list)):
+            entries = list(value.items()) if isinstance(value, dict) else value
+            chunks = range(0, len(entries), CHUNK)
+            yield pickle.dumps((key, type(value).__name__, len(chunks)), pickle.HIGHEST_PROTOCOL)
+            for begin in chunks:
+                yield pickle.dumps(entries[begin:begin + CHUNK], pickle.HIGHEST_PROTOCOL)
+        else:
+            yield pickle.dumps((key, None, value), pickle.HIGHEST_PROTOCOL)
+
+
+def dump(state, path):
+    """
+    Writes the state to the file
+    :param state: The state of the server, a dictionary
+    :param path: Path of the snapshot
+    :return: Number of the written bytes
+    """
+    compress = zlib.compressobj(LEVEL)
+    with open(path + ".tmp", "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION))
+        for data in parts(state):
+            f.write(compress.compress(data))
+        f.write(compress.flush())
+        size = f.tell()
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+    return size
+
+
+def load(path):
+    """
+    Reads the state from the file
+    :param path: Path of the snapshot
+    :return: The state of the server
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("%s is no snapshot of version %d" % (path, VERSION))
+    stream = io.BytesIO(zlib.decompress(data[HEADER.size:]))
+    state = {}
+    for _ in range(pickle.load(stream)):
+        key, kind, value = pickle.load(stream)
+        if kind is None:
+            state[key] = value
+            continue
+        entries = []
+        for _ in range(value):
+            entries.extend(pickle.load(stream))
+        state[key] = dict(entries) if kind == "dict" else entries
+    return state
+
+
+class Snapshotter(threading.Thread):
+    """
+        @author Ertl Marvin
+        @version 2016-12-31
+
+        This class inherits from threading.Thread, it writes a snapshot of the model every interval seconds and a last
+        one when it is stopped. A snapshot can also be written at once with save.
+
+            :ivar model:    The Model of the server, with the methods snapshot and restore
+            :ivar path:     Path of the snapshot
+            :ivar interval: Seconds between the snapshots
+            :ivar stats:    Dictionary with the size, the pause, in which the state was copied, and the time of the last
+                            snapshot
+            :ivar wake:     Event, which wakes the thread up to stop
+            :ivar lock:     Lock, so only one snapshot is written at the same time
+            :ivar running:  Set if the run method should write snapshots
+    """
+
+    INTERVAL = 60
+
+    def __init__(self, model, path, interval=None):
+        """
+        Initial the base class threading.Thread and set the attributes
+        :param model: The Model of the server
+        :param path: Path of the snapshot
+        :param interval: Seconds between the snapshots, None for INTERVAL
+        """
+        threading.Thread.__init__(self, name="Snapshotter", daemon=True)
+        self.model = model
+        self.path = path
+        self.interval = interval if interval is not None else self.INTERVAL
+        self.stats = {}
+        self.wake = threading.Event()
+        self.lock = threading.Lock()
+        self.running = True
+
+    def restore(self):
+        """
+        Gives the state of the snapshot to the model, if there is a snapshot
+        :return: Seconds, which the restore took, None if there is no snapshot
+        """
+        if not os.path.exists(self.path):
+            return None
+        begin = time.perf_counter()
+        self.model.restore(load(self.path))
+        return time.perf_counter() - begin
+
+    def save(self):
+        """
+        Copies the state of the model and writes it to the file
+        :return: Dictionary with the path, the size in bytes, the pause and the whole time in milliseconds
+        """
+        with self.lock:
+            begin = time.perf_counter()
+            state = self.model.snapshot()
+            copied = time.perf_counter()
+            size = dump(state, self.path)
+            end = time.perf_counter()
+            self.stats = {"path": self.path, "size": size, "pause_ms": round((copied - begin) * 1000, 3),
+                          "total_ms": round((end - begin) * 1000, 3), "time": time.time()}
+            return dict(self.stats)
+
+    def run(self):
+        """
+        Writes a snapshot every interval seconds, till it is stopped, and a last one at the end
+        :return: None
+        """
+        while self.running:
+            self.wake.wait(self.interval)
+            try:
+                self.save()
+            except OSError:
+                pass
+
+    def stopping(self):
+        """
+        Stops the thread, it writes the last snapshot
+        :return: None
+        """
+        self.running = False
+        self.wake.set()
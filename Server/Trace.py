@@ -0,0 +1,198 @@
+"""
+    @author Ertl Marvin
+    @version 2016-12-28
+
+    Latency tracing of single messages. The client traces only a sample of its messages, a traced message carries the
+    key "trace" with a dictionary of stamps, every station adds the time.time() when the message passed it:
+
+        client_send     the client encoded the message
+        server_recv     the server decoded the message
+        fanout          the server started to send the message to the clients
+        socket_write    the server wrote the message to the connection of the receiving client
+        client_recv     the receiving client decoded the message
+        render          the gui of the receiving client displayed the message
+
+    The stamps of different hosts are only comparable, if their clocks are synchronized. The Tracer collects the
+    times between the stations in histograms and can export the traces for chrome://tracing.
+"""
+import collections
+import json
+import random
+import threading
+import time
+
+STAMPS = ("client_send", "server_recv", "fanout", "socket_write", "client_recv", "render")
+MAX_ID = 64
+
+
+def sample(rate):
+    """
+    Decides if a message will be traced
+    :param rate: Part of the messages, which will be traced, 0 for none and 1 for all
+    :return: The trace with the first stamp, or None if the message is not traced
+    """
+    if rate <= 0 or random.random() >= rate:
+        return None
+    return {"id": "%016x" % random.getrandbits(64), "client_send": time.time()}
+
+
+def received(trace):
+    """
+    Takes only the id and the first stamp of a trace, which a client sent, so a client can't put other values into the
+    messages of all clients
+    :param trace: The trace of the received message
+    :return: The new trace, or None if the id is no string of at most MAX_ID characters or client_send is no number
+    """
+    if not isinstance(trace, dict):
+        return None
+    trace_id = trace.get("id")
+    client_send = trace.get("client_send")
+    if not isinstance(trace_id, str) or len(trace_id) > MAX_ID or isinstance(client_send, bool) or \
+            not isinstance(client_send, (int, float)):
+        return None
+    return {"id": trace_id, "client_send": client_send}
+
+
+def stamp(trace, name):
+    """
+    Adds the current time to the trace
+    :param trace: The trace of the message
+    :param name: The name of the station
+    :return: None
+    """
+    trace[name] = time.time()
+
+
+class Histogram(object):
+    """
+        @author Ertl Marvin
+        @version 2016-12-28
+
+        Counts times in buckets, which double in size, so it needs little memory and adding is cheap, the percentiles
+        are only exact to a factor of 2.
+
+            :ivar counts:   List with the number of the times in every bucket, bucket i is below 2 ** i microseconds
+            :ivar count:    Number of all times
+            :ivar total:    Sum of all times in seconds
+    """
+
+    BUCKETS = 40
+
+    def __init__(self):
+        """
+        Creates the empty buckets
+        """
+        self.counts = [0] * self.BUCKETS
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds):
+        """
+        Adds a time, negative times of clocks, which are not synchronized, count as 0
+        :param seconds: The time in seconds
+        :return: None
+        """
+        micros = max(0, int(seconds * 1000000))
+        self.counts[min(micros.bit_length(), self.BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def percentile(self, p):
+        """
+        :param p: The percentile between 0 and 100
+        :return: The upper limit of the bucket of the percentile in seconds
+        """
+        rank = self.count * p / 100.0
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return 2 ** i / 1000000.0
+        return 0.0
+
+
+class Tracer(object):
+    """
+        @author Ertl Marvin
+        @version 2016-12-28
+
+        Collects the finished traces, the time between two stations goes into the histogram of this segment and the
+        time from the first to the last station into the histogram total. The last KEEP traces are kept for the export.
+
+            :ivar rate:         Part of the messages, which will be traced
+            :ivar histograms:   OrderedDictionary with the name of the segment and its Histogram
+            :ivar traces:       Deque with the last traces
+            :ivar lock:         Lock for the histograms and traces
+    """
+
+    KEEP = 10000
+
+    def __init__(self, rate=0.01):
+        """
+        Set the attributes
+        :param rate: Part of the messages, which will be traced
+        """
+        self.rate = rate
+        self.histograms = collections.OrderedDict()
+        self.traces = collections.deque(maxlen=self.KEEP)
+        self.lock = threading.Lock()
+
+    def sample(self):
+        """
+        :return: A new trace for a message, or None if the message is not traced
+        """
+        return sample(self.rate)
+
+    def record(self, trace):
+        """
+        Adds the finished trace to the histograms
+        :param trace: The trace of the message
+        :return: None
+        """
+        stations = [name for name in STAMPS if isinstance(trace.get(name), (int, float))]
+        if len(stations) < 2:
+            return
+        with self.lock:
+            for first, second in zip(stations, stations[1:]):
+                self.histogram(first + " -> " + second).add(trace[second] - trace[first])
+            self.histogram("total").add(trace[stations[-1]] - trace[stations[0]])
+            self.traces.append(trace)
+
+    def histogram(self, name):
+        """
+        :param name: The name of the segment
+        :return: The Histogram of the segment, a new one if it doesn't exist
+        """
+        if name not in self.histograms:
+            self.histograms[name] = Histogram()
+        return self.histograms[name]
+
+    def report(self):
+        """
+        :return: Text with count, average, p50 and p99 in milliseconds of every segment
+        """
+        lines = ["%-30s %8s %9s %9s %9s" % ("segment", "count", "avg ms", "p50 ms", "p99 ms")]
+        with self.lock:
+            for name, h in self.histograms.items():
+                lines.append("%-30s %8d %9.3f %9.3f %9.3f" % (name, h.count, h.total / h.count * 1000,
+                                                              h.percentile(50) * 1000, h.percentile(99) * 1000))
+        return "\n".join(lines)
+
+    def export(self, path):
+        """
+        Writes the kept traces in the trace event format of chrome://tracing, every trace is one row and every segment
+        one span
+        :param path: Path of the file
+        :return: None
+        """
+        events = []
+        with self.lock:
+            traces = list(self.traces)
+        for row, trace in enumerate(traces):
+            stations = [name for name in STAMPS if isinstance(trace.get(name), (int, float))]
+            for first, second in zip(stations, stations[1:]):
+                events.append({"name": first + " -> " + second, "ph": "X", "pid": 1, "tid": row,
+                               "ts": trace[first] * 1000000, "dur": max(0, trace[second] - trace[first]) * 1000000,
+                               "args": {"id": trace.get("id")}})
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events}, f)
@@ -0,0 +1,48 @@
+"""
+    @author Ertl Marvin
+    @version 2017-01-02
+
+    Tests of the BaseClient, which work without a server
+"""
+import unittest
+import ChatClient
+
+
+class EchoTest(unittest.TestCase):
+    """
+        Gives the BaseClient the messages, which the server would send back, and checks how they are matched with the
+        own messages
+    """
+
+    def setUp(self):
+        """
+        Creates the client with the name of the server in the cluster
+        :return: None
+        """
+        self.client = ChatClient.BaseClient("localhost", 0)
+        self.client.name = "Client 1"
+
+    def test_echo_by_id(self):
+        """
+        A msg with the id of an own message is the echo, even if the name has the node of the server
+        :return: None
+        """
+        msg_id, frame = self.client.post("Hallo", "sport")
+        message = self.client.handle({"type": "msg", "room": "sport", "from": "Client 1@a", "text": "Hallo",
+                                      "seq": 1, "id": msg_id})
+        self.assertEqual(message["echo"], msg_id)
+        self.assertFalse(self.client.echoes["sport"])
+
+    def test_same_name_is_no_echo(self):
+        """
+        A msg of an other client with the same name is not matched with the own message
+        :return: None
+        """
+        msg_id, frame = self.client.post("Hallo")
+        message = self.client.handle({"type": "msg", "from": "Client 1", "text": "Servus"})
+        self.assertNotIn("echo", message)
+        self.assertEqual(list(self.client.echoes[None]), [msg_id])
+
+
+if __name__ == "__main__":
+    unittest.main()
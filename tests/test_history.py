@@ -0,0 +1,86 @@
+"""
+    @author Ertl Marvin
+    @version 2017-01-02
+
+    Tests of the History, especially after the client was killed while it wrote a message
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import History
+import Protocol
+
+
+class HistoryTest(unittest.TestCase):
+    """
+        Writes the history into a temporary directory, which is deleted after every test
+    """
+
+    def setUp(self):
+        """
+        Creates the temporary directory and the History with two messages in the lobby
+        :return: None
+        """
+        self.directory = tempfile.mkdtemp()
+        self.history = History.History(self.directory, "localhost", 4242)
+        self.history.append(None, [{"from": "anna", "text": "eins"}, {"from": "bob", "text": "zwei"}])
+        self.history.close()
+
+    def tearDown(self):
+        """
+        Closes the files and deletes the directory
+        :return: None
+        """
+        self.history.close()
+        shutil.rmtree(self.directory)
+
+    def texts(self):
+        """
+        :return: List of the texts in the lobby, read by a new History
+        """
+        return [m["text"] for m in History.History(self.directory, "localhost", 4242).read(None)]
+
+    def test_torn_frame_is_skipped(self):
+        """
+        The messages before a part of a frame at the end of the file are read
+        :return: None
+        """
+        with open(self.history.path(None), "ab") as f:
+            f.write(Protocol.encode({"type": "msg", "from": "anna", "text": "drei"})[:-3])
+        self.assertEqual(self.texts(), ["eins", "zwei"])
+
+    def test_torn_frame_is_cut_before_append(self):
+        """
+        A message, which is appended after a part of a frame, is read again
+        :return: None
+        """
+        with open(self.history.path(None), "ab") as f:
+            f.write(Protocol.encode({"type": "msg", "from": "anna", "text": "drei"})[:-3])
+        self.history.append(None, [{"from": "bob", "text": "vier"}])
+        self.history.close()
+        self.assertEqual(self.texts(), ["eins", "zwei", "vier"])
+
+    def test_broken_frame_is_cut_before_append(self):
+        """
+        A whole frame, which is no valid JSON, is cut like a part of a frame
+        :return: None
+        """
+        with open(self.history.path(None), "ab") as f:
+            f.write(Protocol.HEADER.pack(3, Protocol.JSON) + b"{{{")
+        self.history.append(None, [{"from": "bob", "text": "vier"}])
+        self.history.close()
+        self.assertEqual(self.texts(), ["eins", "zwei", "vier"])
+
+    def test_seq_of_room(self):
+        """
+        The seq of the last message of a room is found in the file
+        :return: None
+        """
+        self.history.append("sport", [{"from": "anna", "text": "eins", "seq": 7}], 7)
+        self.history.close()
+        self.assertEqual(History.History(self.directory, "localhost", 4242).last("sport"), 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
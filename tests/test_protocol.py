@@ -0,0 +1,69 @@
+"""
+    @author Ertl Marvin
+    @version 2017-01-02
+
+    Tests of the frames of the protocol
+"""
+import json
+import unittest
+import Protocol
+
+
+class FrameReaderTest(unittest.TestCase):
+    """
+        Feeds encoded frames to a FrameReader in different parts
+    """
+
+    def setUp(self):
+        """
+        Creates the FrameReader
+        :return: None
+        """
+        self.reader = Protocol.FrameReader()
+
+    def test_many_frames(self):
+        """
+        All frames, which come with one recv, are decoded
+        :return: None
+        """
+        messages = [{"type": "msg", "id": 1, "text": "Hallo"}, {"type": "status", "status": "away"}]
+        self.assertEqual(self.reader.feed(b"".join(Protocol.encode(m) for m in messages)), messages)
+
+    def test_partial_frame(self):
+        """
+        A frame, which comes byte by byte, is only decoded when it is whole
+        :return: None
+        """
+        frame = Protocol.encode({"type": "msg", "id": 1, "text": "Grüße"})
+        for i in range(len(frame) - 1):
+            self.assertEqual(self.reader.feed(frame[i:i + 1]), [])
+        self.assertEqual(self.reader.feed(frame[-1:]), [{"type": "msg", "id": 1, "text": "Grüße"}])
+
+    def test_chunk(self):
+        """
+        A CHUNK frame is decoded with the number of the file and the bytes, even between JSON frames
+        :return: None
+        """
+        data = Protocol.encode({"type": "file", "id": 3}) + Protocol.encode_chunk(3, b"\x00\xff") + \
+            Protocol.encode({"type": "typing", "typing": False})
+        self.assertEqual(self.reader.feed(data), [{"type": "file", "id": 3},
+                                                  {"type": "chunk", "file": 3, "data": b"\x00\xff"},
+                                                  {"type": "typing", "typing": False}])
+
+    def test_errors(self):
+        """
+        Frames, which are too large, of an unknown type, no valid JSON or no dictionary raise a ProtocolError
+        :return: None
+        """
+        payload = json.dumps([1, 2]).encode()
+        for data in (Protocol.HEADER.pack(Protocol.MAX_FRAME + 1, Protocol.JSON),
+                     Protocol.HEADER.pack(2, 9) + b"{}",
+                     Protocol.HEADER.pack(3, Protocol.JSON) + b"{{{",
+                     Protocol.HEADER.pack(len(payload), Protocol.JSON) + payload,
+                     Protocol.HEADER.pack(2, Protocol.CHUNK) + b"\x00\x00"):
+            with self.assertRaises(Protocol.ProtocolError):
+                Protocol.FrameReader().feed(data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+"""
+    @author Ertl Marvin
+    @version 2017-01-02
+
+    Tests of the parts of the server, which work without a running server
+"""
+import socket
+import unittest
+import Protocol
+import Server
+
+
+class Update(object):
+    """
+        Update of the Recv, it only remembers the removed clients
+    """
+
+    def __init__(self):
+        """
+        Creates the empty list of the removed clients
+        """
+        self.removed = []
+
+    def remove_client(self, name):
+        """
+        :param name: The name of the removed client
+        :return: None
+        """
+        self.removed.append(name)
+
+
+class RecvTest(unittest.TestCase):
+    """
+        Sends messages to a Recv, which reads from one end of a socket pair, and reads its answers from the other end
+    """
+
+    def setUp(self):
+        """
+        Creates the Recv with a rate limiter, which allows two messages and drops the others
+        :return: None
+        """
+        self.server, self.client = socket.socketpair()
+        self.client.settimeout(1)
+        self.queue = Server.IngressQueue()
+        self.limiter = Server.RateLimiter(msg_rate=0.001, msg_burst=2, action=Server.RateLimiter.DROP)
+        self.recv = Server.Recv(self.server, self.queue, "Client 1", Update(), self.limiter)
+
+    def tearDown(self):
+        """
+        Closes the socket pair
+        :return: None
+        """
+        self.server.close()
+        self.client.close()
+
+    def answers(self, count):
+        """
+        :param count: Number of the expected frames
+        :return: List of the frames, which the Recv sent to the client
+        """
+        reader = Protocol.FrameReader()
+        messages = []
+        while len(messages) < count:
+            messages += reader.feed(self.client.recv(4096))
+        return messages
+
+    def test_dropped_message_gets_ack(self):
+        """
+        A message over the limit is dropped, but the client gets an ack with dropped, so it forgets the message
+        :return: None
+        """
+        for msg_id in range(1, 5):
+            self.recv.process({"type": "msg", "id": msg_id, "text": "hallo"})
+        acks = self.answers(4)
+        self.assertEqual([a["id"] for a in acks], [1, 2, 3, 4])
+        self.assertEqual([a.get("dropped", False) for a in acks], [False, False, True, True])
+        self.assertEqual([a["echo"] for a in acks], [True, True, False, False])
+        self.assertEqual(len(self.queue.get_batch()), 2)
+        self.assertEqual(self.limiter.stats[Server.RateLimiter.DROP], 2)
+
+    def test_dropped_message_without_id(self):
+        """
+        A message without id is dropped without an answer
+        :return: None
+        """
+        for _ in range(3):
+            self.recv.process({"type": "msg", "text": "hallo"})
+        self.assertEqual(len(self.queue.get_batch()), 2)
+        self.client.setblocking(False)
+        self.assertRaises(BlockingIOError, self.client.recv, 4096)
+
+
+class DedupCacheTest(unittest.TestCase):
+    """
+        Checks which ids the DedupCache remembers
+    """
+
+    def test_seen(self):
+        """
+        An id is only new the first time
+        :return: None
+        """
+        cache = Server.DedupCache()
+        self.assertFalse(cache.seen(("a", 1)))
+        self.assertTrue(cache.seen(("a", 1)))
+        self.assertFalse(cache.seen(("b", 1)))
+
+    def test_size(self):
+        """
+        The oldest id is forgotten, if there are more than size ids
+        :return: None
+        """
+        cache = Server.DedupCache(size=2)
+        for key in ("a", "b", "c"):
+            cache.seen(key)
+        self.assertEqual(len(cache), 2)
+        self.assertFalse(cache.seen("a"))
+
+    def test_window(self):
+        """
+        An id older than the window is new again
+        :return: None
+        """
+        cache = Server.DedupCache(window=60)
+        cache.seen("a")
+        cache.entries["a"] -= 61
+        self.assertFalse(cache.seen("a"))
+
+    def test_snapshot(self):
+        """
+        The ids of a snapshot are seen by a new cache
+        :return: None
+        """
+        cache = Server.DedupCache()
+        cache.seen("a")
+        other = Server.DedupCache()
+        other.restore(cache.snapshot(), 0)
+        self.assertTrue(other.seen("a"))
+
+    def test_resent_message(self):
+        """
+        A message, which the client sends again after a reconnect, is only put into the queue once, but gets an ack
+        both times
+        :return: None
+        """
+        server, client = socket.socketpair()
+        self.addCleanup(server.close)
+        self.addCleanup(client.close)
+        client.settimeout(1)
+        queue = Server.IngressQueue()
+        dedup = Server.DedupCache()
+        for _ in range(2):
+            recv = Server.Recv(server, queue, "Client 1", Update(), dedup=dedup)
+            recv.process({"type": "hello", "client": "abc"})
+            recv.process({"type": "msg", "id": 1, "text": "hallo"})
+        reader = Protocol.FrameReader()
+        acks = []
+        while len(acks) < 2:
+            acks += reader.feed(client.recv(4096))
+        self.assertEqual([a["echo"] for a in acks], [True, False])
+        self.assertEqual(len(queue.get_batch()), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
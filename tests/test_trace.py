@@ -0,0 +1,42 @@
+"""
+    @author Ertl Marvin
+    @version 2017-01-02
+
+    Tests of the traces, which the server takes from the clients
+"""
+import unittest
+import Trace
+
+
+class ReceivedTest(unittest.TestCase):
+    """
+        Gives Trace.received the traces, which a client could send
+    """
+
+    def test_valid_trace(self):
+        """
+        Only the id and client_send are taken
+        :return: None
+        """
+        self.assertEqual(Trace.received({"id": "00ff", "client_send": 1.5, "render": "x" * 1000}),
+                         {"id": "00ff", "client_send": 1.5})
+
+    def test_wrong_types(self):
+        """
+        A trace with values of the wrong type is dropped
+        :return: None
+        """
+        for trace in ({"id": 7, "client_send": 1.5}, {"id": "00ff", "client_send": "1.5"},
+                      {"id": "00ff", "client_send": True}, {"id": "00ff", "client_send": [1] * 1000}, "trace", None):
+            self.assertIsNone(Trace.received(trace))
+
+    def test_long_id(self):
+        """
+        An id longer than MAX_ID is dropped
+        :return: None
+        """
+        self.assertIsNone(Trace.received({"id": "x" * (Trace.MAX_ID + 1), "client_send": 1.5}))
+
+
+if __name__ == "__main__":
+    unittest.main()